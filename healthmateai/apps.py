@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class HealthmateAIConfig(AppConfig):
+    name = 'healthmateai'
+
+    def ready(self):
+        from healthmateai.util.db import configure_connection
+
+        connection_created.connect(configure_connection)
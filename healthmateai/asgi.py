@@ -11,6 +11,12 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from healthmateai.util.asgi import CancelOnDisconnectMiddleware
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthmateai.settings')
 
-application = get_asgi_application()
+application = CancelOnDisconnectMiddleware(get_asgi_application())
+
+from text_summarizer.jobs import start_job_sweeper  # noqa: E402
+
+start_job_sweeper()
@@ -10,10 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
+import tempfile
 from logging import getLogger
 from pathlib import Path
 
-import openai as openai
 from dotenv import load_dotenv
 
 logger = getLogger('django')
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'drf_yasg',
     # Custom app
+    'healthmateai',
     'text_summarizer',
     'patient'
 ]
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'healthmateai.util.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,12 +89,56 @@ WSGI_APPLICATION = 'healthmateai.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# `DB_ENGINE=postgres` for deployments with several workers, SQLite is meant
+# for development and single node setups.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'healthmateai'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Seconds a connection is kept open between requests, health
+            # checked before reuse. The ASGI deployment (Dockerfile,
+            # render.yaml) sets DB_CONN_MAX_AGE=0: every request runs in a
+            # thread of its own there, so connections can't be reused and
+            # a pooler such as PgBouncer should be used instead.
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+                # Milliseconds, 0 disables the timeout.
+                'options': '-c statement_timeout={}'.format(
+                    int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+                ),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'healthmateai.util.sqlite',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
     }
+
+# Applied to every new SQLite connection, see `healthmateai.util.db`. WAL lets
+# readers run next to a writer and writers wait `busy_timeout` milliseconds
+# for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+    # Negative values are KiB, ie. 64MB of page cache per connection.
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'memory',
 }
+# `BEGIN` mode of the transactions, see `healthmateai.util.sqlite`.
+SQLITE_TRANSACTION_MODE = os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE')
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -134,7 +180,178 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'var/www/static')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# The OpenAI client shares one keep-alive connection pool between all threads,
+# see `text_summarizer.backends.openai.configure_openai`.
+OPENAI_TRANSPORT = {
+    'POOL_MAXSIZE': int(os.getenv('OPENAI_POOL_MAXSIZE', 16)),
+    # Wait for a free pooled connection instead of opening a throwaway one.
+    'POOL_BLOCK': os.getenv('OPENAI_POOL_BLOCK', 'False') == 'True',
+    'CONNECT_TIMEOUT': float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5)),
+    'READ_TIMEOUT': float(os.getenv('OPENAI_READ_TIMEOUT', 60)),
+}
+# Requests and tokens per minute quota shared by every worker process of the
+# host through `STATE_FILE`. Calls over the quota wait, interactive summaries
+# ahead of batch work.
+OPENAI_RATE_LIMIT = {
+    'ENABLED': os.getenv('OPENAI_RATE_LIMIT_ENABLED', 'True') == 'True',
+    'REQUESTS_PER_MINUTE': int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 3500)),
+    'TOKENS_PER_MINUTE': int(os.getenv('OPENAI_TOKENS_PER_MINUTE', 90000)),
+    'STATE_FILE': os.getenv(
+        'OPENAI_RATE_LIMIT_FILE',
+        os.path.join(tempfile.gettempdir(), 'healthmateai-openai-quota.json')
+    ),
+}
+
+# Summarizer Settings
+# --------------------
+# When `SUMMARIZE_ASYNC` is on, POST /summarize/summarizes/ stores a pending
+# job and returns 202. Jobs are run by an in-process thread pool ('thread') or
+# left in the database for `python manage.py run_summarize_jobs` ('queue').
+SUMMARIZE_ASYNC = os.getenv('SUMMARIZE_ASYNC', 'True') == 'True'
+SUMMARIZE_JOB_RUNNER = os.getenv('SUMMARIZE_JOB_RUNNER', 'thread')
+SUMMARIZE_JOB_WORKERS = int(os.getenv('SUMMARIZE_JOB_WORKERS', 4))
+# Running jobs older than this many seconds are requeued by the job runner.
+SUMMARIZE_JOB_STALE_AFTER = int(os.getenv('SUMMARIZE_JOB_STALE_AFTER', 600))
+# With the 'thread' runner, the server requeues the stale jobs and runs the
+# pending ones left by a previous process every this many seconds, 0 disables.
+SUMMARIZE_JOB_SWEEP_INTERVAL = float(
+    os.getenv('SUMMARIZE_JOB_SWEEP_INTERVAL', 60)
+)
+
+# POST /summarize/summarizes/batch/ accepts up to `SUMMARIZE_BATCH_MAX_SIZE`
+# items and runs at most `SUMMARIZE_BATCH_CONCURRENCY` upstream calls at once.
+SUMMARIZE_BATCH_MAX_SIZE = int(os.getenv('SUMMARIZE_BATCH_MAX_SIZE', 500))
+SUMMARIZE_BATCH_CONCURRENCY = int(os.getenv('SUMMARIZE_BATCH_CONCURRENCY', 8))
+
+# Rows fetched per database round trip by the summary exports.
+SUMMARIZE_EXPORT_CHUNK_SIZE = int(
+    os.getenv('SUMMARIZE_EXPORT_CHUNK_SIZE', 2000)
+)
+
+# Dotted path of the summarizer backend and of the backend used while it is
+# unavailable, eg.
+# 'text_summarizer.backends.local.ExtractiveSummarizerBackend'.
+SUMMARIZER_BACKEND = os.getenv(
+    'SUMMARIZER_BACKEND',
+    'text_summarizer.backends.openai.OpenAISummarizerBackend'
+)
+SUMMARIZER_FALLBACK_BACKEND = os.getenv('SUMMARIZER_FALLBACK_BACKEND')
+
+# Conversations estimated above `THRESHOLD_TOKENS` are split on turn
+# boundaries into chunks of `CHUNK_TOKENS`, summarized `CONCURRENCY` chunks at
+# a time, and the partial summaries are merged with a final call.
+SUMMARIZER_LONG_CONVERSATION = {
+    'THRESHOLD_TOKENS': int(
+        os.getenv('SUMMARIZER_LONG_THRESHOLD_TOKENS', 3000)
+    ),
+    'CHUNK_TOKENS': int(os.getenv('SUMMARIZER_CHUNK_TOKENS', 2000)),
+    'CONCURRENCY': int(os.getenv('SUMMARIZER_CHUNK_CONCURRENCY', 4)),
+}
+
+# Summaries are cached by conversation + prompt + model parameters in a per
+# process LRU and the `SummaryCacheEntry` table. Send `Cache-Control: no-cache`
+# to skip the lookup for a single request.
+SUMMARY_CACHE = {
+    'ENABLED': os.getenv('SUMMARY_CACHE_ENABLED', 'True') == 'True',
+    # Seconds an entry is kept in both tiers.
+    'TIMEOUT': int(os.getenv('SUMMARY_CACHE_TIMEOUT', 7 * 24 * 60 * 60)),
+    'MEMORY_MAX_ENTRIES': int(os.getenv('SUMMARY_CACHE_MEMORY_ENTRIES', 1024)),
+    'DB_MAX_ENTRIES': int(os.getenv('SUMMARY_CACHE_DB_ENTRIES', 100000)),
+    # Expired and excess database rows are culled every N writes.
+    'CULL_INTERVAL': 100,
+}
+
+# Concurrent requests for the same summary share one upstream call. With a
+# `LOCK_DIR` the gunicorn workers of the host also wait for each other through
+# file locks; set SUMMARIZE_LOCK_DIR to an empty string to only coalesce
+# within a process.
+SUMMARIZE_SINGLE_FLIGHT = {
+    'LOCK_DIR': os.getenv(
+        'SUMMARIZE_LOCK_DIR',
+        os.path.join(tempfile.gettempdir(), 'healthmateai-locks')
+    ) or None,
+    'LOCK_TIMEOUT': float(os.getenv('SUMMARIZE_LOCK_TIMEOUT', 60)),
+}
+
+# OpenAI backend: upstream calls are retried with exponential backoff and full
+# jitter, only on retryable errors and within `DEADLINE` seconds per summary.
+SUMMARIZER_RETRY = {
+    'MAX_ATTEMPTS': int(os.getenv('SUMMARIZER_RETRY_MAX_ATTEMPTS', 4)),
+    'BASE_DELAY': float(os.getenv('SUMMARIZER_RETRY_BASE_DELAY', 0.5)),
+    'MAX_DELAY': float(os.getenv('SUMMARIZER_RETRY_MAX_DELAY', 8)),
+    'DEADLINE': float(os.getenv('SUMMARIZER_RETRY_DEADLINE', 30)),
+}
+# After `FAILURE_THRESHOLD` consecutive upstream failures requests fail fast
+# with a 503 for `RESET_TIMEOUT` seconds.
+SUMMARIZER_CIRCUIT_BREAKER = {
+    'FAILURE_THRESHOLD': int(os.getenv('SUMMARIZER_BREAKER_THRESHOLD', 5)),
+    'RESET_TIMEOUT': float(os.getenv('SUMMARIZER_BREAKER_RESET_TIMEOUT', 30)),
+}
+
+# Compressed Fields Settings
+# --------------------
+# `CompressedJSONField` values of at least `MIN_SIZE` bytes are stored zlib
+# compressed at `LEVEL`. Disabling only affects new writes, compressed
+# rows stay readable.
+COMPRESSED_FIELDS = {
+    'ENABLED': os.getenv('COMPRESSED_FIELDS_ENABLED', 'True') == 'True',
+    'LEVEL': int(os.getenv('COMPRESSED_FIELDS_LEVEL', 6)),
+    'MIN_SIZE': int(os.getenv('COMPRESSED_FIELDS_MIN_SIZE', 256)),
+}
+
+# REST Framework Settings
+# --------------------
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'healthmateai.util.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'healthmateai.util.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Responses of at least `MIN_SIZE` bytes are compressed with brotli (when the
+# `Brotli` package is installed) or gzip, as accepted by the client.
+RESPONSE_COMPRESSION = {
+    'ENABLED': os.getenv('RESPONSE_COMPRESSION_ENABLED', 'True') == 'True',
+    'MIN_SIZE': int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024)),
+    'GZIP_LEVEL': int(os.getenv('RESPONSE_COMPRESSION_GZIP_LEVEL', 6)),
+    'BROTLI_QUALITY': int(os.getenv('RESPONSE_COMPRESSION_BROTLI_QUALITY', 4)),
+}
+
+# Pagination Settings
+# --------------------
+# `?pagination=estimated` serves list counts from a per process cache. A count
+# older than `COUNT_TIMEOUT` seconds is still served while it is refreshed in
+# the background.
+PAGINATION_COUNT_CACHE = {
+    'COUNT_TIMEOUT': int(os.getenv('PAGINATION_COUNT_TIMEOUT', 60)),
+    'MAX_ENTRIES': int(os.getenv('PAGINATION_COUNT_MAX_ENTRIES', 256)),
+}
+
+# Cache Settings
+# --------------------
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Rendered list pages are cached in the `ALIAS` cache for `TIMEOUT` seconds,
+# until an object of a listed model is saved or deleted. With more than one
+# worker process the cache must be shared, eg. Redis or Memcached.
+RESPONSE_CACHE = {
+    'ENABLED': os.getenv('RESPONSE_CACHE_ENABLED', 'False') == 'True',
+    'ALIAS': os.getenv('RESPONSE_CACHE_ALIAS', 'default'),
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300)),
+}
 
 # Swagger Settings
 # --------------------
@@ -0,0 +1,873 @@
+import asyncio
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.db import (
+    close_old_connections, connection, connections, transaction
+)
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+
+from healthmateai.util.asgi import CancelOnDisconnectMiddleware
+from healthmateai.util import ratelimit
+from healthmateai.util.compression import brotli, negotiate_encoding
+from healthmateai.util.ratelimit import (
+    PriorityRateLimiter, RateLimitTimeout, SharedTokenBucket
+)
+from healthmateai.util.renderers import ORJSONRenderer, RawJSON
+from healthmateai.util.retry import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy
+)
+from healthmateai.util.singleflight import SingleFlight
+from healthmateai.util.transport import PooledTransport
+from patient.models import Patient
+
+WRITERS = 8
+WRITES = 25
+
+
+class SQLiteConnectionTestCase(TestCase):
+    """
+    Runs against a file database of its own, the in-memory test database
+    doesn't support WAL.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(connections.settings, {
+            'concurrency': {
+                **connection.settings_dict,
+                'ENGINE': 'healthmateai.util.sqlite',
+                'NAME': os.path.join(directory.name, 'db.sqlite3'),
+                'OPTIONS': {},
+                'TEST': {},
+            }
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.close_connection)
+
+        with connections['concurrency'].cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE note (id INTEGER PRIMARY KEY, writer INTEGER)'
+            )
+
+    def close_connection(self):
+        connections['concurrency'].close()
+        del connections['concurrency']
+
+    def test_pragmas(self):
+        with connections['concurrency'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            # NORMAL, the default is FULL.
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['cache_size']
+            )
+
+    def test_concurrent_writes(self):
+        # A read then a write in one transaction, as `get_or_create()` or
+        # the summary views do. With deferred transactions most writers
+        # fail with "database is locked".
+        def write(writer):
+            try:
+                for _ in range(WRITES):
+                    with transaction.atomic(using='concurrency'):
+                        with connections['concurrency'].cursor() as cursor:
+                            cursor.execute('SELECT COUNT(*) FROM note')
+                            cursor.execute(
+                                'INSERT INTO note (writer) VALUES (%s)',
+                                [writer]
+                            )
+            finally:
+                self.close_connection()
+
+        with ThreadPoolExecutor(max_workers=WRITERS) as executor:
+            list(executor.map(write, range(WRITERS)))
+
+        with connections['concurrency'].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM note')
+            self.assertEqual(cursor.fetchone()[0], WRITERS * WRITES)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs DB_ENGINE=postgres.')
+class PostgresConnectionTestCase(TransactionTestCase):
+    def test_statement_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertNotEqual(cursor.fetchone()[0], '0')
+
+    def test_concurrent_writes(self):
+        def write(writer):
+            close_old_connections()
+            try:
+                for index in range(WRITES):
+                    Patient.objects.create(name=f'Patient {writer}-{index}')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=WRITERS) as executor:
+            list(executor.map(write, range(WRITERS)))
+
+        self.assertEqual(Patient.objects.count(), WRITERS * WRITES)
+
+
+class ORJSONRendererTestCase(TestCase):
+    def test_matches_json_renderer(self):
+        data = {
+            'created_at': timezone.make_aware(datetime(2023, 5, 1, 12, 30)),
+            'amount': Decimal('1.50'),
+            'label': gettext_lazy('Summary'),
+            'errors': {0: ['Invalid patient.']},
+            'items': [1, 'two', None, True]
+        }
+
+        self.assertEqual(
+            json.loads(ORJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data))
+        )
+
+    def test_raw_json(self):
+        content = ORJSONRenderer().render({
+            'results': [
+                {'id': 1, 'conversation': RawJSON('[{"doctor":"Hi"}]')},
+                {'id': 2, 'conversation': RawJSON('{"@raw":"x"}')}
+            ]
+        })
+
+        self.assertEqual(json.loads(content), {
+            'results': [
+                {'id': 1, 'conversation': [{'doctor': 'Hi'}]},
+                {'id': 2, 'conversation': {'@raw': 'x'}}
+            ]
+        })
+
+    def test_indent(self):
+        content = ORJSONRenderer().render(
+            {'id': 1}, 'application/json; indent=4'
+        )
+
+        self.assertEqual(content, b'{\n  "id": 1\n}')
+
+    def test_stored_json_is_not_decoded(self):
+        from text_summarizer.models import SummarizeRequest
+
+        conversation = [{'doctor': 'How are you feeling today?'}] * 50
+        SummarizeRequest.objects.create(conversation=conversation)
+
+        with mock.patch(
+                'healthmateai.util.fields.decompress_json',
+                side_effect=AssertionError('Decoded the stored json.')
+        ):
+            response = self.client.get(
+                reverse('text_summarizer:list_create_summarize_view')
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['data']['results'][0]['conversation'],
+            conversation
+        )
+
+    def test_invalid_json_body(self):
+        response = self.client.post(
+            reverse('patient:list_create_patient_view'), '{"name": ',
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RESPONSE_COMPRESSION={
+    **settings.RESPONSE_COMPRESSION, 'ENABLED': True, 'MIN_SIZE': 200
+})
+class CompressionMiddlewareTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.bulk_create(
+            Patient(name=f'Patient {index}') for index in range(15)
+        )
+
+    def setUp(self):
+        self.url = reverse('patient:list_create_patient_view')
+
+    def test_negotiate_encoding(self):
+        encodings = {'br': 'br', 'gzip': 'gzip'}
+
+        self.assertEqual(negotiate_encoding('gzip, br', encodings), 'br')
+        self.assertEqual(
+            negotiate_encoding('br;q=0.5, gzip', encodings), 'gzip'
+        )
+        self.assertEqual(negotiate_encoding('br;q=0, *', encodings), 'gzip')
+        self.assertIsNone(negotiate_encoding('identity', encodings))
+        self.assertIsNone(negotiate_encoding('', encodings))
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], f'W/{plain["ETag"]}')
+
+        response = self.client.get(
+            self.url, HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    @skipUnless(brotli, 'Needs the Brotli package.')
+    def test_brotli(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+    def test_small_response(self):
+        response = self.client.get(
+            reverse(
+                'patient:retrieve_patient_view',
+                kwargs={'patient_id': Patient.objects.first().id}
+            ),
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    async def test_streaming(self):
+        response = await self.async_client.get(
+            reverse('text_summarizer:export_summarize_view'),
+            {'export_format': 'csv'}, headers={'Accept-Encoding': 'gzip'}
+        )
+        content = b''.join(
+            [chunk async for chunk in response.streaming_content]
+        )
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(gzip.decompress(content).startswith(b'id,'))
+
+
+class CancelOnDisconnectMiddlewareTestCase(SimpleTestCase):
+    async def call(self, app):
+        """
+        Call the wrapped `app` with a client that disconnects right after
+        sending the request, return the sent messages.
+        """
+        messages = [{'type': 'http.request', 'body': b''}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await asyncio.wait_for(
+            CancelOnDisconnectMiddleware(app)({'type': 'http'}, receive, send),
+            5
+        )
+
+        return sent
+
+    async def test_cancels_started_response(self):
+        cancelled = []
+
+        async def app(scope, receive, send):
+            await receive()
+            await send({'type': 'http.response.start', 'status': 200})
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        sent = await self.call(app)
+
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(len(sent), 1)
+
+    async def test_waits_for_response(self):
+        async def app(scope, receive, send):
+            await receive()
+            # The disconnect is noticed while the view is still running.
+            await asyncio.sleep(0.05)
+            await send({'type': 'http.response.start', 'status': 200})
+            await send({'type': 'http.response.body', 'body': b'done'})
+
+        sent = await self.call(app)
+
+        self.assertEqual(sent[-1]['body'], b'done')
+
+
+class FakeClock:
+    """
+    `clock` and `sleep` of a retry policy or a circuit breaker, sleeping
+    moves the clock forward.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class ClientError(Exception):
+    pass
+
+
+class LocalError(Exception):
+    pass
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            'test', failure_threshold=2, reset_timeout=10, clock=self.clock
+        )
+
+    def test_transitions(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now += 4
+        with self.assertRaises(CircuitOpenError) as context:
+            self.breaker.before_call()
+        self.assertEqual(context.exception.retry_after, 6)
+
+        self.clock.now += 6
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # A single probe is let through.
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        # Its failure opens the circuit again, without waiting for the
+        # threshold.
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now += 10
+        self.breaker.before_call()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.stats()['times_opened'], 2)
+        self.assertEqual(self.breaker.stats()['rejected_calls'], 2)
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+@mock.patch('healthmateai.util.retry.random.uniform', lambda low, high: high)
+class RetryPolicyTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            'test', failure_threshold=3, reset_timeout=10, clock=self.clock
+        )
+
+    def get_policy(self, **kwargs):
+        return RetryPolicy(**{
+            'max_attempts': 4,
+            'base_delay': 1,
+            'max_delay': 3,
+            'deadline': 30,
+            'is_retryable': lambda error: isinstance(error, UpstreamError),
+            'reached_service': lambda error: not isinstance(
+                error, LocalError
+            ),
+            'breaker': self.breaker,
+            'clock': self.clock,
+            'sleep': self.clock.sleep,
+            **kwargs
+        })
+
+    def get_func(self, *errors, result='ok'):
+        """
+        Return a function raising `errors` one per call, then returning
+        `result`. Its `timeouts` are the timeouts it was called with.
+        """
+        errors = list(errors)
+
+        def func(timeout):
+            func.timeouts.append(timeout)
+            if errors:
+                raise errors.pop(0)
+            return result
+
+        func.timeouts = []
+
+        return func
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_backoff(self):
+        func = self.get_func(UpstreamError(), UpstreamError(), UpstreamError())
+
+        self.assertEqual(self.get_policy(breaker=None).call(func), 'ok')
+        # base_delay * 2 ** attempt, capped by max_delay.
+        self.assertEqual(self.clock.sleeps, [1, 2, 3])
+        self.assertEqual(func.timeouts, [30, 29, 27, 24])
+
+    def test_full_jitter(self):
+        policy = self.get_policy()
+        with mock.patch(
+                'healthmateai.util.retry.random.uniform', return_value=0.25
+        ) as uniform:
+            self.assertEqual(policy.get_delay(5), 0.25)
+        uniform.assert_called_once_with(0, 3)
+
+    def test_attempts(self):
+        policy = self.get_policy(breaker=None)
+        func = self.get_func(*(UpstreamError() for _ in range(4)))
+
+        with self.assertRaises(UpstreamError):
+            policy.call(func)
+        self.assertEqual(len(func.timeouts), 4)
+        self.assertEqual(policy.stats()['retries'], 3)
+        self.assertEqual(policy.stats()['failures'], 1)
+
+    def test_not_retryable(self):
+        func = self.get_func(ClientError())
+
+        with self.assertRaises(ClientError):
+            self.get_policy().call(func)
+        self.assertEqual(len(func.timeouts), 1)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_deadline(self):
+        policy = self.get_policy(deadline=5, max_delay=8, breaker=None)
+        func = self.get_func(*(UpstreamError() for _ in range(4)))
+
+        with self.assertRaises(UpstreamError):
+            policy.call(func)
+        # The third retry would wait 4s, past the deadline.
+        self.assertEqual(self.clock.sleeps, [1, 2])
+        self.assertEqual(policy.stats()['deadline_exceeded'], 1)
+
+    def test_opens_breaker(self):
+        policy = self.get_policy(max_attempts=3)
+
+        with self.assertRaises(UpstreamError):
+            policy.call(self.get_func(*(UpstreamError() for _ in range(3))))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        func = self.get_func()
+        with self.assertRaises(CircuitOpenError):
+            policy.call(func)
+        self.assertEqual(func.timeouts, [])
+
+    def test_client_error_closes_half_open_breaker(self):
+        self.open_breaker()
+        with self.assertRaises(ClientError):
+            self.get_policy().call(self.get_func(ClientError()))
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_local_error_leaves_breaker(self):
+        self.open_breaker()
+        with self.assertRaises(LocalError):
+            self.get_policy().call(self.get_func(LocalError()))
+
+        # The probe is released without closing the circuit.
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(self.get_policy().call(self.get_func()), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledTransportTestCase(SimpleTestCase):
+    def setUp(self):
+        self.transport = PooledTransport(
+            pool_maxsize=4, connect_timeout=5, read_timeout=60
+        )
+        self.addCleanup(self.transport.close)
+
+    def test_timeout(self):
+        self.assertEqual(self.transport.get_timeout(), (5, 60))
+        self.assertEqual(self.transport.get_timeout(10), (5, 10))
+        self.assertEqual(self.transport.get_timeout(2), (2, 2))
+        # An expired deadline still gives the request a chance to fail fast.
+        self.assertEqual(self.transport.get_timeout(-1), (0.001, 0.001))
+
+    def test_connections_reused(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/'
+
+        for _ in range(3):
+            self.transport.session.get(url, timeout=5)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(
+                lambda _: self.transport.session.get(url, timeout=5),
+                range(8)
+            ))
+
+        stats = self.transport.stats()
+        self.assertEqual(stats['requests'], 11)
+        # Requests of every thread share the pool, new connections are only
+        # opened while all pooled ones are busy.
+        self.assertLessEqual(stats['connections_opened'], 4)
+        self.assertEqual(
+            stats['reused_requests'], 11 - stats['connections_opened']
+        )
+        self.assertEqual(
+            stats['pools'][0]['idle_connections'],
+            stats['connections_opened']
+        )
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def setUp(self):
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        self.flight = SingleFlight(lock_dir=lock_dir.name, lock_timeout=5)
+        self.release = threading.Event()
+        self.calls = []
+
+    def func(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def run_concurrently(self, value, count=6):
+        """
+        Call `do()` from `count` threads, releasing `func` once every call
+        is waiting. Returns the results and the raised errors.
+        """
+        def call(_):
+            try:
+                return self.flight.do('key', self.func, value)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            results = executor.map(call, range(count))
+            while self.flight.stats()['calls'] < count:
+                time.sleep(0.01)
+            self.release.set()
+            return list(results)
+
+    def assertUnlocked(self):
+        lock = self.flight._get_file_lock('key')
+        lock.timeout = 0
+        self.assertTrue(lock.acquire())
+        lock.release()
+
+    def test_concurrent_calls(self):
+        self.assertEqual(self.run_concurrently('summary'), ['summary'] * 6)
+
+        self.assertEqual(self.calls, ['summary'])
+        self.assertEqual(self.flight.stats()['coalesced'], 5)
+        self.assertEqual(self.flight.stats()['in_flight'], 0)
+        self.assertUnlocked()
+
+    def test_leader_error(self):
+        error = ValueError('Upstream error.')
+
+        self.assertEqual(self.run_concurrently(error), [error] * 6)
+
+        self.assertEqual(self.calls, [error])
+        self.assertUnlocked()
+
+    def test_cross_process_recheck(self):
+        # Another process holds the lock of the key, then stores the result.
+        other = self.flight._get_file_lock('key')
+        self.assertTrue(other.acquire())
+        shared = {}
+        self.release.set()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(
+                self.flight.do, 'key', self.func, 'summary',
+                recheck=lambda: shared.get('key')
+            )
+            time.sleep(0.1)
+            self.assertFalse(result.done())
+            shared['key'] = 'other summary'
+            other.release()
+
+            self.assertEqual(result.result(5), 'other summary')
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.flight.stats()['coalesced_cross_process'], 1)
+        self.assertUnlocked()
+
+    async def afunc(self, value):
+        self.calls.append(value)
+        await self.arelease.wait()
+        return value
+
+    def start_async(self, value, **kwargs):
+        return asyncio.ensure_future(
+            self.flight.ado('key', self.afunc, value, **kwargs)
+        )
+
+    async def test_async_concurrent_calls(self):
+        self.arelease = asyncio.Event()
+        tasks = [self.start_async('summary') for _ in range(4)]
+        await asyncio.sleep(0.01)
+        self.arelease.set()
+
+        self.assertEqual(await asyncio.gather(*tasks), ['summary'] * 4)
+        self.assertEqual(self.calls, ['summary'])
+        self.assertUnlocked()
+
+    async def test_async_cancelled_leader(self):
+        self.arelease = asyncio.Event()
+        leader = self.start_async('summary')
+        await asyncio.sleep(0.01)
+        waiters = [self.start_async('summary') for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        self.arelease.set()
+
+        # One waiter took over, the other one waited for it.
+        self.assertEqual(await asyncio.gather(*waiters), ['summary'] * 2)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(self.calls, ['summary'] * 2)
+        self.assertUnlocked()
+
+    async def test_async_cross_process_recheck(self):
+        self.arelease = asyncio.Event()
+        self.arelease.set()
+        other = self.flight._get_file_lock('key')
+        self.assertTrue(other.acquire())
+        shared = {}
+
+        async def recheck():
+            return shared.get('key')
+
+        task = self.start_async('summary', recheck=recheck)
+        await asyncio.sleep(0.1)
+        self.assertFalse(task.done())
+        shared['key'] = 'other summary'
+        other.release()
+
+        self.assertEqual(await asyncio.wait_for(task, 5), 'other summary')
+        self.assertEqual(self.calls, [])
+        self.assertUnlocked()
+
+
+class SharedTokenBucketTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(
+            ratelimit, 'time', mock.Mock(time=self.clock)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst(self):
+        bucket = SharedTokenBucket({'requests': 3})
+
+        self.assertEqual(
+            [bucket.try_acquire({'requests': 1}) for _ in range(4)],
+            [0, 0, 0, 20.0]
+        )
+
+    def test_refill(self):
+        bucket = SharedTokenBucket({'requests': 3})
+        bucket.try_acquire({'requests': 3})
+
+        self.clock.now += 10
+        self.assertAlmostEqual(bucket.try_acquire({'requests': 1}), 10.0)
+        self.clock.now += 10
+        self.assertEqual(bucket.try_acquire({'requests': 1}), 0)
+        # The bucket never holds more than its capacity.
+        self.clock.now += 3600
+        self.assertEqual(bucket.try_acquire({'requests': 3}), 0)
+        self.assertGreater(bucket.try_acquire({'requests': 1}), 0)
+
+    def test_several_limits(self):
+        bucket = SharedTokenBucket({'requests': 60, 'tokens': 600})
+
+        # Amounts over the capacity take the whole bucket.
+        self.assertEqual(bucket.try_acquire({'requests': 1, 'tokens': 900}), 0)
+        # Waits for the slowest bucket, nothing is taken meanwhile.
+        self.assertEqual(
+            bucket.try_acquire({'requests': 1, 'tokens': 300}), 30.0
+        )
+        self.assertEqual(bucket._state['levels']['requests'], 59)
+
+    def test_shared_state_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bucket.json')
+            first = SharedTokenBucket({'requests': 3}, path=path)
+            second = SharedTokenBucket({'requests': 3}, path=path)
+
+            self.assertEqual(first.try_acquire({'requests': 2}), 0)
+            self.assertEqual(second.try_acquire({'requests': 1}), 0)
+            self.assertEqual(first.try_acquire({'requests': 1}), 20.0)
+            with open(path) as file:
+                self.assertEqual(json.load(file)['levels'], {'requests': 0})
+
+
+class SharedTokenBucketProcessTestCase(SimpleTestCase):
+    # Not faking the clock, the other process reads the real one.
+    def test_other_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bucket.json')
+            bucket = SharedTokenBucket({'requests': 3}, path=path)
+            self.assertEqual(bucket.try_acquire({'requests': 2}), 0)
+
+            script = (
+                'import sys\n'
+                'from healthmateai.util.ratelimit import SharedTokenBucket\n'
+                'bucket = SharedTokenBucket(\n'
+                "    {'requests': 3}, path=sys.argv[1]\n"
+                ')\n'
+                "print(bucket.try_acquire({'requests': 2}))\n"
+            )
+            result = subprocess.run(
+                [sys.executable, '-c', script, path], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            )
+
+            # Only one request was left for the other process, it waits
+            # for the second one, less what refilled while it started.
+            wait = float(result.stdout)
+            self.assertGreater(wait, 10.0)
+            self.assertLessEqual(wait, 20.0)
+
+
+class FakeBucket:
+    def __init__(self, available=0, wait=0.05):
+        self.available = available
+        self.wait = wait
+        self.lock = threading.Lock()
+
+    def try_acquire(self, amounts):
+        with self.lock:
+            if self.available > 0:
+                self.available -= 1
+                return 0
+        return self.wait
+
+
+class PriorityRateLimiterTestCase(SimpleTestCase):
+    def wait_for_queue(self, limiter, depth):
+        deadline = time.monotonic() + 5
+        while limiter.stats()['queue_depth'] < depth:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_priority_order(self):
+        bucket = FakeBucket()
+        limiter = PriorityRateLimiter(bucket)
+        acquired = []
+
+        def acquire(name, priority):
+            limiter.acquire({'requests': 1}, priority=priority, timeout=5)
+            acquired.append(name)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            batch = executor.submit(acquire, 'batch', ratelimit.BATCH)
+            self.wait_for_queue(limiter, 1)
+            interactive = executor.submit(
+                acquire, 'interactive', ratelimit.INTERACTIVE
+            )
+            self.wait_for_queue(limiter, 2)
+            self.assertEqual(limiter.stats()['queued_batch'], 1)
+
+            bucket.available = 2
+            batch.result(5)
+            interactive.result(5)
+
+        # The batch call queued first, but the interactive one overtook it.
+        self.assertEqual(acquired, ['interactive', 'batch'])
+        self.assertEqual(limiter.stats()['acquired'], 2)
+        self.assertEqual(limiter.stats()['queue_depth'], 0)
+
+    def test_timeout(self):
+        limiter = PriorityRateLimiter(FakeBucket(wait=30))
+
+        with self.assertRaises(RateLimitTimeout) as context:
+            limiter.acquire({'requests': 1}, timeout=5)
+
+        self.assertEqual(context.exception.wait, 30)
+        self.assertEqual(limiter.stats()['timeouts'], 1)
+        self.assertEqual(limiter.stats()['queue_depth'], 0)
+
+    def test_timeout_in_queue(self):
+        bucket = FakeBucket()
+        limiter = PriorityRateLimiter(bucket)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            head = executor.submit(limiter.acquire, {'requests': 1})
+            self.wait_for_queue(limiter, 1)
+
+            # Never reaches the head of the queue in time.
+            with self.assertRaises(RateLimitTimeout):
+                limiter.acquire(
+                    {'requests': 1}, priority=ratelimit.BATCH, timeout=0.1
+                )
+            bucket.available = 1
+            head.result(5)
+
+        self.assertEqual(limiter.stats()['timeouts'], 1)
@@ -0,0 +1,77 @@
+"""
+ASGI middleware wrapping the Django application in `healthmateai.asgi`.
+"""
+import asyncio
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    Cancel the handling of a request when the client disconnects while the
+    response is being sent, eg. in the middle of a Server-Sent Events stream.
+
+    Django 4.2 stops reading the ASGI messages once the request body is read,
+    so a disconnect is otherwise only noticed when writing to the closed
+    connection fails, if ever. The response generator gets a
+    `CancelledError` at its pending `await` instead. Disconnects before the
+    response starts or after it is complete are left to Django, a view is
+    never interrupted before it returned its response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        body_read = asyncio.Event()
+        response_started = False
+        response_complete = False
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] == 'http.disconnect' or not message.get(
+                    'more_body', False
+            ):
+                body_read.set()
+            return message
+
+        async def send_tracked(message):
+            nonlocal response_started, response_complete
+            if message['type'] == 'http.response.start':
+                response_started = True
+            elif message['type'] == 'http.response.body' and not message.get(
+                    'more_body', False
+            ):
+                response_complete = True
+            await send(message)
+
+        async def wait_for_disconnect():
+            # Only read once Django has read the whole body, the messages
+            # of a connection can't be shared between two readers.
+            await body_read.wait()
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        handler = asyncio.ensure_future(
+            self.app(scope, receive_body, send_tracked)
+        )
+        watcher = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            await asyncio.wait(
+                (handler, watcher), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not handler.done() and response_started and (
+                    not response_complete
+            ):
+                handler.cancel()
+                try:
+                    await handler
+                except asyncio.CancelledError:
+                    pass
+                return
+            await handler
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
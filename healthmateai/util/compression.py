@@ -0,0 +1,197 @@
+"""
+Response compression negotiated from `Accept-Encoding`, brotli when the
+`Brotli` package is installed and the client accepts it, otherwise gzip. See
+`settings.RESPONSE_COMPRESSION`.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_CONTENT_TYPES = (
+    'text/',
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'application/problem+json',
+    'application/vnd.oai.openapi',
+)
+# Streamed as they are produced, compressing would delay the events.
+UNCOMPRESSED_STREAMING_CONTENT_TYPES = ('text/event-stream',)
+
+
+class GzipEncoding:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, content):
+        return gzip.compress(content, compresslevel=self.level, mtime=0)
+
+    def compressor(self):
+        """
+        Return `(compress, finish)` functions for streamed content. Every
+        compressed chunk is flushed, so it can be sent right away.
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+        def compress(chunk):
+            return compressor.compress(chunk) + compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+
+        return compress, compressor.flush
+
+
+class BrotliEncoding:
+    name = 'br'
+
+    def __init__(self, quality):
+        self.quality = quality
+
+    def compress(self, content):
+        return brotli.compress(content, quality=self.quality)
+
+    def compressor(self):
+        compressor = brotli.Compressor(quality=self.quality)
+
+        def compress(chunk):
+            return compressor.process(chunk) + compressor.flush()
+
+        return compress, compressor.finish
+
+
+def get_encodings():
+    """
+    Return the available encodings by name, in order of preference.
+    """
+    options = settings.RESPONSE_COMPRESSION
+    encodings = {}
+    if brotli is not None:
+        encodings['br'] = BrotliEncoding(options['BROTLI_QUALITY'])
+    encodings['gzip'] = GzipEncoding(options['GZIP_LEVEL'])
+
+    return encodings
+
+
+def parse_accept_encoding(header):
+    """
+    Return the `{coding: q}` of an `Accept-Encoding` header.
+    """
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+
+    return accepted
+
+
+def negotiate_encoding(header, encodings):
+    """
+    Return the encoding of `encodings` the client prefers, or None.
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for name, encoding in encodings.items():
+        quality = accepted.get(name, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].lower()
+
+    return content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress the responses of compressible content types, at least
+    `MIN_SIZE` bytes long or streamed, with the encoding negotiated from
+    `Accept-Encoding`. Like Django's `GZipMiddleware`, strong `ETag`s are
+    made weak as the compressed body differs from the uncompressed one.
+    """
+
+    def process_response(self, request, response):
+        options = settings.RESPONSE_COMPRESSION
+        if not options['ENABLED']:
+            return response
+
+        if response.has_header('Content-Encoding') or not is_compressible(
+                response
+        ):
+            return response
+        if response.streaming:
+            content_type = response.get('Content-Type', '').split(';')[0]
+            if content_type in UNCOMPRESSED_STREAMING_CONTENT_TYPES:
+                return response
+        elif len(response.content) < options['MIN_SIZE']:
+            return response
+
+        # Whether compressed or not, the body depends on the header.
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), get_encodings()
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.compress_stream(
+                response, encoding
+            )
+            # The length of the compressed stream is not known.
+            del response['Content-Length']
+        else:
+            content = encoding.compress(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding.name
+
+        return response
+
+    def compress_stream(self, response, encoding):
+        compress, finish = encoding.compressor()
+        chunks = response.streaming_content
+        if response.is_async:
+            async def compressed():
+                async for chunk in chunks:
+                    if chunk:
+                        yield compress(chunk)
+                yield finish()
+        else:
+            def compressed():
+                for chunk in chunks:
+                    if chunk:
+                        yield compress(chunk)
+                yield finish()
+
+        return compressed()
@@ -0,0 +1,138 @@
+import json
+import zlib
+
+from django import forms
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+# Prefix of a stored value compressed with zlib, followed by the compressed
+# json. Values without a known prefix are plain utf-8 json.
+ZLIB_HEADER = b'z1:'
+
+
+def compress_json(value, level=None, min_size=0):
+    """
+    Return the stored bytes of `value`: canonical json (compact, sorted
+    keys), compressed when it is at least `min_size` bytes long and
+    compression makes it smaller.
+    """
+    data = json.dumps(
+        value, cls=DjangoJSONEncoder, separators=(',', ':'), sort_keys=True,
+        ensure_ascii=False
+    ).encode()
+    if level is None or len(data) < min_size:
+        return data
+
+    compressed = ZLIB_HEADER + zlib.compress(data, level)
+
+    return compressed if len(compressed) < len(data) else data
+
+
+def decompress_json_text(data):
+    """
+    Return the json text of a stored value, without decoding the json.
+    """
+    if data.startswith(ZLIB_HEADER):
+        data = zlib.decompress(data[len(ZLIB_HEADER):])
+
+    return data.decode()
+
+
+def decompress_json(data):
+    return json.loads(decompress_json_text(data))
+
+
+def is_compressed(data):
+    return data.startswith(ZLIB_HEADER)
+
+
+class StoredJSON(bytes):
+    """
+    The stored bytes of a `CompressedJSONField` loaded from the database and
+    not decoded yet. Saved again as is when the value wasn't accessed.
+    """
+
+
+class CompressedJSONDescriptor(DeferredAttribute):
+    """
+    Decode the stored bytes on first access, instances that are only listed
+    or saved never decompress it.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, StoredJSON):
+            value = instance.__dict__[self.field.attname] = decompress_json(
+                value
+            )
+
+        return value
+
+    def __set__(self, instance, value):
+        # A data descriptor, so `__get__` sees values set on the instance.
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedJSONField(models.BinaryField):
+    """
+    Json stored as zlib compressed bytes, see `settings.COMPRESSED_FIELDS`.
+    The binary column holds either plain json or the compressed json behind
+    a format header, values too small to gain from compression are stored
+    plain. Json lookups are not supported.
+    """
+    descriptor_class = CompressedJSONDescriptor
+    # A missing value is NULL, not `b''`.
+    empty_strings_allowed = False
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            del kwargs['editable']
+        else:
+            kwargs['editable'] = False
+
+        return name, path, args, kwargs
+
+    def get_compress_options(self):
+        options = settings.COMPRESSED_FIELDS
+        if not options['ENABLED']:
+            return {}
+
+        return {'level': options['LEVEL'], 'min_size': options['MIN_SIZE']}
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+
+        # `memoryview` on PostgreSQL.
+        return StoredJSON(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return decompress_json(bytes(value))
+
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, StoredJSON):
+            return value
+
+        return compress_json(value, **self.get_compress_options())
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj), cls=DjangoJSONEncoder)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{
+            'form_class': forms.JSONField,
+            'encoder': DjangoJSONEncoder,
+            **kwargs
+        })
@@ -1,6 +1,20 @@
+import asyncio
+import hashlib
+from calendar import timegm
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 
+from healthmateai.util import response_cache
+
 from healthmateai.util.mixins import (
+    AsyncCreateModelMixin, AsyncListModelMixin, AsyncRetrieveModelMixin,
     CreateModelMixin, ListModelMixin, RetrieveModelMixin, DestroyModelMixin,
     UpdateModelMixin
 )
@@ -22,9 +36,23 @@ class BaseAPIView(GenericAPIView):
                     "status_code": <status_code>
         }
     }
+
+    GET requests can pick the returned fields with `?fields=id,summarize` or
+    leave some out with `?exclude=conversation`. The model columns of the
+    omitted fields are deferred in list querysets.
+
+    GET responses of lists and objects of models with an `updated_at` have an
+    `ETag` and a `Last-Modified` header, a request with a matching
+    `If-None-Match` or `If-Modified-Since` gets a 304 without serializing.
+    When `settings.RESPONSE_CACHE['ENABLED']`, rendered list pages are also
+    cached until an object of a listed model changes.
     """
 
     serializer_classes = {}
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+    conditional_get = True
+    cache_list_responses = True
 
     def get_serializer_class(self):
         """
@@ -46,8 +74,78 @@ class BaseAPIView(GenericAPIView):
         if isinstance(serializer_class, dict):
             serializer_class = serializer_class['serializer_class']
         kwargs.setdefault('context', self.get_serializer_context())
+        serializer = serializer_class(*args, **kwargs)
+
+        fields = getattr(serializer, 'child', serializer).fields
+        for name in self.get_omitted_fields(fields):
+            fields.pop(name)
+
+        return serializer
 
-        return serializer_class(*args, **kwargs)
+    def get_field_names(self, param):
+        value = self.request.query_params.get(param, '')
+
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def get_omitted_fields(self, fields):
+        """
+        Return the names of the serializer `fields` left out by the `fields`
+        and `exclude` query params.
+        """
+        request = getattr(self, 'request', None)
+        if request is None or request.method != 'GET':
+            return set()
+
+        only = self.get_field_names(self.fields_query_param)
+        exclude = self.get_field_names(self.exclude_query_param)
+        unknown = set(only + exclude) - set(fields)
+        if unknown:
+            raise ValidationError({
+                'fields': [
+                    f'Unknown field: {name}' for name in sorted(unknown)
+                ]
+            })
+
+        omitted = set(exclude)
+        if only:
+            omitted.update(set(fields) - set(only))
+
+        return omitted
+
+    def get_deferred_fields(self, model):
+        """
+        Return the fields of `model` only read by the serializer fields left
+        out of the response. Fields of the view's `ordering` are never
+        deferred.
+        """
+        serializer_class = self.get_serializer_class()
+        if isinstance(serializer_class, dict):
+            serializer_class = serializer_class['serializer_class']
+        fields = serializer_class(context=self.get_serializer_context()).fields
+        omitted = self.get_omitted_fields(fields)
+        if not omitted:
+            return set()
+
+        used = {
+            field.source for name, field in fields.items()
+            if name not in omitted
+        }
+        used.update(
+            name.lstrip('-') for name in getattr(self, 'ordering', None) or ()
+        )
+        deferred = set()
+        for name in omitted:
+            source = fields[name].source
+            if source in used:
+                continue
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.primary_key:
+                deferred.add(source)
+
+        return deferred
 
     def get_return_serializer(self):
         """
@@ -71,6 +169,110 @@ class BaseAPIView(GenericAPIView):
                 and serializer_class.get('status_code')
         ) else None
 
+    def get_etag(self, *values):
+        """
+        Return the `ETag` of the response to the current request for data
+        identified by `values`. It varies on the full URL, so on the page and
+        the fields, and on the negotiated media type.
+        """
+        digest = hashlib.md5(repr((
+            self.request.get_full_path(),
+            getattr(self.request, 'accepted_media_type', ''),
+            *values
+        )).encode()).hexdigest()
+
+        return quote_etag(digest)
+
+    def get_validators(self, values, last_modified):
+        """
+        Return the `(etag, last_modified)` validators, `last_modified` as a
+        timestamp, or None when conditional GET is disabled.
+        """
+        if not self.conditional_get or self.request.method not in (
+                'GET', 'HEAD'
+        ):
+            return None
+
+        return self.get_etag(*values), (
+            timegm(last_modified.utctimetuple()) if last_modified else None
+        )
+
+    def set_validators(self, response, validators):
+        if validators is None:
+            return response
+
+        etag, last_modified = validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+    def get_not_modified_response(self, validators):
+        """
+        Return a 304 response when the request's preconditions match the
+        validators, otherwise None.
+        """
+        if validators is None:
+            return None
+
+        etag, last_modified = validators
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+
+        return self.set_validators(response, validators) if response else None
+
+    def get_response_cache_key(self, models):
+        """
+        Return the key the rendered response is cached under, or None when
+        the response is not cached.
+        """
+        if not (
+                settings.RESPONSE_CACHE['ENABLED']
+                and self.cache_list_responses
+                and self.request.method == 'GET'
+        ):
+            return None
+
+        return response_cache.get_response_key(
+            self.request, response_cache.get_versions(models)
+        )
+
+    def get_cached_response(self, key):
+        """
+        Return the cached response or a 304 for it, or None on a miss.
+        """
+        cached = response_cache.get_response(key)
+        if cached is None:
+            return None
+
+        not_modified = self.get_not_modified_response(cached['validators'])
+        if not_modified is not None:
+            return not_modified
+
+        return self.set_validators(
+            HttpResponse(
+                cached['content'], content_type=cached['content_type']
+            ),
+            cached['validators']
+        )
+
+    def cache_response(self, key, response, validators):
+        """
+        Cache `response` under `key` once it is rendered.
+        """
+        if key is None:
+            return response
+
+        response.add_post_render_callback(
+            lambda rendered: response_cache.set_response(
+                key, rendered, validators
+            )
+        )
+
+        return response
+
 
 class CreateAPIView(CreateModelMixin, BaseAPIView):
     """
@@ -129,3 +331,71 @@ class RetrieveUpdateAPIView(RetrieveAPIView, UpdateAPIView):
 
 class RetrieveDestroyAPIView(RetrieveAPIView, DestroyAPIView):
     pass
+
+
+class AsyncBaseAPIView(BaseAPIView):
+    """
+    `BaseAPIView` with async handlers. Authentication, permissions and
+    throttling run in a thread, the handler itself runs on the event loop so
+    a request waiting on the LLM does not hold a worker thread.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+
+class AsyncCreateAPIView(AsyncCreateModelMixin, AsyncBaseAPIView):
+    """
+    Concrete async view for creating a model instance.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        return await self.acreate(request, *args, **kwargs)
+
+
+class AsyncListAPIView(AsyncListModelMixin, AsyncBaseAPIView):
+    """
+    Concrete async view for listing a queryset.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+
+class AsyncRetrieveAPIView(AsyncRetrieveModelMixin, AsyncBaseAPIView):
+    """
+    Concrete async view for retrieving a model instance.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await self.aretrieve(request, *args, **kwargs)
+
+
+class AsyncListCreateAPIView(AsyncCreateAPIView, AsyncListAPIView):
+    pass
@@ -1,12 +1,22 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.db.models import Count, Func, Max, Subquery
 from rest_framework import status, mixins
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 
-from healthmateai.util.pagination import PageNumberPagination, CursorPagination
+from healthmateai.util.pagination import (
+    CursorPagination, EstimatedCountPagination, NoCountPagination,
+    PageNumberPagination
+)
 
 
 class CreateModelMixin(mixins.CreateModelMixin):
+    # Accept a list of at most `bulk_create_max_size` objects in one request,
+    # see `bulk_create()`.
+    allow_bulk_create = False
+    bulk_create_max_size = 1000
+
     def create(self, request, *args, **kwargs):
         """
         Generates a Response object with create status and response data.
@@ -14,6 +24,8 @@ class CreateModelMixin(mixins.CreateModelMixin):
         or from the serializer_classes dict that will be used if set to override
         the serializer used in the response data and response status code.
         """
+        if self.allow_bulk_create and isinstance(request.data, list):
+            return self.bulk_create(request, *args, **kwargs)
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -36,9 +48,171 @@ class CreateModelMixin(mixins.CreateModelMixin):
             headers=headers
         )
 
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Create the valid objects of a list in bulk. The serializer should use
+        a `BulkListSerializer`. Every item is reported in `results` by its
+        index, with the return serializer data when created or its errors.
+        """
+        serializer = self.get_serializer(
+            data=request.data, many=True,
+            max_length=self.bulk_create_max_size
+        )
+        serializer.is_valid(raise_exception=True)
+        instances = serializer.save() if serializer.validated_data else []
+        return_serializer = (
+                kwargs.get('return_serializer') or self.get_return_serializer()
+        )
+        created = dict(zip(
+            serializer.valid_indexes,
+            return_serializer(
+                instances, many=True, context=self.get_serializer_context()
+            ).data if return_serializer else serializer.data
+        ))
+        results = [
+            {
+                'index': index,
+                'status': 'success',
+                'data': created[index]
+            } if index in created else {
+                'index': index,
+                'status': 'error',
+                'errors': serializer.item_errors[index]
+            }
+            for index in range(len(request.data))
+        ]
+
+        return Response(
+            {
+                'status': 'success',
+                'data': {
+                    'created': len(created),
+                    'failed': len(serializer.item_errors),
+                    'results': results
+                }
+            },
+            status=(
+                (
+                    kwargs.get('return_status_code')
+                    or self.get_status_code()
+                    or status.HTTP_201_CREATED
+                ) if created else status.HTTP_400_BAD_REQUEST
+            )
+        )
+
+
+def has_updated_at(model):
+    return any(
+        field.name == 'updated_at' for field in model._meta.concrete_fields
+    )
+
 
 class ListModelMixin(mixins.ListModelMixin):
     pagination_class = PageNumberPagination
+    # Relations loaded with the listed objects, so serializers nesting them
+    # don't run a query per row.
+    list_select_related = ()
+    list_prefetch_related = ()
+
+    def get_list_queryset(self):
+        """
+        Return the filtered queryset to list with the related objects of
+        `list_select_related` and `list_prefetch_related` loaded, and the
+        columns of the fields left out of the response deferred.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        deferred = self.get_deferred_fields(queryset.model)
+        select_related = [
+            name for name in self.list_select_related
+            if name.split('__')[0] not in deferred
+        ]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        prefetch_related = [
+            name for name in self.list_prefetch_related
+            if name.split('__')[0] not in deferred
+        ]
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if deferred:
+            queryset = queryset.defer(*deferred)
+
+        return queryset
+
+    def get_list_models(self, queryset):
+        """
+        Return the models of the listed objects and of their
+        `list_select_related` relations.
+        """
+        models = [queryset.model]
+        for path in self.list_select_related:
+            model = queryset.model
+            for name in path.split('__'):
+                model = model._meta.get_field(name).related_model
+            models.append(model)
+
+        return models
+
+    def get_list_validators(self, queryset):
+        """
+        Return the `(etag, last_modified)` validators of the list, from the
+        count and the latest `updated_at` of the listed objects, and the
+        latest `updated_at` of the tables of the `list_select_related`
+        models. One aggregate query on the listed table with a subquery per
+        related table, no rows are fetched and no relation is joined.
+        `last_modified` is left out with related models. The count is kept
+        in `list_count` for the page number paginations. None with a
+        pagination avoiding the count or a model without `updated_at`.
+        """
+        if not self.conditional_get:
+            return None
+        paginator = self.paginator
+        if paginator is not None and not getattr(
+                paginator, 'conditional_get', False
+        ):
+            return None
+        related_models = self.get_list_models(queryset)[1:]
+        if not all(
+                has_updated_at(model)
+                for model in [queryset.model, *related_models]
+        ):
+            return None
+
+        # The whole related tables, the related objects of the page are only
+        # known once it is fetched.
+        fingerprint = queryset.order_by().aggregate(
+            count=Count('pk'), updated_at=Max('updated_at'), **{
+                f'related_{index}': Max(Subquery(
+                    model._default_manager.order_by().values(
+                        latest=Func('updated_at', function='MAX')
+                    )
+                ))
+                for index, model in enumerate(related_models)
+            }
+        )
+        self.list_count = fingerprint['count']
+
+        return self.get_validators(
+            tuple(fingerprint.values()),
+            None if related_models else fingerprint['updated_at']
+        )
+
+    def get_list_shortcut(self, queryset):
+        """
+        Return `(response, validators, cache_key)`. `response` is the cached
+        page or a 304 when the list doesn't need to be serialized, otherwise
+        None.
+        """
+        cache_key = self.get_response_cache_key(self.get_list_models(queryset))
+        if cache_key is not None:
+            response = self.get_cached_response(cache_key)
+            if response is not None:
+                return response, None, cache_key
+
+        validators = self.get_list_validators(queryset)
+        response = self.get_not_modified_response(validators)
+
+        return response, validators, cache_key
 
     def get_pagination_class(self):
         paginator_name = self.request.GET.get('pagination')
@@ -46,6 +220,8 @@ class ListModelMixin(mixins.ListModelMixin):
         try:
             return {
                 "page": PageNumberPagination,
+                "no_count": NoCountPagination,
+                "estimated": EstimatedCountPagination,
                 "cursor": CursorPagination
             }[paginator_name]
         except KeyError:
@@ -67,34 +243,58 @@ class ListModelMixin(mixins.ListModelMixin):
         return self._paginator
 
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.get_list_queryset()
+        response, validators, cache_key = self.get_list_shortcut(queryset)
+        if response is not None:
+            return response
 
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(
-            serializer.data,
-            status=(
-                    kwargs.get('return_status_code')
-                    or self.get_status_code() or status.HTTP_200_OK
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(
+                serializer.data,
+                status=(
+                        kwargs.get('return_status_code')
+                        or self.get_status_code() or status.HTTP_200_OK
+                )
             )
-        )
+
+        self.set_validators(response, validators)
+        return self.cache_response(cache_key, response, validators)
 
 
 class RetrieveModelMixin:
+    def get_object_validators(self, instance):
+        """
+        Return the `(etag, last_modified)` validators of `instance` from its
+        `updated_at`.
+        """
+        updated_at = getattr(instance, 'updated_at', None)
+        if updated_at is None:
+            return None
+
+        return self.get_validators(
+            (instance._meta.label_lower, instance.pk, updated_at), updated_at
+        )
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
+        validators = self.get_object_validators(instance)
+        not_modified = self.get_not_modified_response(validators)
+        if not_modified is not None:
+            return not_modified
+
         serializer = self.get_serializer(instance)
-        return Response(
+        return self.set_validators(Response(
             serializer.data,
             status=(
                     kwargs.get('return_status_code')
                     or self.get_status_code() or status.HTTP_200_OK
             )
-        )
+        ), validators)
 
 
 class UpdateModelMixin(mixins.UpdateModelMixin):
@@ -145,3 +345,108 @@ class DestroyModelMixin(mixins.DestroyModelMixin):
 
     def perform_destroy(self, serializer):
         serializer.destroy()
+
+
+class AsyncCreateModelMixin(CreateModelMixin):
+    """
+    Async variant of `CreateModelMixin`. The serializer is saved with
+    `asave()` when it has one, otherwise `save()` runs in a thread.
+    """
+
+    async def acreate(self, request, *args, **kwargs):
+        if self.allow_bulk_create and isinstance(request.data, list):
+            return await sync_to_async(self.bulk_create)(
+                request, *args, **kwargs
+            )
+
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await self.aperform_create(serializer)
+        return_serializer = (
+                kwargs.get('return_serializer') or self.get_return_serializer()
+        )
+        data = await sync_to_async(lambda: (
+            return_serializer(
+                serializer.instance, context=self.get_serializer_context()
+            ).data if return_serializer else serializer.data
+        ))()
+
+        return Response(
+            data,
+            status=(
+                kwargs.get('return_status_code')
+                or self.get_status_code()
+                or status.HTTP_201_CREATED
+            ),
+            headers=self.get_success_headers(data)
+        )
+
+    async def aperform_create(self, serializer):
+        if hasattr(serializer, 'asave'):
+            await serializer.asave()
+        else:
+            await sync_to_async(serializer.save)()
+
+
+class AsyncListModelMixin(ListModelMixin):
+    """
+    Async variant of `ListModelMixin`. The paginators are sync, so the page is
+    fetched and serialized in a thread.
+    """
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.get_list_queryset()
+        response, validators, cache_key = await sync_to_async(
+            self.get_list_shortcut
+        )(queryset)
+        if response is not None:
+            return response
+
+        page = await sync_to_async(self.paginate_queryset)(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            data = await sync_to_async(lambda: serializer.data)()
+            response = self.get_paginated_response(data)
+        else:
+            serializer = self.get_serializer(
+                [instance async for instance in queryset], many=True
+            )
+            data = await sync_to_async(lambda: serializer.data)()
+            response = Response(
+                data,
+                status=(
+                        kwargs.get('return_status_code')
+                        or self.get_status_code() or status.HTTP_200_OK
+                )
+            )
+
+        self.set_validators(response, validators)
+        return self.cache_response(cache_key, response, validators)
+
+
+class AsyncRetrieveModelMixin(RetrieveModelMixin):
+    """
+    Async variant of `RetrieveModelMixin`. Views should override
+    `aget_object()` with the async queryset API, by default `get_object()`
+    runs in a thread.
+    """
+
+    async def aget_object(self):
+        return await sync_to_async(self.get_object)()
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        validators = self.get_object_validators(instance)
+        not_modified = self.get_not_modified_response(validators)
+        if not_modified is not None:
+            return not_modified
+
+        serializer = self.get_serializer(instance)
+        data = await sync_to_async(lambda: serializer.data)()
+        return self.set_validators(Response(
+            data,
+            status=(
+                    kwargs.get('return_status_code')
+                    or self.get_status_code() or status.HTTP_200_OK
+            )
+        ), validators)
@@ -1,16 +1,63 @@
+import binascii
+import hashlib
+import json
+import logging
+import threading
+import time
+from base64 import b64decode, b64encode
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import close_old_connections, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import (
     PageNumberPagination as RestPageNumberPagination,
     CursorPagination as RestCursorPagination
 )
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+logger = logging.getLogger('django')
+
+
+class KnownCountPaginator(DjangoPaginator):
+    """
+    Paginator for an object list whose count is already known.
+    """
+
+    def __init__(self, *args, count, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = count
 
 
 class PageNumberPagination(RestPageNumberPagination):
+    """
+    Page number pagination. When the view already counted the list, its
+    `list_count`, eg. for the `ETag` of the list, is used instead of running
+    the `COUNT(*)` query again.
+
+    `conditional_get` tells the list views if the list may be counted for its
+    `ETag`, paginations avoiding the `COUNT(*)` disable it.
+    """
     page_size = 15
     page_size_query_param = 'page_size'
     max_page_size = 250
+    conditional_get = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count = getattr(view, 'list_count', None)
+        if count is not None:
+            self.django_paginator_class = partial(
+                KnownCountPaginator, count=count
+            )
+
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
         response = OrderedDict([
@@ -25,10 +72,314 @@ class PageNumberPagination(RestPageNumberPagination):
         )
 
 
+class NoCountPagination(PageNumberPagination):
+    """
+    Page number pagination without the `COUNT(*)` query. One row more than
+    the page size is fetched to know if there is a next page, so the response
+    has no `count`.
+    """
+    conditional_get = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1)
+            )
+            if self.page_number < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='That page number is not a valid integer.'
+            ))
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and self.page_number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=self.page_number,
+                message='That page contains no results.'
+            ))
+        self.has_next = len(rows) > page_size
+
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.page_query_param,
+            self.page_number + 1
+        )
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1
+        )
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ])
+
+        return Response(
+            OrderedDict([('status', 'success'), ('data', response)])
+        )
+
+
+class CountCache:
+    """
+    Per process cache of queryset counts. Only the first request for a
+    queryset waits for the count, an expired count is served while a
+    background thread refreshes it.
+    """
+
+    def __init__(self, timeout, max_entries):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get_key(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+
+        return hashlib.sha256(
+            f'{queryset.db}:{sql}:{params!r}'.encode()
+        ).hexdigest()
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='pagination-count'
+                )
+
+        return self._executor
+
+    def set(self, key, count):
+        with self._lock:
+            self._counts[key] = (count, time.monotonic() + self.timeout)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+            self._refreshing.discard(key)
+
+    def refresh(self, key, queryset):
+        close_old_connections()
+        try:
+            self.set(key, queryset.count())
+        except Exception:
+            logger.exception('Failed to refresh a pagination count.')
+            with self._lock:
+                self._refreshing.discard(key)
+        finally:
+            close_old_connections()
+
+    def count(self, queryset):
+        key = self.get_key(queryset)
+        with self._lock:
+            count, expires_at = self._counts.get(key, (None, None))
+            stale = count is not None and expires_at <= time.monotonic()
+            if stale and key not in self._refreshing:
+                self._refreshing.add(key)
+            else:
+                stale = False
+
+        if stale:
+            self.get_executor().submit(self.refresh, key, queryset.all())
+        if count is None:
+            count = estimate_count(queryset)
+            if count is None:
+                count = queryset.count()
+            self.set(key, count)
+
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+def estimate_count(queryset):
+    """
+    Return the planner's row estimate of an unfiltered PostgreSQL table, or
+    None when there is no cheap estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+
+    # -1 means the table was never analyzed.
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+count_cache = CountCache(
+    timeout=settings.PAGINATION_COUNT_CACHE['COUNT_TIMEOUT'],
+    max_entries=settings.PAGINATION_COUNT_CACHE['MAX_ENTRIES']
+)
+
+
+class CachedCountPaginator(DjangoPaginator):
+    @cached_property
+    def count(self):
+        return count_cache.count(self.object_list)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """
+    Page number pagination with the `count` served from `count_cache`. The
+    count may be behind by up to `PAGINATION_COUNT_CACHE['COUNT_TIMEOUT']`
+    seconds.
+    """
+    django_paginator_class = CachedCountPaginator
+    conditional_get = False
+
+
 class CursorPagination(RestCursorPagination):
+    """
+    Keyset pagination. Pages are fetched with a `WHERE` on the position of
+    the last (or first) row of the previous page instead of an `OFFSET`, so
+    deep pages cost the same as the first one when an index matches the
+    ordering.
+
+    The ordering is taken from the view's `ordering`, it must end with a
+    unique field, eg. `('-created_at', '-id')`, and its fields must not be
+    null. Cursors are opaque, base64 encoded positions.
+    """
     page_size = 15
     page_size_query_param = 'page_size'
     max_page_size = 250
+    ordering = ('-created_at', '-id')
+    conditional_get = False
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'ordering', None) or self.ordering)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            cursor = json.loads(b64decode(encoded.encode()).decode())
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if len(position) != len(self.ordering_fields):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def get_cursor_link(self, instance, reverse):
+        position = [
+            self.model._meta.get_field(name).value_to_string(instance)
+            for name, _ in self.ordering_fields
+        ]
+        cursor = json.dumps({'p': position, 'r': int(reverse)})
+
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            b64encode(cursor.encode()).decode()
+        )
+
+    def get_position_filter(self, position, reverse):
+        """
+        Return the filter of the rows after `position` in the ordering, or
+        before it when `reverse`. The bound on the first field lets the
+        database range scan the index.
+        """
+        lookups = []
+        for (name, descending), value in zip(self.ordering_fields, position):
+            after = descending == reverse
+            lookups.append((name, 'gt' if after else 'lt', value))
+
+        name, lookup, value = lookups[0]
+        bound = Q(**{f'{name}__{lookup}e': value})
+        position_filter = Q()
+        for index, (name, lookup, value) in enumerate(lookups):
+            position_filter |= Q(
+                **{previous: previous_value
+                   for previous, _, previous_value in lookups[:index]},
+                **{f'{name}__{lookup}': value}
+            )
+
+        return bound & position_filter
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        ordering = self.get_ordering(request, queryset, view)
+        self.ordering_fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_position_filter(position, reverse)
+                )
+                rows = list(queryset[:self.page_size + 1])
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        else:
+            rows = list(queryset[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+
+        return self.get_cursor_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+
+        return self.get_cursor_link(self.page[0], reverse=True)
 
     def get_paginated_response(self, data):
         response = OrderedDict([
@@ -37,4 +388,6 @@ class CursorPagination(RestCursorPagination):
             ('results', data)
         ])
 
-        return Response(response)
+        return Response(
+            OrderedDict([('status', 'success'), ('data', response)])
+        )
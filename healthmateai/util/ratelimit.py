@@ -0,0 +1,215 @@
+"""
+Token bucket rate limiting shared by the processes of a host, with a
+priority queue for the callers of a process.
+"""
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows.
+    fcntl = None
+
+INTERACTIVE = 0
+BATCH = 10
+
+_priority = contextvars.ContextVar('rate_limit_priority', default=INTERACTIVE)
+
+
+def get_priority():
+    return _priority.get()
+
+
+@contextmanager
+def priority(value):
+    """
+    Run the block with the given rate limiting priority (lower goes first).
+    """
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimitTimeout(Exception):
+    def __init__(self, wait):
+        self.wait = wait
+        super().__init__(f'Rate limited, retry after {wait:.1f}s.')
+
+
+class SharedTokenBucket:
+    """
+    One token bucket per limit, eg. `{'requests': 3500, 'tokens': 90000}` per
+    minute. With a `path` the bucket state lives in that file and is updated
+    under an exclusive file lock, so every process of the host draws from the
+    same buckets.
+    """
+
+    def __init__(self, limits, path=None, period=60.0):
+        self.limits = limits
+        self.period = period
+        self.path = path if fcntl else None
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _initial_state(self):
+        return {
+            'updated_at': time.time(),
+            'levels': dict(self.limits)
+        }
+
+    def _refill(self, state, now):
+        elapsed = max(now - state['updated_at'], 0.0)
+        for name, capacity in self.limits.items():
+            level = state['levels'].get(name, capacity)
+            state['levels'][name] = min(
+                capacity, level + elapsed * capacity / self.period
+            )
+        state['updated_at'] = now
+
+    def _take(self, state, amounts):
+        self._refill(state, time.time())
+        wait = 0.0
+        for name, amount in amounts.items():
+            capacity = self.limits[name]
+            missing = min(amount, capacity) - state['levels'][name]
+            if missing > 0:
+                wait = max(wait, missing * self.period / capacity)
+        if wait == 0.0:
+            for name, amount in amounts.items():
+                state['levels'][name] -= min(amount, self.limits[name])
+
+        return wait
+
+    def try_acquire(self, amounts):
+        """
+        Take `amounts` from the buckets if all of them have enough. Returns 0
+        on success, otherwise the seconds to wait before they will have.
+        """
+        if self.path is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._initial_state()
+                return self._take(self._state, amounts)
+
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), 'r+') as file:
+                try:
+                    state = json.load(file)
+                except ValueError:
+                    state = self._initial_state()
+                wait = self._take(state, amounts)
+                file.seek(0)
+                file.truncate()
+                json.dump(state, file)
+
+            return wait
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class PriorityRateLimiter:
+    """
+    Callers of `acquire()` wait in a priority queue; only the head of the
+    queue draws from the bucket, so interactive calls overtake queued batch
+    calls of the same process.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stats = {
+            'acquired': 0,
+            'waited': 0,
+            'timeouts': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0
+        }
+
+    def acquire(self, amounts, priority=INTERACTIVE, timeout=None):
+        """
+        Block until `amounts` could be taken from the bucket. Raises
+        `RateLimitTimeout` if that would take longer than `timeout` seconds.
+        """
+        entry = (priority, next(self._counter))
+        started_at = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            self._condition.notify_all()
+        try:
+            while True:
+                with self._condition:
+                    while self._queue[0] != entry:
+                        self._check_timeout(started_at, timeout, 0)
+                        self._condition.wait(
+                            self._remaining(started_at, timeout)
+                        )
+                wait = self.bucket.try_acquire(amounts)
+                if wait == 0:
+                    break
+                self._check_timeout(started_at, timeout, wait)
+                with self._condition:
+                    self._condition.wait(min(wait, 1.0))
+        except RateLimitTimeout:
+            with self._condition:
+                self._stats['timeouts'] += 1
+            raise
+        finally:
+            with self._condition:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+        self._record_wait(time.monotonic() - started_at)
+
+    @staticmethod
+    def _remaining(started_at, timeout):
+        if timeout is None:
+            return 1.0
+        return max(min(timeout - (time.monotonic() - started_at), 1.0), 0.0)
+
+    @staticmethod
+    def _check_timeout(started_at, timeout, wait):
+        if timeout is None:
+            return
+        elapsed = time.monotonic() - started_at
+        if elapsed + wait > timeout:
+            raise RateLimitTimeout(max(wait, 1.0))
+
+    def _record_wait(self, waited):
+        with self._condition:
+            self._stats['acquired'] += 1
+            if waited > 0.001:
+                self._stats['waited'] += 1
+                self._stats['total_wait'] += waited
+                self._stats['max_wait'] = max(self._stats['max_wait'], waited)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            queued = [priority for priority, _ in self._queue]
+        stats.update({
+            'queue_depth': len(queued),
+            'queued_interactive': sum(1 for p in queued if p <= INTERACTIVE),
+            'queued_batch': sum(1 for p in queued if p > INTERACTIVE),
+            'avg_wait': (
+                round(stats['total_wait'] / stats['waited'], 3)
+                if stats['waited'] else 0.0
+            ),
+            'total_wait': round(stats['total_wait'], 3),
+            'max_wait': round(stats['max_wait'], 3)
+        })
+
+        return stats
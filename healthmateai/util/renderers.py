@@ -0,0 +1,90 @@
+import json
+import re
+import secrets
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Placeholder of a `RawJSON` value in the output of orjson, replaced with the
+# json text of the value.
+RAW_JSON_PLACEHOLDER = '@raw-json:{token}:{index}'
+
+
+def sse_event(event, data):
+    """
+    Encode a Server-Sent Event with a json payload.
+    """
+    payload = json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
+
+    return f'event: {event}\ndata: {payload}\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views that stream Server-Sent Events accept
+    `Accept: text/event-stream`. Views return their event stream as a
+    `StreamingHttpResponse`, so this renderer only renders the error
+    responses raised before the stream starts, as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event('error', data).encode(self.charset)
+
+
+class RawJSON:
+    """
+    Already serialized json, written as is by `ORJSONRenderer`.
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` encoding with orjson. Types orjson doesn't support, and
+    datetimes so they keep DRF's format, are encoded by the `encoder_class`.
+    `RawJSON` values are copied to the output without being decoded.
+    `; indent=` media type params indent by 2 spaces, the only indent orjson
+    supports.
+    """
+    options = (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        encoder = self.encoder_class()
+        token = secrets.token_hex(8)
+        fragments = []
+
+        def default(value):
+            if isinstance(value, RawJSON):
+                fragments.append(value.text.encode())
+                return RAW_JSON_PLACEHOLDER.format(
+                    token=token, index=len(fragments) - 1
+                )
+
+            return encoder.default(value)
+
+        options = self.options
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        content = orjson.dumps(data, default=default, option=options)
+        if not fragments:
+            return content
+
+        placeholder = re.compile(
+            re.escape(
+                f'"{RAW_JSON_PLACEHOLDER.format(token=token, index="")}'
+            ).encode() + rb'(\d+)"'
+        )
+
+        return placeholder.sub(lambda match: fragments[int(match[1])], content)
@@ -0,0 +1,95 @@
+"""
+Server side cache of rendered GET responses, see `BaseAPIView`. Entries are
+keyed by a version per model, bumped when an object of the model is saved or
+deleted, so a new version makes all the cached pages of the model stale.
+
+The versions live in the `RESPONSE_CACHE['ALIAS']` cache, which must be
+shared by the processes serving the app (not the default local memory cache)
+when there is more than one.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY_PREFIX = 'response-version'
+RESPONSE_KEY_PREFIX = 'response'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE['ALIAS']]
+
+
+def get_version_key(model):
+    return f'{VERSION_KEY_PREFIX}:{model._meta.label_lower}'
+
+
+def get_versions(models):
+    """
+    Return the current versions of `models` as a tuple.
+    """
+    keys = [get_version_key(model) for model in models]
+    versions = get_cache().get_many(keys)
+
+    return tuple(versions.get(key, 0) for key in keys)
+
+
+def _bump(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set yet or evicted, any value the readers didn't see will do.
+        cache.set(key, 1, timeout=None)
+
+
+def bump_version(model, using='default'):
+    """
+    Invalidate the cached responses of `model`. Inside a transaction the
+    version is bumped on commit, so a request can't cache the data read
+    before the commit under the new version.
+    """
+    if settings.RESPONSE_CACHE['ENABLED']:
+        transaction.on_commit(
+            lambda: _bump(get_version_key(model)), using=using
+        )
+
+
+def bump_model_version(sender, using='default', **kwargs):
+    """
+    `post_save` and `post_delete` receiver bumping the version of `sender`.
+    """
+    bump_version(sender, using=using)
+
+
+def get_response_key(request, versions):
+    """
+    Return the cache key of the response to `request`, it varies on the
+    full URL, the negotiated media type and the model versions.
+    """
+    media_type = getattr(request, 'accepted_media_type', '')
+    digest = hashlib.sha256(
+        f'{request.get_full_path()}:{media_type}:{versions!r}'.encode()
+    ).hexdigest()
+
+    return f'{RESPONSE_KEY_PREFIX}:{digest}'
+
+
+def get_response(key):
+    return get_cache().get(key)
+
+
+def set_response(key, response, validators):
+    """
+    Store the rendered `response` with its `(etag, last_modified)`
+    validators.
+    """
+    if response.status_code != 200:
+        return
+
+    get_cache().set(key, {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'validators': validators
+    }, timeout=settings.RESPONSE_CACHE['TIMEOUT'])
@@ -0,0 +1,283 @@
+"""
+Retry policy and circuit breaker for calls to external services.
+"""
+import asyncio
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the service while the circuit breaker is open.
+    `retry_after` is the number of seconds until the next probe is allowed.
+    """
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(
+            f'Circuit "{name}" is open, retry after {retry_after:.1f}s.'
+        )
+
+
+class CircuitBreaker:
+    """
+    Process wide circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and every
+    call fails fast for `reset_timeout` seconds. Then a single probe call is
+    let through (half open): its success closes the circuit, its failure opens
+    it again. `clock` returns the current time in seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._times_opened = 0
+        self._rejected = 0
+
+    def _current_state(self):
+        if (
+                self._state == self.OPEN
+                and self.clock() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def _retry_after(self):
+        if self._opened_at is None:
+            return 0.0
+        return max(
+            self.reset_timeout - (self.clock() - self._opened_at), 0.0
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _rejects_calls(self, state):
+        return state == self.OPEN or (
+            state == self.HALF_OPEN and self._probing
+        )
+
+    def check(self):
+        """
+        Raise `CircuitOpenError` if calls are not allowed right now, without
+        reserving the half open probe.
+        """
+        with self._lock:
+            if self._rejects_calls(self._current_state()):
+                raise CircuitOpenError(self.name, self._retry_after())
+
+    def before_call(self):
+        """
+        Reserve a call. Raises `CircuitOpenError` when the circuit is open or
+        another probe is already in flight.
+        """
+        with self._lock:
+            state = self._current_state()
+            if self._rejects_calls(state):
+                self._rejected += 1
+                raise CircuitOpenError(self.name, self._retry_after())
+            if state == self.HALF_OPEN:
+                self._probing = True
+
+    def cancel_call(self):
+        """
+        Release a call reserved by `before_call()` that didn't reach the
+        service. The state is left as is, a reserved probe can be taken by
+        the next call.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if (
+                    self._state == self.HALF_OPEN
+                    or self._failures >= self.failure_threshold
+            ):
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected,
+                'retry_after': (
+                    round(self._retry_after(), 2) if state == self.OPEN else 0
+                )
+            }
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by a number of attempts and
+    a total deadline per call.
+
+    `is_retryable(error)` decides which errors are retried, anything else is
+    raised right away. When a `breaker` is given every attempt goes through
+    it: retryable errors count as failures of the service, other errors
+    (eg. a 4xx response) as successes. Errors for which
+    `reached_service(error)` is False, eg. a local rate limit timeout, leave
+    the breaker as is.
+
+    `clock` returns the current time in seconds, `sleep` waits between the
+    attempts of `call()`.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0,
+                 deadline=30.0, is_retryable=None, reached_service=None,
+                 breaker=None, clock=time.monotonic, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.is_retryable = is_retryable or (lambda error: True)
+        self.reached_service = reached_service or (lambda error: True)
+        self.breaker = breaker
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('calls', 'attempts', 'retries', 'successes', 'failures',
+             'deadline_exceeded'),
+            0
+        )
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get_delay(self, attempt):
+        """
+        Seconds to wait before the retry following the `attempt`-th attempt
+        (0 based).
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt)
+        )
+
+    def _before_attempt(self):
+        if self.breaker:
+            self.breaker.before_call()
+        self._incr('attempts')
+
+    def _on_success(self):
+        if self.breaker:
+            self.breaker.record_success()
+        self._incr('successes')
+
+    def _on_failure(self, error, attempt, deadline_at):
+        """
+        Return the delay before the next attempt, or None when `error` has
+        to be raised.
+        """
+        retryable = self.is_retryable(error)
+        if self.breaker:
+            if not self.reached_service(error):
+                self.breaker.cancel_call()
+            elif retryable:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+        delay = self.get_delay(attempt)
+        if not retryable or attempt + 1 >= self.max_attempts:
+            self._incr('failures')
+            return None
+        if self.clock() + delay >= deadline_at:
+            self._incr('failures')
+            self._incr('deadline_exceeded')
+            return None
+        self._incr('retries')
+
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call `func(*args, timeout=<seconds left>, **kwargs)` until it
+        succeeds, fails with an error that is not retryable, runs out of
+        attempts or the deadline passes. The last error is raised.
+        """
+        self._incr('calls')
+        deadline_at = self.clock() + self.deadline
+        attempt = 0
+
+        while True:
+            self._before_attempt()
+            try:
+                result = func(
+                    *args, timeout=deadline_at - self.clock(), **kwargs
+                )
+            except Exception as error:
+                delay = self._on_failure(error, attempt, deadline_at)
+                if delay is None:
+                    raise
+                attempt += 1
+                self.sleep(delay)
+            else:
+                self._on_success()
+
+                return result
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        Same as `call()` for a coroutine function, without blocking the event
+        loop between attempts.
+        """
+        self._incr('calls')
+        deadline_at = self.clock() + self.deadline
+        attempt = 0
+
+        while True:
+            self._before_attempt()
+            try:
+                result = await func(
+                    *args, timeout=deadline_at - self.clock(), **kwargs
+                )
+            except Exception as error:
+                delay = self._on_failure(error, attempt, deadline_at)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+            else:
+                self._on_success()
+
+                return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        if self.breaker:
+            stats['circuit_breaker'] = self.breaker.stats()
+
+        return stats
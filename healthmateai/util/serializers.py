@@ -0,0 +1,132 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from healthmateai.util.fields import StoredJSON, decompress_json_text
+from healthmateai.util.renderers import ORJSONRenderer, RawJSON
+from healthmateai.util.response_cache import bump_version
+
+
+class AsyncSaveMixin:
+    """
+    Adds `asave()` to a serializer for the async views. `acreate()` and
+    `aupdate()` run the sync `create()` and `update()` in a thread unless the
+    serializer overrides them.
+    """
+
+    async def asave(self, **kwargs):
+        assert hasattr(self, '_errors'), (
+            'You must call `.is_valid()` before calling `.asave()`.'
+        )
+        assert not self.errors, (
+            'You cannot call `.asave()` on a serializer with invalid data.'
+        )
+
+        validated_data = {**self.validated_data, **kwargs}
+        if self.instance is not None:
+            self.instance = await self.aupdate(self.instance, validated_data)
+        else:
+            self.instance = await self.acreate(validated_data)
+
+        return self.instance
+
+    async def acreate(self, validated_data):
+        return await sync_to_async(self.create)(validated_data)
+
+    async def aupdate(self, instance, validated_data):
+        return await sync_to_async(self.update)(instance, validated_data)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    `many=True` serializer for bulk creation. Invalid items don't fail the
+    whole list, their errors are kept in `item_errors` by index and the valid
+    items are inserted with `bulk_create()` in batches of `batch_size`. Only
+    for serializers of plain model fields, `save()` of the child is not
+    called.
+
+    Set as `list_serializer_class` in the `Meta` of the child serializer.
+    """
+    batch_size = 500
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(
+                input_type=type(data).__name__
+            )
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [message]
+            }, code='not_a_list')
+        if not data:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.error_messages['empty']
+                ]
+            }, code='empty')
+        if self.max_length is not None and len(data) > self.max_length:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.error_messages['max_length'].format(
+                        max_length=self.max_length
+                    )
+                ]
+            }, code='max_length')
+
+        self.item_errors = {}
+        self.valid_indexes = []
+        validated_data = []
+        for index, item in enumerate(data):
+            try:
+                validated_data.append(self.child.run_validation(item))
+            except ValidationError as exc:
+                self.item_errors[index] = exc.detail
+            else:
+                self.valid_indexes.append(index)
+
+        return validated_data
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            instances = model.objects.bulk_create(
+                [model(**attrs) for attrs in validated_data],
+                batch_size=self.batch_size
+            )
+            bump_version(model)
+
+        return instances
+
+
+class StoredJSONField(serializers.JSONField):
+    """
+    Read only `JSONField` for a `CompressedJSONField`. When the response is
+    rendered by `ORJSONRenderer`, a value not decoded yet is output as its
+    stored json text instead of being decoded and encoded again.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def renders_raw_json(self):
+        request = self.context.get('request')
+
+        return isinstance(
+            getattr(request, 'accepted_renderer', None), ORJSONRenderer
+        )
+
+    def get_attribute(self, instance):
+        if len(self.source_attrs) == 1 and self.renders_raw_json():
+            value = instance.__dict__.get(self.source_attrs[0])
+            if isinstance(value, StoredJSON):
+                return value
+
+        return super().get_attribute(instance)
+
+    def to_representation(self, value):
+        if isinstance(value, StoredJSON):
+            return RawJSON(decompress_json_text(value))
+
+        return super().to_representation(value)
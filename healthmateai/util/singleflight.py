@@ -0,0 +1,232 @@
+"""
+Coalescing of identical concurrent calls ("single flight").
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows.
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file, shared by every process of the host.
+    Acquiring gives up after `timeout` seconds and returns False.
+    """
+
+    def __init__(self, path, timeout=60.0, poll_interval=0.05):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+
+        return time.monotonic() + self.timeout
+
+    def _try_lock(self, deadline):
+        """
+        Return True once the lock is taken, False when `deadline` passed and
+        None when it's worth polling again.
+        """
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                os.close(self._fd)
+                self._fd = None
+                return False
+            return None
+
+    def acquire(self):
+        deadline = self._open()
+        while True:
+            locked = self._try_lock(deadline)
+            if locked is not None:
+                return locked
+            time.sleep(self.poll_interval)
+
+    async def aacquire(self):
+        """
+        Same as `acquire()` without blocking the event loop while polling.
+        """
+        deadline = self._open()
+        while True:
+            locked = self._try_lock(deadline)
+            if locked is not None:
+                return locked
+            await asyncio.sleep(self.poll_interval)
+
+    def release(self):
+        if self._fd is None:
+            return
+        # Waiters holding the unlinked file rely on the caller rechecking the
+        # shared result once they get the lock, so removing it is safe.
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Concurrent `do()` calls with the same key wait for the first one and all
+    get its result (or its error) instead of running `func` again.
+
+    With a `lock_dir` the leader of each process also takes a file lock on
+    the key, so the leaders of other processes of the host wait for it. Once
+    they get the lock they call `recheck()` and only run `func` if it returns
+    None; `recheck` typically reads the result from a shared cache.
+
+    `ado()` coalesces coroutine calls of the same event loop and takes the
+    same file locks, its `recheck` is a coroutine function. When the leader
+    is cancelled, one of its waiters takes over instead of being cancelled
+    as well.
+    """
+
+    def __init__(self, lock_dir=None, lock_timeout=60.0):
+        self.lock_dir = lock_dir if fcntl else None
+        self.lock_timeout = lock_timeout
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('calls', 'executed', 'coalesced', 'coalesced_cross_process'), 0
+        )
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key, func, *args, recheck=None, **kwargs):
+        self._incr('calls')
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            self._incr('coalesced')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, func, args, kwargs, recheck)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key, func, *args, recheck=None, **kwargs):
+        """
+        Async variant of `do()` for a coroutine function. Calls are only
+        coalesced within the running event loop.
+        """
+        self._incr('calls')
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        while True:
+            with self._lock:
+                future = self._async_calls.get(flight_key)
+                leader = future is None
+                if leader:
+                    future = self._async_calls[flight_key] = (
+                        loop.create_future()
+                    )
+            if leader:
+                break
+
+            # Unlike awaiting it, `wait()` doesn't cancel the shared future
+            # when this waiter is cancelled.
+            await asyncio.wait((future,))
+            if not future.cancelled():
+                self._incr('coalesced')
+                return future.result()
+
+        try:
+            result = await self._arun(key, func, args, kwargs, recheck)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[flight_key]
+
+    def _get_file_lock(self, key):
+        if self.lock_dir is None:
+            return None
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        name = hashlib.sha256(str(key).encode('utf-8')).hexdigest()
+
+        return FileLock(
+            os.path.join(self.lock_dir, f'{name}.lock'), self.lock_timeout
+        )
+
+    def _run(self, key, func, args, kwargs, recheck):
+        lock = self._get_file_lock(key)
+        locked = lock is not None and lock.acquire()
+        try:
+            if locked and recheck is not None:
+                result = recheck()
+                if result is not None:
+                    self._incr('coalesced_cross_process')
+                    return result
+            self._incr('executed')
+            return func(*args, **kwargs)
+        finally:
+            if locked:
+                lock.release()
+
+    async def _arun(self, key, func, args, kwargs, recheck):
+        lock = self._get_file_lock(key)
+        locked = lock is not None and await lock.aacquire()
+        try:
+            if locked and recheck is not None:
+                result = await recheck()
+                if result is not None:
+                    self._incr('coalesced_cross_process')
+                    return result
+            self._incr('executed')
+            return await func(*args, **kwargs)
+        finally:
+            if locked:
+                lock.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls) + len(self._async_calls)
+
+        return stats
@@ -0,0 +1,19 @@
+"""
+SQLite database backend starting transactions with
+`settings.SQLITE_TRANSACTION_MODE`.
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    With WAL, a deferred transaction that reads and then writes fails right
+    away with "database is locked" when another connection committed in
+    between, `busy_timeout` doesn't apply. `BEGIN IMMEDIATE` takes the write
+    lock upfront, so concurrent `atomic()` blocks wait for each other
+    instead.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {settings.SQLITE_TRANSACTION_MODE}')
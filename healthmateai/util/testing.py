@@ -0,0 +1,26 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin checking that the queries of an endpoint don't grow with
+    the number of returned objects.
+    """
+
+    def get_query_count(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, budget, page_sizes=(1, 5, 15)):
+        """
+        Assert that listing `url` runs `budget` queries for every page size.
+        """
+        for page_size in page_sizes:
+            with self.subTest(page_size=page_size):
+                self.assertEqual(
+                    self.get_query_count(url, page_size=page_size), budget
+                )
@@ -0,0 +1,75 @@
+"""
+Pooled keep-alive HTTP transport shared by all threads of a process.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PooledTransport:
+    """
+    A single `requests.Session` backed by a urllib3 connection pool.
+
+    Sharing one session between threads lets every request reuse an open
+    keep-alive connection instead of paying for a new TCP and TLS handshake.
+    At most `pool_maxsize` connections are kept per host; with `pool_block`
+    threads wait for a free connection instead of opening extra ones.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=16, pool_block=False,
+                 connect_timeout=5.0, read_timeout=60.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def get_timeout(self, deadline=None):
+        """
+        Return the `(connect, read)` timeout tuple for a request that has to
+        finish within `deadline` seconds.
+        """
+        read_timeout = self.read_timeout
+        if deadline is not None:
+            read_timeout = max(min(read_timeout, deadline), 0.001)
+
+        return min(self.connect_timeout, read_timeout), read_timeout
+
+    def stats(self):
+        """
+        Per host connection pool counters. `connections_opened` lower than
+        `requests` means connections are being reused.
+        """
+        pools = []
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            # The pool queue is padded with None for the free slots.
+            idle = [conn for conn in list(pool.pool.queue) if conn] if (
+                pool.pool
+            ) else []
+            pools.append({
+                'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                'requests': pool.num_requests,
+                'connections_opened': pool.num_connections,
+                'idle_connections': len(idle),
+                'max_size': pool.pool.maxsize if pool.pool else 0
+            })
+        total_requests = sum(pool['requests'] for pool in pools)
+        total_opened = sum(pool['connections_opened'] for pool in pools)
+
+        return {
+            'requests': total_requests,
+            'connections_opened': total_opened,
+            'reused_requests': max(total_requests - total_opened, 0),
+            'pools': pools
+        }
+
+    def close(self):
+        self.session.close()
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthmateai.settings')
 
 application = get_wsgi_application()
+
+from text_summarizer.jobs import start_job_sweeper  # noqa: E402
+
+start_job_sweeper()
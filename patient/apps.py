@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class PatientConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patient'
+
+    def ready(self):
+        from healthmateai.util.response_cache import bump_model_version
+        from patient.models import Patient
+
+        post_save.connect(bump_model_version, sender=Patient)
+        post_delete.connect(bump_model_version, sender=Patient)
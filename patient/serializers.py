@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from healthmateai.util.serializers import BulkListSerializer
 from patient.models import Patient
 
 
@@ -7,3 +8,4 @@ class PatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = ('id', 'name', )
+        list_serializer_class = BulkListSerializer
@@ -1,3 +1,132 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from healthmateai.util.testing import QueryBudgetMixin
+from patient.models import Patient
+
+
+class PatientAPITestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = Patient.objects.bulk_create(
+            Patient(name=f'Patient {index}') for index in range(15)
+        )
+
+    def test_list_patients(self):
+        response = self.client.get(reverse('patient:list_create_patient_view'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['count'], 15)
+
+    def test_list_patients_query_budget(self):
+        # count + page
+        self.assertConstantQueries(
+            reverse('patient:list_create_patient_view'), 2
+        )
+
+    def test_retrieve_patient(self):
+        patient = self.patients[0]
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse(
+                'patient:retrieve_patient_view',
+                kwargs={'patient_id': patient.id}
+            ))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {'id': patient.id, 'name': patient.name}
+        )
+
+    def test_retrieve_missing_patient(self):
+        response = self.client.get(reverse(
+            'patient:retrieve_patient_view', kwargs={'patient_id': 0}
+        ))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_create_patients(self):
+        data = [{'name': 'Alice'}, {'name': ''}, {'name': 'Bob'}]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('patient:list_create_patient_view'), data,
+                content_type='application/json'
+            )
+        inserts = [
+            query for query in context.captured_queries
+            if query['sql'].startswith('INSERT')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()['data']
+        self.assertEqual((data['created'], data['failed']), (2, 1))
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['success', 'error', 'success']
+        )
+        self.assertIn('name', data['results'][1]['errors'])
+        created = [data['results'][0]['data'], data['results'][2]['data']]
+        self.assertEqual(
+            list(Patient.objects.filter(
+                id__in=[item['id'] for item in created]
+            ).order_by('id').values('id', 'name')),
+            created
+        )
+
+    def test_bulk_create_invalid_patients(self):
+        response = self.client.post(
+            reverse('patient:list_create_patient_view'), [{'name': ''}],
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data']['created'], 0)
+        self.assertEqual(Patient.objects.count(), 15)
+
+    def test_retrieve_patient_not_modified(self):
+        patient = self.patients[0]
+        url = reverse(
+            'patient:retrieve_patient_view', kwargs={'patient_id': patient.id}
+        )
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        patient.name = 'Renamed'
+        patient.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_patients_not_modified(self):
+        url = reverse('patient:list_create_patient_view')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(
+            self.client.get(url, {'page_size': 5, 'page': 2})['ETag'], etag
+        )
+
+        # Only the fingerprint query, the page is not fetched.
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.patients[0].delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['count'], 14)
+
+    def test_list_patients_no_count_has_no_etag(self):
+        response = self.client.get(
+            reverse('patient:list_create_patient_view'),
+            {'pagination': 'no_count'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
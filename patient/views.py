@@ -1,25 +1,32 @@
 from rest_framework import exceptions
 from rest_framework.permissions import AllowAny
 
-from healthmateai.util.generic_views import ListCreateAPIView, RetrieveAPIView
+from healthmateai.util.generic_views import (
+    AsyncListCreateAPIView, AsyncRetrieveAPIView
+)
 from patient.models import Patient
 from patient.serializers import PatientSerializer
 
 
-class ListCreatePatientAPIView(ListCreateAPIView):
+class ListCreatePatientAPIView(AsyncListCreateAPIView):
+    """
+    POST a single patient or a list of patients to create them in bulk.
+    """
     permission_classes = (AllowAny,)
     serializer_class = PatientSerializer
+    allow_bulk_create = True
+    ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        return Patient.objects.all()
+        return Patient.objects.order_by(*self.ordering)
 
 
-class RetrievePatientAPIView(RetrieveAPIView):
+class RetrievePatientAPIView(AsyncRetrieveAPIView):
     permission_classes = (AllowAny,)
     serializer_class = PatientSerializer
 
-    def get_object(self):
+    async def aget_object(self):
         try:
-            return Patient.objects.get(id=self.kwargs.get('patient_id'))
+            return await Patient.objects.aget(id=self.kwargs.get('patient_id'))
         except Patient.DoesNotExist:
             raise exceptions.NotFound()
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class TextSummarizerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'text_summarizer'
+
+    def ready(self):
+        from healthmateai.util.response_cache import bump_model_version
+        from text_summarizer.backends.openai import configure_openai
+        from text_summarizer.models import SummarizeRequest
+        from text_summarizer.search import index_summary, remove_summary
+
+        configure_openai()
+        post_save.connect(index_summary, sender=SummarizeRequest)
+        post_delete.connect(remove_summary, sender=SummarizeRequest)
+        post_save.connect(bump_model_version, sender=SummarizeRequest)
+        post_delete.connect(bump_model_version, sender=SummarizeRequest)
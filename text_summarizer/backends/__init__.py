@@ -0,0 +1,36 @@
+"""
+Summarizer backends. The backend used for every summary is selected with
+`settings.SUMMARIZER_BACKEND`, an optional
+`settings.SUMMARIZER_FALLBACK_BACKEND` is used while the main one is
+unavailable.
+"""
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def load_backend(path):
+    """
+    Return the process wide instance of the backend class at `path`.
+    """
+    with _backends_lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+
+        return _backends[path]
+
+
+def get_backend():
+    return load_backend(settings.SUMMARIZER_BACKEND)
+
+
+def get_fallback_backend():
+    path = settings.SUMMARIZER_FALLBACK_BACKEND
+    if not path or path == settings.SUMMARIZER_BACKEND:
+        return None
+
+    return load_backend(path)
@@ -0,0 +1,67 @@
+from asgiref.sync import sync_to_async
+
+
+class BaseSummarizerBackend:
+    """
+    Base class for summarizer backends.
+
+    A backend turns a conversation (the `SummarizeRequest.conversation` json)
+    into an html summary listing the patient's problems and the suggested
+    tests. Backends are instantiated once per process and must be thread safe.
+    Errors that mean "try again later" should be raised as
+    `healthmateai.util.exceptions.ServiceUnavailable`, which triggers the
+    fallback backend.
+    """
+    name = None
+
+    def get_cache_params(self):
+        """
+        Return every parameter that changes the generated summary. They are
+        part of the summary cache key.
+        """
+        return {'backend': self.name}
+
+    def check_available(self):
+        """
+        Raise `ServiceUnavailable` if the backend is known to be down.
+        """
+
+    def summarize(self, conversation):
+        raise NotImplementedError(
+            'subclasses of BaseSummarizerBackend must provide a summarize() '
+            'method'
+        )
+
+    async def asummarize(self, conversation):
+        """
+        Async variant of `summarize()`. By default `summarize()` runs in a
+        worker thread, backends with an async client should override it.
+        """
+        return await sync_to_async(
+            self.summarize, thread_sensitive=False
+        )(conversation)
+
+    def reduce(self, summaries):
+        """
+        Merge the summaries of consecutive parts of one conversation into a
+        single summary. Used for conversations too long for a single call.
+        """
+        return ''.join(summaries)
+
+    def update(self, summary, new_turns):
+        """
+        Return `summary` updated with the new turns of its conversation. The
+        cost only depends on the size of the summary and of the new turns.
+        """
+        return self.reduce([summary, self.summarize(new_turns)])
+
+    def stream(self, conversation):
+        """
+        Return an iterator over the chunks of the summary. Errors that prevent
+        the stream from starting must be raised by this call, not while
+        iterating. By default the whole summary is a single chunk.
+        """
+        return iter([self.summarize(conversation)])
+
+    def stats(self):
+        return {'name': self.name}
@@ -0,0 +1,141 @@
+import html
+import re
+
+from text_summarizer.backends.base import BaseSummarizerBackend
+
+TEXT_KEYS = ('text', 'message', 'content', 'utterance', 'body')
+SPEAKER_KEYS = ('speaker', 'role', 'from', 'name', 'author')
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+TEST_RE = re.compile(
+    r'\b(tests?|x-?rays?|mri|ct|scans?|ultrasound|sonograph\w*|ecg|ekg|'
+    r'blood\s+(work|count|sugar|panel)|cbc|biopsy|urine|culture|'
+    r'screening|endoscop\w*|colonoscop\w*|mammogra\w*|echo\w*|lab\w*)\b',
+    re.IGNORECASE
+)
+PROBLEM_RE = re.compile(
+    r'\b(pain\w*|ache\w*|\w+aches?|fever\w*|cough\w*|cold|flu|nause\w*|'
+    r'vomit\w*|dizz\w*|tired\w*|fatigue\w*|weak\w*|swell\w*|rash\w*|'
+    r'bleed\w*|breath\w*|sore\w*|itch\w*|hurt\w*|sick|infect\w*|'
+    r'insomnia|sleep\w*|diarrh\w*|constipat\w*|cramp\w*|numb\w*|'
+    r'suffer\w*|problem\w*|symptom\w*)\b',
+    re.IGNORECASE
+)
+SECTION_RE = re.compile(r'<h3>(.*?)</h3><ul>(.*?)</ul>', re.DOTALL)
+ITEM_RE = re.compile(r'<li>(.*?)</li>', re.DOTALL)
+EMPTY_ITEM = 'None mentioned.'
+MEDICATION_RE = re.compile(
+    r'\b(\d+\s?mg|tablets?|capsules?|pills?|syrup|dose\w*|prescri\w*|'
+    r'medication\w*|medicine\w*|antibiotic\w*)\b',
+    re.IGNORECASE
+)
+
+
+def iter_turns(conversation):
+    """
+    Yield the `(speaker, text)` turns of a conversation. Lists of turns, dicts
+    with a text and a speaker key, `{speaker: text}` dicts and plain strings
+    are supported.
+    """
+    if isinstance(conversation, str):
+        yield '', conversation
+    elif isinstance(conversation, (list, tuple)):
+        for item in conversation:
+            yield from iter_turns(item)
+    elif isinstance(conversation, dict):
+        text_key = next((k for k in TEXT_KEYS if k in conversation), None)
+        if text_key is not None and isinstance(conversation[text_key], str):
+            speaker = next(
+                (
+                    str(conversation[key]) for key in SPEAKER_KEYS
+                    if key in conversation
+                ),
+                ''
+            )
+            yield speaker, conversation[text_key]
+            return
+        for key, value in conversation.items():
+            if isinstance(value, str):
+                yield str(key), value
+            else:
+                yield from iter_turns(value)
+
+
+def _add_unique(items, seen, sentence):
+    key = sentence.lower()
+    if key not in seen:
+        seen.add(key)
+        items.append(sentence)
+
+
+def _render_list(title, items):
+    rows = ''.join(
+        f'<li>{html.escape(item)}</li>' for item in items
+    ) or f'<li>{EMPTY_ITEM}</li>'
+
+    return f'<h3>{title}</h3><ul>{rows}</ul>'
+
+
+def render_summary(problems, tests):
+    return (
+        _render_list("Patient's Problems", problems)
+        + _render_list('Suggested Tests', tests)
+    )
+
+
+class ExtractiveSummarizerBackend(BaseSummarizerBackend):
+    """
+    Offline summarizer that runs in process. It picks the sentences of the
+    conversation that mention a symptom or a test and renders them in the
+    same html shape as the LLM summaries. It is meant for tests, benchmarks
+    and as a low latency fallback, not as a replacement for the model.
+    """
+    name = 'local-extractive'
+    max_items = 10
+
+    def extract(self, conversation):
+        """
+        Return the `(problems, tests)` sentence lists of a conversation.
+        """
+        problems, tests = [], []
+        seen_problems, seen_tests = set(), set()
+        for _, text in iter_turns(conversation):
+            for sentence in SENTENCE_SPLIT_RE.split(text):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                if TEST_RE.search(sentence):
+                    _add_unique(tests, seen_tests, sentence)
+                elif (
+                        PROBLEM_RE.search(sentence)
+                        and not MEDICATION_RE.search(sentence)
+                ):
+                    _add_unique(problems, seen_problems, sentence)
+
+        return problems[:self.max_items], tests[:self.max_items]
+
+    def summarize(self, conversation):
+        return render_summary(*self.extract(conversation))
+
+    def reduce(self, summaries):
+        problems, tests = [], []
+        seen_problems, seen_tests = set(), set()
+        for summary in summaries:
+            for index, (_, rows) in enumerate(SECTION_RE.findall(summary)):
+                items, seen = (
+                    (problems, seen_problems) if index == 0
+                    else (tests, seen_tests)
+                )
+                for item in ITEM_RE.findall(rows):
+                    item = html.unescape(item)
+                    if item != EMPTY_ITEM:
+                        _add_unique(items, seen, item)
+
+        return render_summary(
+            problems[:self.max_items], tests[:self.max_items]
+        )
+
+    def stream(self, conversation):
+        summary = self.summarize(conversation)
+
+        return iter(re.split(r'(?<=</li>)', summary))
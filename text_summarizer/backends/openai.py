@@ -0,0 +1,365 @@
+import asyncio
+import json
+import math
+import threading
+import time
+import weakref
+
+import aiohttp
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from openai import error as openai_error
+from rest_framework.exceptions import ValidationError
+
+from healthmateai.util.exceptions import ServiceUnavailable
+from healthmateai.util.ratelimit import (
+    PriorityRateLimiter, RateLimitTimeout, SharedTokenBucket, get_priority
+)
+from healthmateai.util.retry import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy
+)
+from healthmateai.util.transport import PooledTransport
+from text_summarizer.backends.base import BaseSummarizerBackend
+from text_summarizer.chunking import estimate_tokens
+
+SYSTEM_PROMPT = (
+    "You are a doctor's assistant. List down only the patient's problems and "
+    "any suggested tests by the doctor. Moreover ignore the medication. "
+    "Please provide the the response in html format"
+)
+REDUCE_PROMPT = (
+    "You are a doctor's assistant. You are given the summaries of "
+    "consecutive parts of one conversation between a doctor and a patient. "
+    "Merge them into a single list of the patient's problems and any "
+    "suggested tests by the doctor, without duplicates. Moreover ignore the "
+    "medication. Please provide the the response in html format"
+)
+UPDATE_PROMPT = (
+    "You are a doctor's assistant. You are given the current html summary of "
+    "a conversation between a doctor and a patient and the new part of that "
+    "conversation. Return the summary updated with the patient's problems and "
+    "any suggested tests by the doctor from the new part, without "
+    "duplicates. Moreover ignore the medication. Please provide the the "
+    "response in html format"
+)
+
+_transport = None
+_transport_lock = threading.Lock()
+_aiohttp_sessions = weakref.WeakKeyDictionary()
+
+
+def get_transport():
+    """
+    Return the process wide HTTP transport of the OpenAI client, configured
+    by `settings.OPENAI_TRANSPORT`.
+    """
+    global _transport
+
+    with _transport_lock:
+        if _transport is None:
+            options = settings.OPENAI_TRANSPORT
+            _transport = PooledTransport(
+                pool_maxsize=options['POOL_MAXSIZE'],
+                pool_block=options['POOL_BLOCK'],
+                connect_timeout=options['CONNECT_TIMEOUT'],
+                read_timeout=options['READ_TIMEOUT']
+            )
+
+    return _transport
+
+
+def get_aiohttp_session():
+    """
+    Return the keep-alive aiohttp session of the running event loop, used by
+    the async calls of the OpenAI client.
+    """
+    loop = asyncio.get_running_loop()
+    session = _aiohttp_sessions.get(loop)
+    if session is None or session.closed:
+        session = _aiohttp_sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.OPENAI_TRANSPORT['POOL_MAXSIZE']
+            )
+        )
+
+    return session
+
+
+def get_rate_limiter():
+    """
+    Return a limiter for `settings.OPENAI_RATE_LIMIT`, or None when rate
+    limiting is disabled.
+    """
+    options = settings.OPENAI_RATE_LIMIT
+    if not options['ENABLED']:
+        return None
+
+    return PriorityRateLimiter(
+        SharedTokenBucket(
+            {
+                'requests': options['REQUESTS_PER_MINUTE'],
+                'tokens': options['TOKENS_PER_MINUTE']
+            },
+            path=options['STATE_FILE']
+        )
+    )
+
+
+def configure_openai():
+    """
+    Configure the OpenAI client once at startup. All threads share the pooled
+    session instead of openai's per thread sessions.
+    """
+    openai.api_key = settings.OPENAI_API_KEY
+    openai.requestssession = get_transport().session
+
+
+def is_retryable(error):
+    """
+    Only errors caused by the upstream being slow, overloaded or unreachable
+    are worth retrying. Invalid requests or credentials are not.
+    """
+    if isinstance(error, (
+            openai_error.Timeout,
+            openai_error.APIConnectionError,
+            openai_error.RateLimitError,
+            openai_error.ServiceUnavailableError,
+            openai_error.TryAgain
+    )):
+        return True
+
+    return (
+        isinstance(error, openai_error.APIError)
+        and (error.http_status or 500) >= 500
+    )
+
+
+def reached_upstream(error):
+    """
+    Whether `error` was raised for a call sent to the upstream, as opposed to
+    eg. a rate limit wait that timed out before sending it.
+    """
+    return isinstance(error, (openai_error.OpenAIError, ValidationError))
+
+
+class OpenAISummarizerBackend(BaseSummarizerBackend):
+    """
+    Summarizes with the OpenAI chat completion API. Calls go through a
+    process wide retry policy and circuit breaker configured by
+    `settings.SUMMARIZER_RETRY` and `settings.SUMMARIZER_CIRCUIT_BREAKER`.
+    """
+    name = 'openai'
+    system_prompt = SYSTEM_PROMPT
+    reduce_prompt = REDUCE_PROMPT
+    update_prompt = UPDATE_PROMPT
+    model = 'gpt-3.5-turbo'
+    max_tokens = 100
+    reduce_max_tokens = 300
+    temperature = 0.7
+
+    def __init__(self):
+        retry = settings.SUMMARIZER_RETRY
+        breaker = settings.SUMMARIZER_CIRCUIT_BREAKER
+        self.retry_policy = RetryPolicy(
+            max_attempts=retry['MAX_ATTEMPTS'],
+            base_delay=retry['BASE_DELAY'],
+            max_delay=retry['MAX_DELAY'],
+            deadline=retry['DEADLINE'],
+            is_retryable=is_retryable,
+            reached_service=reached_upstream,
+            breaker=CircuitBreaker(
+                'openai',
+                failure_threshold=breaker['FAILURE_THRESHOLD'],
+                reset_timeout=breaker['RESET_TIMEOUT']
+            )
+        )
+        self.rate_limiter = get_rate_limiter()
+
+    def get_cache_params(self):
+        return {
+            'system_prompt': self.system_prompt,
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature,
+            'reduce_prompt': self.reduce_prompt,
+            'reduce_max_tokens': self.reduce_max_tokens
+        }
+
+    def build_messages(self, conversation, system_prompt=None):
+        """
+        Return the chat messages used to summarize a conversation.
+        """
+        return [
+            {
+                'role': 'system',
+                'content': system_prompt or self.system_prompt
+            },
+            {
+                'role': 'user',
+                'content': json.dumps(conversation)
+            }
+        ]
+
+    def _unavailable(self, error):
+        wait = getattr(error, 'retry_after', None) or getattr(error, 'wait', 1)
+
+        return ServiceUnavailable(
+            'The summarization service is temporarily unavailable.',
+            wait=max(math.ceil(wait), 1)
+        )
+
+    def check_available(self):
+        try:
+            self.retry_policy.breaker.check()
+        except CircuitOpenError as e:
+            raise self._unavailable(e)
+
+    def _wait_for_rate_limit(self, messages, max_tokens, timeout):
+        """
+        Wait for our share of the requests and tokens per minute quota and
+        return what is left of `timeout`. Every attempt, retries included, is
+        counted.
+        """
+        if self.rate_limiter is None:
+            return timeout
+        started_at = time.monotonic()
+        self.rate_limiter.acquire(
+            {'requests': 1, 'tokens': estimate_tokens(messages) + max_tokens},
+            priority=get_priority(),
+            timeout=timeout
+        )
+
+        return timeout - (time.monotonic() - started_at)
+
+    def _chat_completion(self, messages, timeout, stream=False,
+                         max_tokens=None):
+        max_tokens = max_tokens or self.max_tokens
+        timeout = self._wait_for_rate_limit(messages, max_tokens, timeout)
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            request_timeout=get_transport().get_timeout(timeout),
+            stream=stream
+        )
+        if stream or (response and response.choices):
+            return response
+        else:
+            raise ValidationError('Error occurred during API request.')
+
+    async def _achat_completion(self, messages, timeout, max_tokens=None):
+        max_tokens = max_tokens or self.max_tokens
+        timeout = await sync_to_async(
+            self._wait_for_rate_limit, thread_sensitive=False
+        )(messages, max_tokens, timeout)
+        openai.aiosession.set(get_aiohttp_session())
+        response = await openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            request_timeout=get_transport().get_timeout(timeout)
+        )
+        if response and response.choices:
+            return response
+        else:
+            raise ValidationError('Error occurred during API request.')
+
+    def _translate_error(self, error):
+        """
+        Return the error to raise for a failed upstream call. Open circuit,
+        rate limiting and exhausted retries become a 503.
+        """
+        if isinstance(error, (CircuitOpenError, RateLimitTimeout)):
+            return self._unavailable(error)
+        if isinstance(error, openai_error.OpenAIError) and is_retryable(error):
+            return ServiceUnavailable(
+                'The summarization service did not respond in time.'
+            )
+
+        return error
+
+    def _chat_gpt_api_call(self, messages, stream=False, max_tokens=None):
+        try:
+            return self.retry_policy.call(
+                self._chat_completion, messages, stream=stream,
+                max_tokens=max_tokens
+            )
+        except Exception as e:
+            error = self._translate_error(e)
+            if error is e:
+                raise
+            raise error from e
+
+    async def _achat_gpt_api_call(self, messages, max_tokens=None):
+        try:
+            return await self.retry_policy.acall(
+                self._achat_completion, messages, max_tokens=max_tokens
+            )
+        except Exception as e:
+            error = self._translate_error(e)
+            if error is e:
+                raise
+            raise error from e
+
+    def summarize(self, conversation):
+        response = self._chat_gpt_api_call(self.build_messages(conversation))
+
+        return response.choices[0].message['content']
+
+    async def asummarize(self, conversation):
+        response = await self._achat_gpt_api_call(
+            self.build_messages(conversation)
+        )
+
+        return response.choices[0].message['content']
+
+    def reduce(self, summaries):
+        response = self._chat_gpt_api_call(
+            self.build_messages(summaries, self.reduce_prompt),
+            max_tokens=self.reduce_max_tokens
+        )
+
+        return response.choices[0].message['content']
+
+    def update(self, summary, new_turns):
+        response = self._chat_gpt_api_call(
+            self.build_messages(
+                {'summary': summary, 'new_conversation': new_turns},
+                self.update_prompt
+            ),
+            max_tokens=self.reduce_max_tokens
+        )
+
+        return response.choices[0].message['content']
+
+    def stream(self, conversation):
+        # Only opening the stream is retried, a stream that breaks after the
+        # first token is reported to the client as is.
+        response = self._chat_gpt_api_call(
+            self.build_messages(conversation), stream=True
+        )
+
+        return self._iter_chunks(response)
+
+    def _iter_chunks(self, response):
+        try:
+            for chunk in response:
+                if chunk.choices:
+                    content = chunk.choices[0].delta.get('content')
+                    if content:
+                        yield content
+        finally:
+            response.close()
+
+    def stats(self):
+        return {
+            'name': self.name,
+            **self.retry_policy.stats(),
+            'transport': get_transport().stats(),
+            'rate_limiter': (
+                self.rate_limiter.stats() if self.rate_limiter else None
+            )
+        }
@@ -0,0 +1,67 @@
+"""
+Batch summarization: the upstream calls of a batch are fanned out to a
+bounded, process wide thread pool so the wall time of a batch is close to the
+slowest call instead of the sum of all calls.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from healthmateai.util.ratelimit import BATCH, priority
+from text_summarizer.summarizer import get_cache_key, summarize_conversation
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SUMMARIZE_BATCH_CONCURRENCY,
+                thread_name_prefix='summarize-batch'
+            )
+
+    return _executor
+
+
+def _summarize_in_thread(conversation, use_cache):
+    close_old_connections()
+    try:
+        # Batch calls give way to interactive ones when rate limited.
+        with priority(BATCH):
+            return summarize_conversation(conversation, use_cache=use_cache)
+    finally:
+        close_old_connections()
+
+
+def summarize_many(conversations, use_cache=True, executor=None):
+    """
+    Summarize the conversations concurrently. Returns a list in the same order
+    holding either the summary or the exception raised for that conversation.
+    Identical conversations are only summarized once. Runs on the process
+    wide pool unless another `executor` is given.
+    """
+    executor = executor or get_executor()
+    futures = {}
+    keys = []
+    for conversation in conversations:
+        key = get_cache_key(conversation)
+        keys.append(key)
+        if key not in futures:
+            futures[key] = executor.submit(
+                _summarize_in_thread, conversation, use_cache
+            )
+
+    results = []
+    for key in keys:
+        try:
+            results.append(futures[key].result())
+        except Exception as e:
+            results.append(e)
+
+    return results
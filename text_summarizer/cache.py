@@ -0,0 +1,201 @@
+"""
+Two tier cache for generated summaries.
+
+Entries are keyed by a hash of the canonical conversation json and every
+parameter that changes the model output, so resubmitting a conversation does
+not call the upstream API again. The first tier is a per process LRU, the
+second one is the `SummaryCacheEntry` table shared by all workers.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from text_summarizer.models import SummaryCacheEntry
+
+
+def make_cache_key(conversation, **params):
+    """
+    Return the sha256 hex digest of the canonical json of the conversation
+    and the model parameters (prompt, model, max_tokens, ...).
+    """
+    payload = json.dumps(
+        {'conversation': conversation, 'params': params},
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False
+    )
+
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def request_bypasses_cache(request):
+    """
+    A request can skip the cache lookup by sending `Cache-Control: no-cache`.
+    The fresh summary is still stored in the cache.
+    """
+    if request is None:
+        return False
+    cache_control = request.headers.get('Cache-Control', '')
+
+    return 'no-cache' in cache_control.lower()
+
+
+class LRUCache:
+    """
+    Thread safe in memory LRU with a per entry time to live.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SummaryCache:
+    """
+    Memory LRU in front of the `SummaryCacheEntry` table. Options are read
+    from `settings.SUMMARY_CACHE`.
+    """
+
+    def __init__(self):
+        self.memory = LRUCache(
+            self.options['MEMORY_MAX_ENTRIES'], self.options['TIMEOUT']
+        )
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ('memory_hits', 'db_hits', 'misses', 'sets'), 0
+        )
+
+    @property
+    def options(self):
+        return settings.SUMMARY_CACHE
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+            return self._counters[name]
+
+    def get(self, key, since=None):
+        """
+        Return the cached summary or None. With `since` only a summary stored
+        at or after that time is returned, it is read from the table as the
+        memory tier doesn't know when the other workers stored their
+        entries.
+        """
+        if not self.enabled:
+            return None
+
+        if since is None:
+            value = self.memory.get(key)
+            if value is not None:
+                self._incr('memory_hits')
+                return value
+
+        entries = SummaryCacheEntry.objects.filter(
+            key=key, expires_at__gt=timezone.now()
+        )
+        if since is not None:
+            entries = entries.filter(updated_at__gte=since)
+        value = entries.values_list('summarize', flat=True).first()
+        if value is not None:
+            self._incr('db_hits')
+            self.memory.set(key, value)
+            return value
+
+        self._incr('misses')
+
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+
+        self.memory.set(key, value)
+        SummaryCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'summarize': value,
+                'expires_at': (
+                    timezone.now() + timedelta(seconds=self.options['TIMEOUT'])
+                )
+            }
+        )
+        if self._incr('sets') % self.options['CULL_INTERVAL'] == 0:
+            self.cull()
+
+    def cull(self):
+        """
+        Delete expired rows and, if the table is still larger than
+        `DB_MAX_ENTRIES`, the rows closest to expiring.
+        """
+        SummaryCacheEntry.objects.filter(
+            expires_at__lte=timezone.now()
+        ).delete()
+        excess = (
+            SummaryCacheEntry.objects.count() - self.options['DB_MAX_ENTRIES']
+        )
+        if excess > 0:
+            ids = SummaryCacheEntry.objects.order_by(
+                'expires_at'
+            ).values_list('id', flat=True)[:excess]
+            SummaryCacheEntry.objects.filter(id__in=list(ids)).delete()
+
+    def clear(self):
+        self.memory.clear()
+        SummaryCacheEntry.objects.all().delete()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters['memory_hits'] + counters['db_hits']
+        lookups = hits + counters['misses']
+        counters.update({
+            'enabled': self.enabled,
+            'hits': hits,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'memory_entries': len(self.memory)
+        })
+
+        return counters
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,73 @@
+"""
+Helpers to split long conversations into chunks that fit the model context.
+"""
+import json
+
+# Rough average for English text with the OpenAI tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(value):
+    """
+    Cheap estimate of the number of tokens the json of `value` takes.
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value)
+
+    return len(value) // CHARS_PER_TOKEN + 1
+
+
+def get_turns(conversation):
+    """
+    Return the turns of a conversation as a list. A dict is split into one
+    dict per key and a string into its lines, lists are already turns.
+    """
+    if isinstance(conversation, list):
+        return conversation
+    if isinstance(conversation, dict):
+        return [{key: value} for key, value in conversation.items()]
+    if isinstance(conversation, str):
+        return conversation.splitlines(keepends=True)
+
+    return [conversation]
+
+
+def split_conversation(conversation, chunk_tokens):
+    """
+    Split the conversation on turn boundaries into chunks of at most
+    `chunk_tokens` estimated tokens. A single turn larger than that becomes a
+    chunk on its own. Chunks keep the container type of the conversation.
+    """
+    chunks, chunk, size = [], [], 0
+    for turn in get_turns(conversation):
+        turn_tokens = estimate_tokens(turn)
+        if chunk and size + turn_tokens > chunk_tokens:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(turn)
+        size += turn_tokens
+    if chunk:
+        chunks.append(chunk)
+
+    if isinstance(conversation, dict):
+        return [
+            {key: value for turn in chunk for key, value in turn.items()}
+            for chunk in chunks
+        ]
+    if isinstance(conversation, str):
+        return [''.join(chunk) for chunk in chunks]
+
+    return chunks
+
+
+def extend_conversation(conversation, new_turns):
+    """
+    Return the conversation with `new_turns` appended. Conversations that are
+    not both lists or both strings are converted to lists of turns.
+    """
+    if isinstance(conversation, str) and isinstance(new_turns, str):
+        if conversation and not conversation.endswith('\n'):
+            conversation += '\n'
+        return conversation + new_turns
+
+    return get_turns(conversation) + get_turns(new_turns)
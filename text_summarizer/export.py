@@ -0,0 +1,121 @@
+"""
+NDJSON and CSV export of summaries. Rows are fetched with a chunked iterator
+and rendered one at a time, memory doesn't grow with the number of rows.
+"""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from text_summarizer.models import SummarizeRequest
+
+EXPORT_FIELDS = (
+    'id',
+    'patient_id',
+    'status',
+    'summarize',
+    'conversation',
+    'created_at',
+    'updated_at'
+)
+
+
+def get_export_queryset(patient=None, created_after=None,
+                        created_before=None):
+    """
+    Return the summaries to export in chronological order, filtered by
+    patient id and by a `[created_after, created_before)` range.
+    """
+    queryset = SummarizeRequest.objects.order_by('created_at', 'id')
+    if patient is not None:
+        queryset = queryset.filter(patient_id=patient)
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gte=created_after)
+    if created_before is not None:
+        queryset = queryset.filter(created_at__lt=created_before)
+
+    return queryset
+
+
+def get_row(summary):
+    return {name: getattr(summary, name) for name in EXPORT_FIELDS}
+
+
+class NDJSONFormat:
+    content_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def header(self):
+        return None
+
+    def render(self, summary):
+        return json.dumps(get_row(summary), cls=DjangoJSONEncoder) + '\n'
+
+
+class CSVFormat:
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def write(self, values):
+        self.writer.writerow(values)
+        line = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+        return line
+
+    def header(self):
+        return self.write(EXPORT_FIELDS)
+
+    def render(self, summary):
+        row = get_row(summary)
+        row['conversation'] = json.dumps(
+            row['conversation'], cls=DjangoJSONEncoder
+        )
+        row['created_at'] = row['created_at'].isoformat()
+        row['updated_at'] = row['updated_at'].isoformat()
+
+        return self.write(row.values())
+
+
+EXPORT_FORMATS = {
+    'ndjson': NDJSONFormat,
+    'csv': CSVFormat
+}
+
+
+def iter_export(queryset, export_format, chunk_size=None):
+    """
+    Yield the lines of the export of `queryset`.
+    """
+    export_format = EXPORT_FORMATS[export_format]()
+    header = export_format.header()
+    if header:
+        yield header
+
+    for summary in queryset.iterator(
+            chunk_size=chunk_size or settings.SUMMARIZE_EXPORT_CHUNK_SIZE
+    ):
+        yield export_format.render(summary)
+
+
+async def aiter_export(queryset, export_format, chunk_size=None):
+    """
+    Async variant of `iter_export()`. The chunks are fetched in a thread, so
+    the export can be streamed by the ASGI server.
+    """
+    export_format = EXPORT_FORMATS[export_format]()
+    header = export_format.header()
+    if header:
+        yield header
+
+    async for summary in queryset.aiterator(
+            chunk_size=chunk_size or settings.SUMMARIZE_EXPORT_CHUNK_SIZE
+    ):
+        yield export_format.render(summary)
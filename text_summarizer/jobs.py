@@ -0,0 +1,220 @@
+"""
+Background execution of summarize jobs.
+
+A job is a `SummarizeRequest` row in the pending state, so no broker is
+needed: jobs are either run by an in-process thread pool once the creating
+transaction commits (`SUMMARIZE_JOB_RUNNER = 'thread'`) or picked up from the
+database by the `run_summarize_jobs` management command
+(`SUMMARIZE_JOB_RUNNER = 'queue'`). With the thread pool, a sweeper thread
+started with the server (see `start_job_sweeper()`) also runs the jobs lost
+with a previous process.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from healthmateai.util.response_cache import bump_version
+from text_summarizer.models import SummarizeRequest
+from text_summarizer.summarizer import summarize_conversation
+
+logger = getLogger('django')
+
+Status = SummarizeRequest.Status
+
+_executor = None
+_executor_lock = threading.Lock()
+# Ids of the jobs submitted to the thread pool of this process and not done.
+_submitted = set()
+_sweeper = None
+
+
+def get_executor():
+    """
+    Return the process wide thread pool used by the 'thread' job runner.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SUMMARIZE_JOB_WORKERS,
+                thread_name_prefix='summarize-job'
+            )
+
+    return _executor
+
+
+def enqueue_job(job):
+    """
+    Schedule a pending job. With the 'queue' runner the row itself is the
+    queue entry and nothing else has to be done.
+    """
+    if settings.SUMMARIZE_JOB_RUNNER == 'thread':
+        transaction.on_commit(lambda: submit_job(job.id))
+
+
+def submit_job(job_id):
+    """
+    Submit a job to the thread pool unless it is already waiting or running
+    in it. Returns True when submitted.
+    """
+    with _executor_lock:
+        if job_id in _submitted:
+            return False
+        _submitted.add(job_id)
+    get_executor().submit(run_job_in_thread, job_id)
+
+    return True
+
+
+def claim_job(job_id):
+    """
+    Atomically move a job from pending to running. Returns False when another
+    worker already claimed it.
+    """
+    claimed = SummarizeRequest.objects.filter(
+        id=job_id, status=Status.PENDING
+    ).update(status=Status.RUNNING, updated_at=timezone.now()) == 1
+    if claimed:
+        bump_version(SummarizeRequest)
+
+    return claimed
+
+
+def claim_next_job():
+    """
+    Claim the oldest pending job and return its id, or None if the queue is
+    empty.
+    """
+    pending_ids = SummarizeRequest.objects.filter(
+        status=Status.PENDING
+    ).order_by('id').values_list('id', flat=True)
+
+    for job_id in pending_ids[:10]:
+        if claim_job(job_id):
+            return job_id
+
+    return None
+
+
+def requeue_stale_jobs(stale_after=None):
+    """
+    Move jobs that have been running for longer than `stale_after` seconds
+    (eg. their worker died) back to pending. Returns the number of jobs.
+    """
+    stale_after = stale_after or settings.SUMMARIZE_JOB_STALE_AFTER
+    threshold = timezone.now() - timedelta(seconds=stale_after)
+
+    requeued = SummarizeRequest.objects.filter(
+        status=Status.RUNNING, updated_at__lt=threshold
+    ).update(status=Status.PENDING, updated_at=timezone.now())
+    if requeued:
+        bump_version(SummarizeRequest)
+
+    return requeued
+
+
+def run_job(job_id):
+    """
+    Summarize an already claimed job and store the result or the error.
+    """
+    job = SummarizeRequest.objects.get(id=job_id)
+
+    try:
+        # The cache was looked up when the job was created, only a summary
+        # stored since then (eg. by an identical job) can be used. The
+        # lookup also makes identical jobs of other workers wait for each
+        # other instead of calling the upstream twice.
+        job.summarize = summarize_conversation(
+            job.conversation, since=job.created_at
+        )
+    except Exception as e:
+        logger.exception('Summarize job %s failed.', job_id)
+        job.status = Status.FAILED
+        job.error = str(e) or e.__class__.__name__
+    else:
+        job.status = Status.DONE
+        job.error = ''
+    job.save(update_fields=['summarize', 'status', 'error', 'updated_at'])
+
+    return job
+
+
+def process_job(job_id):
+    """
+    Claim and run a single job. Returns the job or None if it was already
+    claimed by another worker.
+    """
+    if claim_job(job_id):
+        return run_job(job_id)
+
+    return None
+
+
+def run_job_in_thread(job_id):
+    close_old_connections()
+    try:
+        return process_job(job_id)
+    finally:
+        close_old_connections()
+        with _executor_lock:
+            _submitted.discard(job_id)
+
+
+def sweep_jobs():
+    """
+    Requeue the stale jobs and submit the pending ones to the thread pool,
+    eg. the jobs of a process that died before running them. A job submitted
+    by several processes is still run once, see `claim_job()`. Returns the
+    number of jobs submitted.
+    """
+    requeue_stale_jobs()
+    pending_ids = SummarizeRequest.objects.filter(
+        status=Status.PENDING
+    ).order_by('id').values_list('id', flat=True)
+
+    return sum(submit_job(job_id) for job_id in pending_ids)
+
+
+def _sweep_forever(interval):
+    while True:
+        close_old_connections()
+        try:
+            submitted = sweep_jobs()
+            if submitted:
+                logger.info(
+                    'Submitted %s pending summarize job(s).', submitted
+                )
+        except Exception:
+            logger.exception('Sweeping the summarize jobs failed.')
+        finally:
+            close_old_connections()
+        time.sleep(interval)
+
+
+def start_job_sweeper():
+    """
+    Start the thread running `sweep_jobs()` now and every
+    `SUMMARIZE_JOB_SWEEP_INTERVAL` seconds, once per process. Only with the
+    'thread' runner, the `run_summarize_jobs` command does the same for the
+    'queue' runner.
+    """
+    global _sweeper
+
+    interval = settings.SUMMARIZE_JOB_SWEEP_INTERVAL
+    if settings.SUMMARIZE_JOB_RUNNER != 'thread' or not interval:
+        return
+
+    with _executor_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(
+                target=_sweep_forever, args=(interval,),
+                name='summarize-job-sweeper', daemon=True
+            )
+            _sweeper.start()
@@ -0,0 +1,93 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from healthmateai.util.fields import compress_json, decompress_json
+from text_summarizer.models import SummarizeRequest
+
+SAMPLE_TURNS = (
+    {'doctor': 'How are you feeling today?'},
+    {'patient': 'I have had a headache and a mild fever since Monday.'},
+    {'doctor': 'Any cough, sore throat or trouble breathing?'},
+    {'patient': 'A dry cough at night, no trouble breathing.'},
+    {'doctor': 'Are you taking any medication for the fever?'},
+    {'patient': 'Paracetamol twice a day, it helps for a few hours.'},
+    {'doctor': "Let's do a complete blood count and a chest x-ray."},
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the size reduction and the encode/decode cost of the '
+        'compressed conversation storage, on stored conversations or on '
+        'generated ones when the table is empty.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sample', type=int, default=200,
+            help='Number of conversations to measure.'
+        )
+        parser.add_argument(
+            '--turns', type=int, default=60,
+            help='Turns of a generated conversation.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Times every conversation is encoded and decoded.'
+        )
+
+    def get_conversations(self, options):
+        conversations = [
+            summary.conversation for summary in
+            SummarizeRequest.objects.order_by('-id').only('conversation')[
+                :options['sample']
+            ]
+        ]
+        if conversations:
+            return conversations, 'stored'
+
+        return [
+            random.choices(SAMPLE_TURNS, k=options['turns'])
+            for _ in range(options['sample'])
+        ], 'generated'
+
+    def measure(self, func, values, repeat):
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            results = [func(value) for value in values]
+
+        elapsed = time.perf_counter() - started_at
+        return results, elapsed / (repeat * len(values)) * 1000000
+
+    def handle(self, *args, **options):
+        conversations, source = self.get_conversations(options)
+        compression = settings.COMPRESSED_FIELDS
+        repeat = options['repeat']
+
+        plain, plain_write = self.measure(
+            compress_json, conversations, repeat
+        )
+        packed, packed_write = self.measure(
+            lambda value: compress_json(
+                value, level=compression['LEVEL'],
+                min_size=compression['MIN_SIZE']
+            ),
+            conversations, repeat
+        )
+        _, plain_read = self.measure(json.loads, plain, repeat)
+        _, packed_read = self.measure(decompress_json, packed, repeat)
+
+        plain_size = sum(len(data) for data in plain)
+        packed_size = sum(len(data) for data in packed)
+        self.stdout.write(
+            f'{len(conversations)} {source} conversation(s), zlib level '
+            f'{compression["LEVEL"]}, min size {compression["MIN_SIZE"]}\n'
+            f'size:  {plain_size} -> {packed_size} bytes '
+            f'({packed_size / plain_size:.1%})\n'
+            f'write: {plain_write:.1f} -> {packed_write:.1f} us/row\n'
+            f'read:  {plain_read:.1f} -> {packed_read:.1f} us/row'
+        )
@@ -0,0 +1,116 @@
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from healthmateai.util.compression import get_encodings
+from healthmateai.util.renderers import ORJSONRenderer
+from text_summarizer.management.commands import (
+    benchmark_conversation_compression
+)
+from text_summarizer.models import SummarizeRequest
+from text_summarizer.views import ListCreateSummarizeAPIView
+
+# `(name, renderer, encoding)`, the first one is the setup before orjson and
+# compression.
+SETUPS = (
+    ('json', JSONRenderer, None),
+    ('orjson', ORJSONRenderer, None),
+    ('orjson+gzip', ORJSONRenderer, 'gzip'),
+    ('orjson+br', ORJSONRenderer, 'br'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the bytes and the milliseconds per summary list page of '
+        "DRF's JSONRenderer and of ORJSONRenderer, uncompressed and "
+        'compressed. Conversations are generated in a transaction that is '
+        'rolled back when there are not enough stored summaries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size', type=int, default=50,
+            help='Summaries per page.'
+        )
+        parser.add_argument(
+            '--turns', type=int, default=60,
+            help='Turns of a generated conversation.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Times every page is rendered.'
+        )
+
+    def get_page(self, renderer_class, encoding, page_size):
+        view = ListCreateSummarizeAPIView.as_view(
+            renderer_classes=(renderer_class,)
+        )
+        request = RequestFactory().get(
+            reverse('text_summarizer:list_create_summarize_view'),
+            {'page_size': page_size}
+        )
+        response = async_to_sync(view)(request)
+        content = response.render().content
+        if encoding is not None:
+            content = get_encodings()[encoding].compress(content)
+
+        return content
+
+    def measure(self, renderer_class, encoding, options):
+        started_at = time.perf_counter()
+        for _ in range(options['repeat']):
+            content = self.get_page(
+                renderer_class, encoding, options['page_size']
+            )
+
+        elapsed = time.perf_counter() - started_at
+        return len(content), elapsed / options['repeat'] * 1000
+
+    def handle(self, *args, **options):
+        if options['page_size'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--page-size and --repeat must be positive.')
+
+        encodings = get_encodings()
+        with transaction.atomic():
+            missing = options['page_size'] - SummarizeRequest.objects.count()
+            if missing > 0:
+                SummarizeRequest.objects.bulk_create(
+                    SummarizeRequest(
+                        conversation=random.choices(
+                            benchmark_conversation_compression.SAMPLE_TURNS,
+                            k=options['turns']
+                        ),
+                        summarize='<h3>Suggested Tests</h3><ul><li>CBC</li>'
+                                  '</ul>'
+                    )
+                    for _ in range(missing)
+                )
+
+            results = []
+            for name, renderer_class, encoding in SETUPS:
+                if encoding is not None and encoding not in encodings:
+                    self.stdout.write(f'{name}: skipped, not installed.')
+                    continue
+                results.append(
+                    (name, *self.measure(renderer_class, encoding, options))
+                )
+
+            transaction.set_rollback(True)
+
+        base_size, base_ms = results[0][1:]
+        self.stdout.write(
+            f'Page of {options["page_size"]} summaries, '
+            f'{options["repeat"]} renders per setup'
+        )
+        for name, size, ms in results:
+            self.stdout.write(
+                f'{name:<12} {size:>9} bytes ({size / base_size:>6.1%})  '
+                f'{ms:>7.2f} ms/page ({ms / base_ms:>6.1%})'
+            )
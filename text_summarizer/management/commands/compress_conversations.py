@@ -0,0 +1,85 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from healthmateai.util.fields import is_compressed
+from text_summarizer.models import SummarizeRequest
+
+
+class Command(BaseCommand):
+    help = (
+        'Compress the conversations stored before compression was enabled. '
+        'Rows are rewritten in batches by id and can be compressed while the '
+        'app is running, a row changed in the meantime is skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows read and rewritten per transaction.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to wait between batches to limit the load.'
+        )
+        parser.add_argument(
+            '--start-id', type=int, default=0,
+            help='Only compress rows with a larger id, to resume a run.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report the size reduction without writing.'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.COMPRESSED_FIELDS['ENABLED']:
+            raise CommandError(
+                'Compression is disabled, see COMPRESSED_FIELDS_ENABLED.'
+            )
+
+        field = SummarizeRequest._meta.get_field('conversation')
+        last_id = options['start_id']
+        scanned = compressed = size_before = size_after = 0
+        while True:
+            rows = list(
+                SummarizeRequest.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'conversation')[:options['batch_size']]
+            )
+            if not rows:
+                break
+
+            with transaction.atomic():
+                for summary_id, stored in rows:
+                    scanned += 1
+                    if is_compressed(stored):
+                        continue
+                    value = field.to_python(stored)
+                    packed = field.get_prep_value(value)
+                    if not is_compressed(packed):
+                        continue
+                    size_before += len(stored)
+                    size_after += len(packed)
+                    if options['dry_run']:
+                        compressed += 1
+                        continue
+                    # Only rewrite the row if it still holds what was read.
+                    compressed += SummarizeRequest.objects.filter(
+                        id=summary_id, conversation=stored
+                    ).update(conversation=value)
+
+            last_id = rows[-1][0]
+            self.stdout.write(
+                f'Up to id {last_id}: scanned {scanned}, '
+                f'compressed {compressed}.'
+            )
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        ratio = size_after / size_before if size_before else 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Compressed {compressed} of {scanned} conversation(s), '
+            f'{size_before} -> {size_after} bytes ({ratio:.1%}).'
+        ))
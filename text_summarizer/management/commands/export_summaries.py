@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from text_summarizer.export import (
+    EXPORT_FORMATS, get_export_queryset, iter_export
+)
+
+
+def datetime_argument(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Export summaries as NDJSON or CSV, for a patient and/or a creation '
+        'date range. Rows are read in chunks, so any number of rows can be '
+        'exported with flat memory use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', dest='export_format', choices=list(EXPORT_FORMATS),
+            default='ndjson'
+        )
+        parser.add_argument('--patient', type=int, help='Patient id.')
+        parser.add_argument(
+            '--created-after', type=datetime_argument,
+            help='Only summaries created at or after this ISO 8601 date.'
+        )
+        parser.add_argument(
+            '--created-before', type=datetime_argument,
+            help='Only summaries created before this ISO 8601 date.'
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write to, the standard output by default.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.SUMMARIZE_EXPORT_CHUNK_SIZE,
+            help='Rows fetched per database round trip.'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive.')
+
+        queryset = get_export_queryset(
+            patient=options['patient'],
+            created_after=options['created_after'],
+            created_before=options['created_before']
+        )
+        export_format = options['export_format']
+        lines = iter_export(queryset, export_format, options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        # Don't count the header line.
+        rows = -1 if EXPORT_FORMATS[export_format]().header() else 0
+        with open(
+                options['output'], 'w', newline='', encoding='utf-8'
+        ) as output:
+            for line in lines:
+                output.write(line)
+                rows += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {rows} summaries to {options["output"]}.'
+        ))
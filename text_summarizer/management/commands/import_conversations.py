@@ -0,0 +1,196 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from healthmateai.util.response_cache import bump_version
+from patient.models import Patient
+from text_summarizer.batch import summarize_many
+from text_summarizer.cache import summary_cache
+from text_summarizer.models import ImportCheckpoint, SummarizeRequest
+from text_summarizer.search import index_summaries
+from text_summarizer.serializers import SummarizeBatchItemSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Import conversations from a JSONL file of '
+        '`{"conversation": ..., "patient": <id>}` lines, summarizing them on '
+        'a worker pool. The import can be stopped and resumed at any time, '
+        'rows of finished batches are not summarized again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Path of the JSONL file.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Lines summarized and inserted per transaction.'
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            default=settings.SUMMARIZE_BATCH_CONCURRENCY,
+            help='Number of conversations summarized concurrently.'
+        )
+        parser.add_argument(
+            '--errors',
+            help='JSONL file the failed lines are appended to, '
+                 '<input>.errors by default.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Forget the progress of the previous runs and import from '
+                 'the first line.'
+        )
+
+    def read_batches(self, file, batch_size):
+        """
+        Yield lists of `(line number, line)` and the offset after them.
+        """
+        batch = []
+        for raw in iter(file.readline, b''):
+            self.checkpoint.line += 1
+            if raw.strip():
+                batch.append((self.checkpoint.line, raw))
+            if len(batch) >= batch_size:
+                yield batch, file.tell()
+                batch = []
+        if batch:
+            yield batch, file.tell()
+
+    def validate(self, batch):
+        """
+        Return `(items, errors)` dicts keyed by line number. Patients are
+        resolved with one query per batch.
+        """
+        items, errors = {}, {}
+        for line, raw in batch:
+            try:
+                data = json.loads(raw)
+            except ValueError as e:
+                errors[line] = {'line': [f'Invalid JSON: {e}']}
+                continue
+            serializer = SummarizeBatchItemSerializer(data=data)
+            if serializer.is_valid():
+                items[line] = dict(serializer.validated_data)
+            else:
+                errors[line] = serializer.errors
+
+        patients = Patient.objects.in_bulk(
+            {item['patient'] for item in items.values()}
+        )
+        for line, item in list(items.items()):
+            try:
+                item['patient'] = patients[item['patient']]
+            except KeyError:
+                errors[line] = {'patient': ['Invalid patient.']}
+                del items[line]
+
+        return items, errors
+
+    def import_batch(self, batch, offset, executor, errors_file):
+        """
+        Summarize and insert a batch. The errors are written first, the rows
+        and the checkpoint are saved in one transaction: a run stopped at
+        any point resumes after the last inserted batch, without duplicate
+        rows or error lines.
+        """
+        items, errors = self.validate(batch)
+        self.summarized += len(items)
+        summaries = summarize_many(
+            [item['conversation'] for item in items.values()],
+            executor=executor
+        )
+
+        instances = []
+        for (line, item), summary in zip(items.items(), summaries):
+            if isinstance(summary, Exception):
+                errors[line] = {
+                    'detail': str(getattr(summary, 'detail', None) or summary)
+                }
+            else:
+                instances.append(SummarizeRequest(summarize=summary, **item))
+
+        for line, error in sorted(errors.items()):
+            errors_file.write(
+                json.dumps({'line': line, 'errors': error}).encode() + b'\n'
+            )
+        errors_file.flush()
+        os.fsync(errors_file.fileno())
+
+        checkpoint = self.checkpoint
+        with transaction.atomic():
+            SummarizeRequest.objects.bulk_create(instances, batch_size=500)
+            index_summaries(instances)
+            bump_version(SummarizeRequest)
+            checkpoint.offset = offset
+            checkpoint.created += len(instances)
+            checkpoint.failed += len(errors)
+            checkpoint.errors_offset = errors_file.tell()
+            checkpoint.save()
+
+    def handle(self, *args, **options):
+        input_path = os.path.abspath(options['input'])
+        if options['batch_size'] <= 0 or options['workers'] <= 0:
+            raise CommandError('--batch-size and --workers must be positive.')
+
+        self.checkpoint, new = ImportCheckpoint.objects.get_or_create(
+            input=input_path
+        )
+        errors_path = options['errors'] or f'{input_path}.errors'
+        errors_size = (
+            os.path.getsize(errors_path) if os.path.exists(errors_path) else 0
+        )
+        if options['restart'] or new:
+            self.checkpoint.offset = self.checkpoint.line = 0
+            self.checkpoint.created = self.checkpoint.failed = 0
+            self.checkpoint.errors_offset = errors_size
+            self.checkpoint.save()
+        else:
+            self.stdout.write(
+                f'Resuming after line {self.checkpoint.line}: '
+                f'{self.checkpoint.created} created, '
+                f'{self.checkpoint.failed} failed.'
+            )
+
+        started_at = time.monotonic()
+        sets_before = summary_cache.stats()['sets']
+        rows = self.summarized = 0
+        with open(input_path, 'rb') as file, \
+                open(errors_path, 'ab') as errors_file, \
+                ThreadPoolExecutor(
+                    max_workers=options['workers'],
+                    thread_name_prefix='summarize-import'
+                ) as executor:
+            # Drop the errors of a batch that wasn't committed.
+            if errors_size > self.checkpoint.errors_offset:
+                errors_file.truncate(self.checkpoint.errors_offset)
+                errors_file.seek(0, os.SEEK_END)
+            file.seek(self.checkpoint.offset)
+            for batch, offset in self.read_batches(
+                    file, options['batch_size']
+            ):
+                self.import_batch(batch, offset, executor, errors_file)
+
+                rows += len(batch)
+                elapsed = time.monotonic() - started_at
+                # Summaries computed in this run, cache hits excluded.
+                calls = (
+                    summary_cache.stats()['sets'] - sets_before
+                    if summary_cache.enabled else self.summarized
+                )
+                self.stdout.write(
+                    f'Line {self.checkpoint.line}: '
+                    f'{self.checkpoint.created} created, '
+                    f'{self.checkpoint.failed} failed, '
+                    f'{rows / elapsed:.1f} rows/s, '
+                    f'{calls / elapsed:.1f} LLM calls/s'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.checkpoint.created} conversation(s), '
+            f'{self.checkpoint.failed} failed (see {errors_path}).'
+        ))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from text_summarizer.models import SummarizeRequest
+from text_summarizer.search import index_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        'Add the summaries to the full-text search index, eg. the ones stored '
+        'before the index existed. Rows are indexed in batches by id and '
+        'already indexed rows are overwritten, so it can run while the app '
+        'is running.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows read and indexed per transaction.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to wait between batches to limit the load.'
+        )
+        parser.add_argument(
+            '--start-id', type=int, default=0,
+            help='Only index rows with a larger id, to resume a run.'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+
+        last_id = options['start_id']
+        indexed = 0
+        while True:
+            summaries = list(
+                SummarizeRequest.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'summarize', 'conversation')[
+                    :options['batch_size']
+                ]
+            )
+            if not summaries:
+                break
+
+            with transaction.atomic():
+                index_summaries(summaries)
+            indexed += len(summaries)
+            last_id = summaries[-1].id
+            self.stdout.write(f'Up to id {last_id}: indexed {indexed}.')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {indexed} summaries.'
+        ))
@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from text_summarizer.jobs import claim_next_job, requeue_stale_jobs, run_job
+
+
+def _run_claimed_job(job_id):
+    close_old_connections()
+    try:
+        return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = (
+        'Run pending summarize jobs from the database. Several runners can '
+        'share the same database, each job is claimed by exactly one of them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.SUMMARIZE_JOB_WORKERS,
+            help='Number of jobs summarized concurrently.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait before polling an empty queue again.'
+        )
+        parser.add_argument(
+            '--stale-after', type=int,
+            default=settings.SUMMARIZE_JOB_STALE_AFTER,
+            help='Requeue jobs that are running for longer than this many '
+                 'seconds.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling forever.'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s).')
+
+        running = set()
+        processed = 0
+        with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='summarize-job'
+        ) as executor:
+            while True:
+                for future in [f for f in running if f.done()]:
+                    running.discard(future)
+                    job = future.result()
+                    processed += 1
+                    self.stdout.write(f'Job {job.id}: {job.status}')
+
+                job_id = claim_next_job() if len(running) < workers else None
+                if job_id is not None:
+                    running.add(executor.submit(_run_claimed_job, job_id))
+                    continue
+
+                if options['once'] and not running:
+                    break
+                time.sleep(options['poll_interval'] if not running else 0.1)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {processed} job(s).')
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('text_summarizer', '0002_summarizerequest_patient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summarizerequest',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='summarizerequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='done', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='summarizerequest',
+            name='summarize',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
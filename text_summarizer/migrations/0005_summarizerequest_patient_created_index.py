@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('text_summarizer', '0004_summarycacheentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='summarizerequest',
+            index=models.Index(fields=['patient', 'created_at', 'id'], name='summary_patient_created_idx'),
+        ),
+    ]
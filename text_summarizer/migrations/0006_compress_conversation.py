@@ -0,0 +1,125 @@
+from django.db import migrations, models
+
+import healthmateai.util.fields
+
+TABLE = 'text_summarizer_summarizerequest'
+ZLIB_HEADER = b'z1:'
+BATCH_SIZE = 500
+
+# jsonb can't be altered to bytea without a conversion, the rows keep their
+# json as plain utf-8, see `CompressedJSONField`. The table is rewritten by
+# one statement, which the statement timeout of the app must not cancel.
+POSTGRES_TO_BINARY = (
+    'SET LOCAL statement_timeout = 0',
+    f'ALTER TABLE {TABLE} ALTER COLUMN conversation TYPE bytea '
+    "USING convert_to(conversation::text, 'UTF8')",
+)
+POSTGRES_TO_JSON = (
+    'SET LOCAL statement_timeout = 0',
+    f'ALTER TABLE {TABLE} ALTER COLUMN conversation TYPE jsonb '
+    "USING convert_from(conversation, 'UTF8')::jsonb",
+)
+# SQLite copies the json text as is into the binary column.
+SQLITE_TO_BINARY = (
+    f'UPDATE {TABLE} SET conversation = CAST(conversation AS BLOB) '
+    "WHERE typeof(conversation) = 'text'"
+)
+SQLITE_TO_TEXT = (
+    f'UPDATE {TABLE} SET conversation = CAST(conversation AS TEXT) '
+    "WHERE typeof(conversation) = 'blob'"
+)
+
+
+def get_fields(apps):
+    model = apps.get_model('text_summarizer', 'SummarizeRequest')
+    json_field = models.JSONField()
+    binary_field = healthmateai.util.fields.CompressedJSONField()
+    for field in (json_field, binary_field):
+        field.set_attributes_from_name('conversation')
+        field.model = model
+
+    return model, json_field, binary_field
+
+
+def decompress_conversations(schema_editor):
+    """
+    Store the compressed conversations as plain json again, in batches by
+    id.
+    """
+    connection = schema_editor.connection
+    last_id = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                f'SELECT id, conversation FROM {TABLE} WHERE id > %s '
+                f'ORDER BY id LIMIT {BATCH_SIZE}', [last_id]
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            for summary_id, data in rows:
+                data = bytes(data)
+                if data.startswith(ZLIB_HEADER):
+                    cursor.execute(
+                        f'UPDATE {TABLE} SET conversation = %s WHERE id = %s',
+                        [
+                            healthmateai.util.fields.decompress_json_text(
+                                data
+                            ).encode(),
+                            summary_id
+                        ]
+                    )
+            last_id = rows[-1][0]
+
+
+def to_binary(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_TO_BINARY:
+            schema_editor.execute(sql)
+        return
+
+    schema_editor.alter_field(*get_fields(apps))
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_TO_BINARY)
+
+
+def to_json(apps, schema_editor):
+    decompress_conversations(schema_editor)
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_TO_JSON:
+            schema_editor.execute(sql)
+        return
+
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_TO_TEXT)
+    model, json_field, binary_field = get_fields(apps)
+    schema_editor.alter_field(model, binary_field, json_field)
+
+
+class Migration(migrations.Migration):
+    """
+    Move the conversations from a json column to a binary column, in one
+    pass. The rows keep their plain json until `compress_conversations`
+    compresses them in batches.
+    """
+
+    dependencies = [
+        ('text_summarizer', '0005_summarizerequest_patient_created_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(to_binary, to_json),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='summarizerequest',
+                    name='conversation',
+                    field=healthmateai.util.fields.CompressedJSONField(),
+                ),
+            ],
+        ),
+    ]
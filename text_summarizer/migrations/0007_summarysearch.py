@@ -0,0 +1,46 @@
+from django.db import migrations
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE text_summarizer_summarysearch USING fts5("
+    "summarize, conversation, "
+    "tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+
+POSTGRES_CREATE = (
+    'CREATE TABLE text_summarizer_summarysearch ('
+    'summary_id bigint PRIMARY KEY '
+    'REFERENCES text_summarizer_summarizerequest (id) '
+    'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+    'document tsvector NOT NULL)',
+    'CREATE INDEX text_summarizer_summarysearch_document_idx '
+    'ON text_summarizer_summarysearch USING GIN (document)'
+)
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_CREATE:
+            schema_editor.execute(sql)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE text_summarizer_summarysearch')
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index of the summaries, see `text_summarizer.search`. Existing
+    summaries are indexed by the `rebuild_search_index` command.
+    """
+
+    dependencies = [
+        ('text_summarizer', '0006_compress_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -1,12 +1,60 @@
 from django.db import models
 
 from healthmateai.models import DateModel
+from healthmateai.util.fields import CompressedJSONField
 from patient.models import Patient
 
 
 class SummarizeRequest(DateModel):
-    conversation = models.JSONField()
-    summarize = models.TextField()
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    conversation = CompressedJSONField()
+    summarize = models.TextField(blank=True, default='')
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.DONE,
+        db_index=True
+    )
+    error = models.TextField(blank=True, default='')
     patient = models.ForeignKey(
         Patient, on_delete=models.CASCADE, null=True, blank=True
     )
+
+    class Meta:
+        # Per patient history in the `(-created_at, -id)` order of the
+        # summary lists. The global list uses the `created_at` index.
+        indexes = [
+            models.Index(
+                fields=['patient', 'created_at', 'id'],
+                name='summary_patient_created_idx'
+            )
+        ]
+
+
+class SummaryCacheEntry(DateModel):
+    """
+    Persistent tier of the summary cache, see `text_summarizer.cache`.
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    summarize = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class ImportCheckpoint(DateModel):
+    """
+    Progress of an `import_conversations` run of the `input` file, saved in
+    the transaction of every imported batch. `offset` is the byte offset of
+    the first line not imported yet, `errors_offset` the size of the errors
+    file once the errors of the imported lines were written.
+    """
+
+    input = models.TextField(unique=True)
+    offset = models.BigIntegerField(default=0)
+    line = models.BigIntegerField(default=0)
+    created = models.BigIntegerField(default=0)
+    failed = models.BigIntegerField(default=0)
+    errors_offset = models.BigIntegerField(default=0)
@@ -0,0 +1,220 @@
+"""
+Full-text search over summaries and conversations. The index is a table of
+its own, a FTS5 table on SQLite and a table of `tsvector`s with a GIN index
+on PostgreSQL, see migration 0007. It is written from Python because the
+conversation column is stored compressed:
+
+- `post_save` of a `SummarizeRequest` indexes it, see `TextSummarizerConfig`,
+- code writing summaries with `bulk_create()` or `update()` calls
+  `index_summaries()`,
+- deleted summaries are removed by `post_delete` (and a foreign key cascade
+  on PostgreSQL).
+
+Summaries written before the index existed are indexed by the
+`rebuild_search_index` command.
+"""
+import html
+import re
+
+from django.db import connections
+
+from text_summarizer.backends.local import iter_turns
+
+SEARCH_TABLE = 'text_summarizer_summarysearch'
+SUMMARY_TABLE = 'text_summarizer_summarizerequest'
+
+# `"a phrase"`, `-excluded`, `OR` and plain words, as in a web search box.
+QUERY_TERM_RE = re.compile(r'(-?)"([^"]*)"?|(\S+)')
+WORD_RE = re.compile(r'\w+')
+TAG_RE = re.compile(r'<[^>]*>')
+
+
+def get_document(summary):
+    """
+    Return the `(summary, conversation)` text of a summary to index.
+    """
+    conversation = '\n'.join(
+        text for _, text in iter_turns(summary.conversation)
+    )
+
+    # Tags are replaced with spaces, `<li>MRI</li><li>CT</li>` is two words.
+    text = html.unescape(TAG_RE.sub(' ', summary.summarize or ''))
+
+    return text, conversation
+
+
+class SQLiteSearchBackend:
+    # The summary ranks above the conversation.
+    rank_sql = f'-bm25({SEARCH_TABLE}, 2.0, 1.0)'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, summaries):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SEARCH_TABLE} '
+                f'(rowid, summarize, conversation) VALUES (%s, %s, %s)',
+                [(summary.id, *get_document(summary)) for summary in summaries]
+            )
+
+    def remove(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                [(summary_id,) for summary_id in ids]
+            )
+
+    def parse_query(self, query):
+        """
+        Translate a web search style query to a FTS5 query. Every term is
+        quoted, so user input can't be a FTS5 syntax error. Return None when
+        there is nothing to search for.
+        """
+        terms, excluded = [], []
+        for negate, phrase, word in QUERY_TERM_RE.findall(query):
+            if word == 'OR':
+                if terms and terms[-1] != 'OR':
+                    terms.append('OR')
+                continue
+            if word.startswith('-') and len(word) > 1:
+                negate, phrase = '-', word[1:]
+            tokens = WORD_RE.findall(phrase or word)
+            if not tokens:
+                continue
+            term = '"{}"'.format(' '.join(tokens))
+            (excluded if negate else terms).append(term)
+
+        if terms and terms[-1] == 'OR':
+            terms.pop()
+        if not terms:
+            return None
+
+        fts_query = ' '.join(terms)
+        if excluded:
+            fts_query = f'({fts_query}) NOT ({" OR ".join(excluded)})'
+
+        return fts_query
+
+    def search(self, queryset, query):
+        fts_query = self.parse_query(query)
+        if fts_query is None:
+            return None
+
+        return queryset.extra(
+            select={'rank': self.rank_sql},
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.rowid = {SUMMARY_TABLE}.id',
+                f'{SEARCH_TABLE} MATCH %s'
+            ],
+            params=[fts_query]
+        )
+
+
+class PostgresSearchBackend:
+    config = 'english'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, summaries):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (summary_id, document) VALUES '
+                f'(%s, setweight(to_tsvector(%s::regconfig, %s), \'A\') || '
+                f'setweight(to_tsvector(%s::regconfig, %s), \'B\')) '
+                f'ON CONFLICT (summary_id) DO UPDATE '
+                f'SET document = EXCLUDED.document',
+                [
+                    (summary.id, self.config, text, self.config, conversation)
+                    for summary in summaries
+                    for text, conversation in [get_document(summary)]
+                ]
+            )
+
+    def remove(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE summary_id = ANY(%s)',
+                [list(ids)]
+            )
+
+    def search(self, queryset, query):
+        if not WORD_RE.search(query):
+            return None
+
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        return queryset.extra(
+            select={
+                'rank': f'ts_rank({SEARCH_TABLE}.document, {tsquery})'
+            },
+            select_params=[self.config, query],
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.summary_id = {SUMMARY_TABLE}.id',
+                f'{SEARCH_TABLE}.document @@ {tsquery}'
+            ],
+            params=[self.config, query]
+        )
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend
+}
+
+
+def get_search_backend(using='default'):
+    connection = connections[using]
+
+    return SEARCH_BACKENDS[connection.vendor](connection)
+
+
+def index_summaries(summaries, using='default'):
+    """
+    Add or update the summaries in the search index.
+    """
+    summaries = [summary for summary in summaries if summary.id is not None]
+    if summaries:
+        get_search_backend(using).index(summaries)
+
+
+def remove_summaries(ids, using='default'):
+    ids = list(ids)
+    if ids:
+        get_search_backend(using).remove(ids)
+
+
+def search_summaries(queryset, query):
+    """
+    Filter `queryset` to the summaries matching `query` and annotate them
+    with a `rank`, higher is more relevant. The query supports
+    `"quoted phrases"`, `OR` and `-excluded` terms.
+    """
+    results = get_search_backend(queryset.db).search(queryset, query)
+    if results is None:
+        # Nothing to search for, still annotated so it can be ordered.
+        return queryset.extra(select={'rank': '0'}).none()
+
+    return results
+
+
+def index_summary(sender, instance, created, update_fields=None, using=None,
+                  **kwargs):
+    """
+    `post_save` receiver of `SummarizeRequest`.
+    """
+    if update_fields is not None and not (
+            {'summarize', 'conversation'} & set(update_fields)
+    ):
+        return
+
+    index_summaries([instance], using=using or 'default')
+
+
+def remove_summary(sender, instance, using=None, **kwargs):
+    """
+    `post_delete` receiver of `SummarizeRequest`.
+    """
+    remove_summaries([instance.id], using=using or 'default')
@@ -1,15 +1,27 @@
-import json
-
-import openai
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from healthmateai.util.exceptions import Conflict
+from healthmateai.util.response_cache import bump_version
+from healthmateai.util.serializers import AsyncSaveMixin, StoredJSONField
 from patient.models import Patient
 from patient.serializers import PatientSerializer
+from text_summarizer.cache import request_bypasses_cache
+from text_summarizer.chunking import extend_conversation
+from text_summarizer.export import EXPORT_FORMATS
+from text_summarizer.jobs import enqueue_job
 from text_summarizer.models import SummarizeRequest
+from text_summarizer.search import index_summaries
+from text_summarizer.summarizer import (
+    asummarize_conversation, check_upstream_available, get_cached_summary,
+    summarize_conversation, update_summary
+)
 
 
 class TextSummarizerSerializer(serializers.ModelSerializer):
+    conversation = StoredJSONField()
     patient = PatientSerializer(allow_null=True, read_only=True)
 
     class Meta:
@@ -38,7 +50,26 @@ class PatientTextSummarizeSerializer(TextSummarizerSerializer):
         read_only_fields = fields
 
 
-class CreateTextSummarizerSerializer(serializers.ModelSerializer):
+class SummarizeJobSerializer(serializers.ModelSerializer):
+    patient = PatientSerializer(allow_null=True, read_only=True)
+
+    class Meta:
+        model = SummarizeRequest
+        fields = (
+            'id',
+            'status',
+            'error',
+            'summarize',
+            'created_at',
+            'updated_at',
+            'patient'
+        )
+        read_only_fields = fields
+
+
+class CreateTextSummarizerSerializer(AsyncSaveMixin,
+                                     serializers.ModelSerializer):
+    conversation = serializers.JSONField()
     patient = serializers.IntegerField(write_only=True)
 
     class Meta:
@@ -51,46 +82,130 @@ class CreateTextSummarizerSerializer(serializers.ModelSerializer):
         except Patient.DoesNotExist:
             raise ValidationError('Invalid patient.')
 
-    def _chat_gpt_api_call(self, messages, count=0):
-        try:
-            response = openai.ChatCompletion.create(
-                model='gpt-3.5-turbo',
-                messages=messages,
-                max_tokens=100,
-                temperature=0.7
+    @property
+    def use_cache(self):
+        return not request_bypasses_cache(self.context.get('request'))
+
+    def create(self, validated_data):
+        validated_data['summarize'] = summarize_conversation(
+            validated_data['conversation'], use_cache=self.use_cache
+        )
+
+        return super().create(validated_data)
+
+    async def acreate(self, validated_data):
+        validated_data['summarize'] = await asummarize_conversation(
+            validated_data['conversation'], use_cache=self.use_cache
+        )
+
+        return await SummarizeRequest.objects.acreate(**validated_data)
+
+
+class AppendTextSummarizerSerializer(serializers.ModelSerializer):
+    """
+    Appends new turns to the conversation of an existing summary. The summary
+    is updated from the previous summary and the new turns only.
+    """
+    conversation = serializers.JSONField()
+
+    class Meta:
+        model = SummarizeRequest
+        fields = ('conversation',)
+
+    def validate(self, attrs):
+        if self.instance.status != SummarizeRequest.Status.DONE:
+            raise ValidationError('Only finished summaries can be extended.')
+
+        return attrs
+
+    def update(self, instance, validated_data):
+        new_turns = validated_data['conversation']
+        summarize = update_summary(instance.summarize, new_turns)
+        conversation = extend_conversation(instance.conversation, new_turns)
+        updated_at = timezone.now()
+
+        # The instance may have been extended by another request during the
+        # LLM call, only save if it is still the version we read.
+        with transaction.atomic():
+            updated = SummarizeRequest.objects.filter(
+                id=instance.id, updated_at=instance.updated_at
+            ).update(
+                conversation=conversation,
+                summarize=summarize,
+                updated_at=updated_at
             )
-            if response and response.choices:
-                return response
-            else:
-                raise ValidationError('Error occurred during API request.')
-        except Exception as e:
-            if count < 3:
-                return self._chat_gpt_api_call(messages, count+1)
-            raise e
+            if not updated:
+                raise Conflict(
+                    'The conversation was extended by another request, '
+                    'please retry.'
+                )
+            instance.conversation = conversation
+            instance.summarize = summarize
+            instance.updated_at = updated_at
+            index_summaries([instance])
+            bump_version(SummarizeRequest)
+
+        return instance
+
+
+class SummarizeBatchItemSerializer(serializers.Serializer):
+    """
+    A single item of a batch. Patients are resolved for the whole batch at
+    once by the view, so the id is only checked for its type here.
+    """
+    conversation = serializers.JSONField()
+    patient = serializers.IntegerField()
+
+
+class SummarizeExportSerializer(serializers.Serializer):
+    """
+    Query params of the summary export.
+    """
+    export_format = serializers.ChoiceField(
+        choices=list(EXPORT_FORMATS), default='ndjson'
+    )
+    patient = serializers.IntegerField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+
+class SummarizeSearchSerializer(serializers.Serializer):
+    """
+    Query params of the summary search.
+    """
+    q = serializers.CharField(max_length=256)
+    patient = serializers.IntegerField(required=False)
+
+
+class SummarizeSearchResultSerializer(TextSummarizerSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(TextSummarizerSerializer.Meta):
+        fields = (*TextSummarizerSerializer.Meta.fields, 'rank')
+        read_only_fields = fields
+
+
+class CreateSummarizeJobSerializer(CreateTextSummarizerSerializer):
+    """
+    Stores the request as a pending job instead of calling the LLM inside the
+    request. A cached summary completes the job right away.
+    """
 
     def create(self, validated_data):
-        try:
-            convs = validated_data['conversation']
-            messages = [
-                {
-                    'role': 'system',
-                    'content': "You are a doctor's assistant. List down only the "
-                               "patient's problems and any suggested tests "
-                               "by the doctor. Moreover ignore the medication. "
-                               "Please provide the the response in html format"
-                },
-                {
-                    'role': 'user',
-                    'content': json.dumps(convs)
-                }
-            ]
-            response = self._chat_gpt_api_call(messages)
-
-            if response and response.choices:
-                validated_data['summarize'] = response.choices[0].message['content']
-
-                return super().create(validated_data)
-            else:
-                raise ValidationError('Error occurred during API request.')
-        except ValidationError as e:
-            raise e
+        summary = get_cached_summary(
+            validated_data['conversation']
+        ) if self.use_cache else None
+        if summary is not None:
+            validated_data['summarize'] = summary
+            return serializers.ModelSerializer.create(self, validated_data)
+
+        # Don't queue jobs behind an upstream that is known to be down.
+        check_upstream_available()
+        validated_data['status'] = SummarizeRequest.Status.PENDING
+        job = serializers.ModelSerializer.create(self, validated_data)
+        enqueue_job(job)
+
+        return job
+
+    async def acreate(self, validated_data):
+        return await AsyncSaveMixin.acreate(self, validated_data)
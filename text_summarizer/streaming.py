@@ -0,0 +1,80 @@
+"""
+Server-Sent Events stream of a summary while it is being generated.
+
+The stream is an async generator so that, served through
+`healthmateai.asgi`, tokens are forwarded to the client as soon as the
+upstream produces them without holding a worker thread between tokens.
+"""
+import asyncio
+from logging import getLogger
+
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import APIException
+
+from healthmateai.util.renderers import sse_event
+from text_summarizer.cache import summary_cache
+from text_summarizer.models import SummarizeRequest
+from text_summarizer.serializers import TextSummarizerSerializer
+from text_summarizer.summarizer import (
+    get_cache_key, get_cached_summary, open_summary_stream
+)
+
+logger = getLogger('django')
+
+
+async def summary_event_stream(validated_data, use_cache=True):
+    """
+    Yield `token` events with the summary chunks, then store the
+    `SummarizeRequest` and yield a `done` event with it. Failures are sent as
+    an `error` event. When the client disconnects, the generator is cancelled
+    by `CancelOnDisconnectMiddleware` of `healthmateai.asgi`: the upstream
+    stream is closed and nothing is stored.
+    """
+    conversation = validated_data['conversation']
+    chunks = None
+    try:
+        summary = await sync_to_async(get_cached_summary)(
+            conversation
+        ) if use_cache else None
+        if summary is not None:
+            yield sse_event('token', {'content': summary})
+        else:
+            backend, chunks = await sync_to_async(
+                open_summary_stream, thread_sensitive=False
+            )(conversation)
+            parts = []
+            while True:
+                chunk = await sync_to_async(
+                    next, thread_sensitive=False
+                )(chunks, None)
+                if chunk is None:
+                    break
+                parts.append(chunk)
+                yield sse_event('token', {'content': chunk})
+            summary = ''.join(parts)
+            await sync_to_async(summary_cache.set)(
+                get_cache_key(conversation, backend), summary
+            )
+
+        instance = await SummarizeRequest.objects.acreate(
+            summarize=summary, **validated_data
+        )
+        yield sse_event('done', TextSummarizerSerializer(instance).data)
+    except (asyncio.CancelledError, GeneratorExit):
+        logger.info('Summary stream closed by the client.')
+        raise
+    except APIException as e:
+        yield sse_event('error', {'detail': e.detail})
+    except Exception:
+        logger.exception('Summary stream failed.')
+        yield sse_event(
+            'error', {'detail': 'Error occurred during API request.'}
+        )
+    finally:
+        if chunks is not None and hasattr(chunks, 'close'):
+            try:
+                chunks.close()
+            except ValueError:
+                # Still running in a worker thread, it is closed when the
+                # pending read returns and the generator is collected.
+                pass
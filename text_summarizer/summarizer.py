@@ -0,0 +1,235 @@
+"""
+Summarization entry points shared by the request serializers and the job
+runner. They put the summary cache in front of the configured backend and
+switch to the fallback backend while the main one is unavailable.
+
+Conversations longer than `SUMMARIZER_LONG_CONVERSATION['THRESHOLD_TOKENS']`
+are summarized with a map-reduce pipeline: the conversation is split on turn
+boundaries, the chunks are summarized concurrently and the partial summaries
+are merged by the backend.
+
+Identical summaries requested concurrently are coalesced into a single
+backend call, within the process and, through file locks, across the worker
+processes of the host.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from healthmateai.util.exceptions import ServiceUnavailable
+from healthmateai.util.singleflight import SingleFlight
+from text_summarizer.backends import get_backend, get_fallback_backend
+from text_summarizer.cache import make_cache_key, summary_cache
+from text_summarizer.chunking import estimate_tokens, split_conversation
+
+_chunk_executor = None
+_chunk_executor_lock = threading.Lock()
+
+summary_flight = SingleFlight(
+    lock_dir=settings.SUMMARIZE_SINGLE_FLIGHT['LOCK_DIR'],
+    lock_timeout=settings.SUMMARIZE_SINGLE_FLIGHT['LOCK_TIMEOUT']
+)
+
+
+def get_chunk_executor():
+    global _chunk_executor
+
+    options = settings.SUMMARIZER_LONG_CONVERSATION
+    with _chunk_executor_lock:
+        if _chunk_executor is None:
+            _chunk_executor = ThreadPoolExecutor(
+                max_workers=options['CONCURRENCY'],
+                thread_name_prefix='summarize-chunk'
+            )
+
+    return _chunk_executor
+
+
+def is_long_conversation(conversation):
+    return estimate_tokens(conversation) > (
+        settings.SUMMARIZER_LONG_CONVERSATION['THRESHOLD_TOKENS']
+    )
+
+
+def get_cache_key(conversation, backend=None):
+    backend = backend or get_backend()
+    params = backend.get_cache_params()
+    if is_long_conversation(conversation):
+        params['chunk_tokens'] = (
+            settings.SUMMARIZER_LONG_CONVERSATION['CHUNK_TOKENS']
+        )
+
+    return make_cache_key(conversation, **params)
+
+
+def get_cached_summary(conversation):
+    """
+    Return the cached summary of the conversation or None.
+    """
+    return summary_cache.get(get_cache_key(conversation))
+
+
+def check_upstream_available():
+    """
+    Raise a 503 `ServiceUnavailable` if the backend is down and there is no
+    fallback backend.
+    """
+    if get_fallback_backend() is None:
+        get_backend().check_available()
+
+
+def map_reduce_summarize(backend, conversation):
+    """
+    Summarize the chunks of a long conversation concurrently and merge them.
+    """
+    chunks = split_conversation(
+        conversation, settings.SUMMARIZER_LONG_CONVERSATION['CHUNK_TOKENS']
+    )
+    if len(chunks) == 1:
+        return backend.summarize(conversation)
+
+    # Chunks inherit the context (eg. the rate limiting priority) of the
+    # caller.
+    context = contextvars.copy_context()
+    summaries = list(get_chunk_executor().map(
+        lambda chunk: context.copy().run(backend.summarize, chunk), chunks
+    ))
+
+    return backend.reduce(summaries)
+
+
+def _summarize(backend, conversation):
+    if is_long_conversation(conversation):
+        return map_reduce_summarize(backend, conversation)
+
+    return backend.summarize(conversation)
+
+
+def _update(backend, summary, new_turns):
+    if not summary:
+        return _summarize(backend, new_turns)
+    if is_long_conversation(new_turns):
+        return backend.reduce(
+            [summary, map_reduce_summarize(backend, new_turns)]
+        )
+
+    return backend.update(summary, new_turns)
+
+
+def update_summary(summary, new_turns):
+    """
+    Return `summary` updated with the new turns of its conversation, without
+    summarizing the earlier turns again.
+    """
+    backend = get_backend()
+    try:
+        return _update(backend, summary, new_turns)
+    except ServiceUnavailable:
+        backend = get_fallback_backend()
+        if backend is None:
+            raise
+
+        return _update(backend, summary, new_turns)
+
+
+def open_summary_stream(conversation):
+    """
+    Start streaming a fresh summary. Returns the backend that serves it and
+    an iterator over the summary chunks. Long conversations are not streamed,
+    their merged summary is a single chunk.
+    """
+    backend = get_backend()
+    try:
+        if is_long_conversation(conversation):
+            return backend, iter([map_reduce_summarize(backend, conversation)])
+        return backend, backend.stream(conversation)
+    except ServiceUnavailable:
+        backend = get_fallback_backend()
+        if backend is None:
+            raise
+
+        return backend, iter([_summarize(backend, conversation)])
+
+
+def _summarize_and_cache(backend, conversation, key):
+    try:
+        summary = _summarize(backend, conversation)
+    except ServiceUnavailable:
+        backend = get_fallback_backend()
+        if backend is None:
+            raise
+        summary = _summarize(backend, conversation)
+        key = get_cache_key(conversation, backend)
+
+    summary_cache.set(key, summary)
+
+    return summary
+
+
+def summarize_conversation(conversation, use_cache=True, since=None):
+    """
+    Summarize a conversation and return the generated html summary. The
+    result is always stored in the summary cache, `use_cache=False` only
+    skips the lookup. With `since` only a summary cached at or after that
+    time is used, eg. by a job whose request already missed the cache.
+    """
+    backend = get_backend()
+    key = get_cache_key(conversation, backend)
+    if use_cache:
+        summary = summary_cache.get(key, since=since)
+        if summary is not None:
+            return summary
+    else:
+        # Only reuse the summary of a concurrent call of another process.
+        since = timezone.now()
+
+    return summary_flight.do(
+        key, _summarize_and_cache, backend, conversation, key,
+        recheck=lambda: summary_cache.get(key, since=since)
+    )
+
+
+async def _asummarize_and_cache(backend, conversation, key):
+    try:
+        summary = await backend.asummarize(conversation)
+    except ServiceUnavailable:
+        backend = get_fallback_backend()
+        if backend is None:
+            raise
+        summary = await backend.asummarize(conversation)
+        key = get_cache_key(conversation, backend)
+
+    await sync_to_async(summary_cache.set)(key, summary)
+
+    return summary
+
+
+async def asummarize_conversation(conversation, use_cache=True):
+    """
+    Async variant of `summarize_conversation()` that waits for the upstream
+    without holding a thread. Long conversations go through the threaded
+    map-reduce pipeline.
+    """
+    if is_long_conversation(conversation):
+        return await sync_to_async(
+            summarize_conversation, thread_sensitive=False
+        )(conversation, use_cache=use_cache)
+
+    backend = get_backend()
+    key = get_cache_key(conversation, backend)
+    since = None
+    if use_cache:
+        summary = await sync_to_async(summary_cache.get)(key)
+        if summary is not None:
+            return summary
+    else:
+        since = timezone.now()
+
+    return await summary_flight.ado(
+        key, _asummarize_and_cache, backend, conversation, key,
+        recheck=sync_to_async(lambda: summary_cache.get(key, since=since))
+    )
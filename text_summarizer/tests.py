@@ -1,3 +1,1844 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openai
+from openai import api_requestor
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from django.utils import timezone
+
+from healthmateai.util.exceptions import ServiceUnavailable
+from healthmateai.util.fields import (
+    ZLIB_HEADER, compress_json, is_compressed
+)
+from healthmateai.util.pagination import CursorPagination, count_cache
+from healthmateai.util.ratelimit import RateLimitTimeout
+from healthmateai.util.retry import CircuitBreaker
+from healthmateai.util.testing import QueryBudgetMixin
+from patient.models import Patient
+from text_summarizer import backends, batch, jobs
+from text_summarizer.backends.base import BaseSummarizerBackend
+from text_summarizer.backends.local import ExtractiveSummarizerBackend
+from text_summarizer.backends.openai import get_transport
+from text_summarizer.cache import LRUCache, make_cache_key, summary_cache
+from text_summarizer.chunking import split_conversation
+from text_summarizer.jobs import enqueue_job, process_job, run_job_in_thread
+from text_summarizer.models import SummarizeRequest, SummaryCacheEntry
+from text_summarizer.summarizer import (
+    get_cache_key, get_cached_summary, is_long_conversation,
+    map_reduce_summarize, open_summary_stream, summarize_conversation,
+    update_summary
+)
+from text_summarizer.views import (
+    ListCreateSummarizeAPIView, ListPatientSummarizeAPIView
+)
+
+
+class SummarizeListAPITestCase(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = Patient.objects.bulk_create(
+            Patient(name=f'Patient {index}') for index in range(3)
+        )
+        cls.summary_ids = [summary.id for summary in (
+            SummarizeRequest.objects.bulk_create(
+                SummarizeRequest(
+                    conversation=[{'doctor': 'Hello', 'patient': 'Hi'}],
+                    summarize='<p>Summary</p>',
+                    patient=cls.patients[index % len(cls.patients)]
+                )
+                for index in range(30)
+            )
+        )]
+
+    def test_list_summaries(self):
+        response = self.client.get(
+            reverse('text_summarizer:list_create_summarize_view')
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data['count'], 30)
+        self.assertIn('name', data['results'][0]['patient'])
+
+    def test_list_summaries_sparse_fields(self):
+        url = reverse('text_summarizer:list_create_summarize_view')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'fields': 'id,summarize'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.json()['data']['results'][0]), {'id', 'summarize'}
+        )
+        query = context.captured_queries[-1]['sql']
+        self.assertNotIn('conversation', query)
+        self.assertNotIn('patient', query)
+
+    def test_list_summaries_exclude_fields(self):
+        url = reverse('text_summarizer:list_create_summarize_view')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                url, {'exclude': 'conversation', 'pagination': 'cursor'}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertNotIn('conversation', data['results'][0])
+        self.assertIn('name', data['results'][0]['patient'])
+        self.assertNotIn('conversation', context.captured_queries[-1]['sql'])
+        # The cursor is built from the loaded ordering fields.
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_list_summaries_unknown_field(self):
+        response = self.client.get(
+            reverse('text_summarizer:list_create_summarize_view'),
+            {'fields': 'id,secret'}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_summaries_query_budget(self):
+        # count + page with the patients joined
+        self.assertConstantQueries(
+            reverse('text_summarizer:list_create_summarize_view'), 2
+        )
+
+    def test_list_summaries_no_count(self):
+        url = reverse('text_summarizer:list_create_summarize_view')
+        response = self.client.get(
+            url, {'pagination': 'no_count', 'page': 2}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 15)
+        self.assertIsNone(data['next'])
+        self.assertNotIn('page=', data['previous'])
+
+        response = self.client.get(
+            url, {'pagination': 'no_count', 'page': 3}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_summaries_no_count_query_budget(self):
+        url = reverse('text_summarizer:list_create_summarize_view')
+        for page_size in (1, 5, 15):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(
+                    self.get_query_count(
+                        url, pagination='no_count', page_size=page_size
+                    ),
+                    1
+                )
+
+    def test_list_summaries_estimated_count(self):
+        count_cache.clear()
+        url = reverse('text_summarizer:list_create_summarize_view')
+        self.assertEqual(self.get_query_count(url, pagination='estimated'), 2)
+
+        SummarizeRequest.objects.create(conversation=[])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'pagination': 'estimated'})
+        self.assertEqual(response.json()['data']['count'], 30)
+
+    def get_cursor_pages(self, url, **params):
+        pages = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()['data']
+            pages.append(data)
+            url, params = data['next'], {}
+
+        return pages
+
+    def test_list_summaries_cursor(self):
+        # Equal `created_at` values are ordered by the id tiebreaker.
+        SummarizeRequest.objects.filter(id__in=self.summary_ids[5:15]).update(
+            created_at=SummarizeRequest.objects.get(
+                id=self.summary_ids[5]
+            ).created_at
+        )
+        url = reverse('text_summarizer:list_create_summarize_view')
+        expected = list(SummarizeRequest.objects.order_by(
+            '-created_at', '-id'
+        ).values_list('id', flat=True))
+
+        pages = self.get_cursor_pages(
+            url, pagination='cursor', page_size=4
+        )
+        self.assertEqual(
+            [item['id'] for page in pages for item in page['results']],
+            expected
+        )
+        self.assertIsNone(pages[0]['previous'])
+
+        # Walk back from the last page.
+        previous_ids = []
+        url = pages[-1]['previous']
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()['data']
+            previous_ids = [item['id'] for item in data['results']] + (
+                previous_ids
+            )
+            url = data['previous']
+        self.assertEqual(
+            previous_ids,
+            [item['id'] for page in pages[:-1] for item in page['results']]
+        )
+
+    def test_list_summaries_invalid_cursor(self):
+        response = self.client.get(
+            reverse('text_summarizer:list_create_summarize_view'),
+            {'pagination': 'cursor', 'cursor': 'invalid'}
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_patient_summaries_cursor(self):
+        patient = self.patients[0]
+        pages = self.get_cursor_pages(
+            reverse(
+                'text_summarizer:list_patient_summarize_view',
+                kwargs={'patient_id': patient.id}
+            ),
+            pagination='cursor', page_size=3
+        )
+
+        self.assertEqual(
+            [item['id'] for page in pages for item in page['results']],
+            list(patient.summarizerequest_set.order_by(
+                '-created_at', '-id'
+            ).values_list('id', flat=True))
+        )
+
+    def test_list_patient_summaries(self):
+        patient = self.patients[0]
+        response = self.client.get(reverse(
+            'text_summarizer:list_patient_summarize_view',
+            kwargs={'patient_id': patient.id}
+        ))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['count'], 10)
+
+    def test_list_patient_summaries_query_budget(self):
+        self.assertConstantQueries(
+            reverse(
+                'text_summarizer:list_patient_summarize_view',
+                kwargs={'patient_id': self.patients[0].id}
+            ),
+            2
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output of SQLite.')
+class SummarizeListIndexTestCase(TestCase):
+    """
+    The list queries must be answered from an index, without a full table
+    scan or a sort of the whole table.
+    """
+
+    def get_plan(self, view, position=None, **kwargs):
+        view = view(kwargs=kwargs)
+        queryset = view.get_queryset()
+        if position is not None:
+            paginator = CursorPagination()
+            paginator.ordering_fields = [
+                (name.lstrip('-'), name.startswith('-'))
+                for name in view.ordering
+            ]
+            queryset = queryset.filter(
+                paginator.get_position_filter(position, reverse=False)
+            )
+
+        return queryset[:15].explain()
+
+    def assertUsesIndex(self, plan, index):
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_list_summaries_uses_index(self):
+        self.assertUsesIndex(
+            self.get_plan(ListCreateSummarizeAPIView),
+            'text_summarizer_summarizerequest_created_at'
+        )
+
+    def test_list_patient_summaries_uses_index(self):
+        self.assertUsesIndex(
+            self.get_plan(ListPatientSummarizeAPIView, patient_id=1),
+            'summary_patient_created_idx'
+        )
+
+    def test_list_patient_summaries_cursor_uses_index(self):
+        self.assertUsesIndex(
+            self.get_plan(
+                ListPatientSummarizeAPIView,
+                position=[timezone.now().isoformat(), '10'],
+                patient_id=1
+            ),
+            'summary_patient_created_idx'
+        )
+
+
+class CompressedConversationTestCase(TestCase):
+    conversation = [
+        {'doctor': 'How are you feeling today?'},
+        {'patient': 'I have had a headache and a mild fever since Monday.'}
+    ] * 10
+
+    def get_stored(self, summary):
+        return SummarizeRequest.objects.filter(id=summary.id).values_list(
+            'conversation', flat=True
+        ).get()
+
+    def test_conversation_is_stored_compressed(self):
+        summary = SummarizeRequest.objects.create(
+            conversation=self.conversation
+        )
+
+        self.assertTrue(is_compressed(self.get_stored(summary)))
+        self.assertEqual(
+            SummarizeRequest.objects.get(id=summary.id).conversation,
+            self.conversation
+        )
+
+    def test_stored_bytes(self):
+        summary = SummarizeRequest.objects.create(
+            conversation=self.conversation
+        )
+
+        # The raw zlib stream is stored behind the format header.
+        stored = self.get_stored(summary)
+        self.assertEqual(
+            json.loads(zlib.decompress(stored[len(ZLIB_HEADER):])),
+            self.conversation
+        )
+
+    def test_small_conversation_is_stored_plain(self):
+        summary = SummarizeRequest.objects.create(
+            conversation={'patient': 'Fine', 'doctor': 'Hello'}
+        )
+
+        # Canonical json: compact, with sorted keys.
+        self.assertEqual(
+            bytes(self.get_stored(summary)),
+            b'{"doctor":"Hello","patient":"Fine"}'
+        )
+
+    def test_canonical_json(self):
+        self.assertEqual(
+            compress_json({'b': 1, 'a': 'é'}, level=6),
+            compress_json({'a': 'é', 'b': 1}, level=6)
+        )
+
+    def test_compress_existing_conversations(self):
+        with override_settings(COMPRESSED_FIELDS={
+            **settings.COMPRESSED_FIELDS, 'ENABLED': False
+        }):
+            summary = SummarizeRequest.objects.create(
+                conversation=self.conversation
+            )
+        self.assertFalse(is_compressed(self.get_stored(summary)))
+
+        call_command('compress_conversations', stdout=StringIO())
+
+        self.assertTrue(is_compressed(self.get_stored(summary)))
+        summary.refresh_from_db()
+        self.assertEqual(summary.conversation, self.conversation)
+
+
+class SummarizeExportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = Patient.objects.bulk_create(
+            Patient(name=f'Patient {index}') for index in range(2)
+        )
+        SummarizeRequest.objects.bulk_create(
+            SummarizeRequest(
+                conversation=[{'doctor': f'Question {index}'}],
+                summarize=f'<p>Summary {index}</p>',
+                patient=cls.patients[index % 2]
+            )
+            for index in range(10)
+        )
+
+    async def get_export(self, **params):
+        response = await self.async_client.get(
+            reverse('text_summarizer:export_summarize_view'), params
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        content = [chunk async for chunk in response.streaming_content]
+
+        return response, b''.join(content).decode()
+
+    async def test_export_ndjson(self):
+        patient = self.patients[0]
+        response, content = await self.get_export(patient=patient.id)
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            [summary.id async for summary in SummarizeRequest.objects.filter(
+                patient=patient
+            ).order_by('created_at', 'id')]
+        )
+        self.assertEqual(rows[0]['conversation'], [{'doctor': 'Question 0'}])
+
+    async def test_export_csv(self):
+        response, content = await self.get_export(export_format='csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(
+            json.loads(rows[0]['conversation']), [{'doctor': 'Question 0'}]
+        )
+
+    async def test_export_date_range(self):
+        summaries = [
+            summary async for summary in
+            SummarizeRequest.objects.order_by('created_at')
+        ]
+        _, content = await self.get_export(
+            created_after=summaries[2].created_at.isoformat(),
+            created_before=summaries[5].created_at.isoformat()
+        )
+
+        self.assertEqual(
+            [json.loads(line)['id'] for line in content.splitlines()],
+            [summary.id for summary in summaries[2:5]]
+        )
+
+    def test_export_wsgi(self):
+        response = self.client.get(
+            reverse('text_summarizer:export_summarize_view'),
+            {'export_format': 'csv'}
+        )
+
+        # A sync iterator, streamed by the WSGI server as it is read.
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        rows = list(csv.DictReader(StringIO(
+            b''.join(response.streaming_content).decode()
+        )))
+        self.assertEqual(len(rows), 10)
+
+    def test_export_invalid_format(self):
+        response = self.client.get(
+            reverse('text_summarizer:export_summarize_view'),
+            {'export_format': 'xml'}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_command(self):
+        output = StringIO()
+        call_command(
+            'export_summaries', patient=self.patients[1].id, chunk_size=2,
+            stdout=output
+        )
+
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+
+
+@override_settings(
+    SUMMARIZER_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    ),
+    SUMMARY_CACHE={**settings.SUMMARY_CACHE, 'ENABLED': False}
+)
+class ImportConversationsTestCase(TestCase):
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'conversations.jsonl')
+
+        self.patient = Patient.objects.create(name='Patient')
+        lines = [
+            json.dumps({
+                'conversation': [
+                    {'doctor': f'Please do a blood test {index}'}
+                ],
+                'patient': self.patient.id
+            })
+            for index in range(7)
+        ]
+        lines[3] = '{invalid'
+        lines[5] = json.dumps({'conversation': [], 'patient': 0})
+        with open(self.path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def import_conversations(self, workers=2):
+        output = StringIO()
+        call_command(
+            'import_conversations', self.path, batch_size=2, workers=workers,
+            stdout=output
+        )
+
+        return output.getvalue()
+
+    def test_import(self):
+        output = self.import_conversations()
+
+        self.assertIn('rows/s', output)
+        self.assertEqual(
+            SummarizeRequest.objects.filter(patient=self.patient).count(), 5
+        )
+        with open(f'{self.path}.errors') as file:
+            self.assertEqual(
+                [json.loads(line)['line'] for line in file], [4, 6]
+            )
+
+    def test_resume(self):
+        backend_class = import_string(
+            'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+        )
+        summarize = backend_class.summarize
+        calls = []
+
+        def fail_on_third_call(backend, conversation):
+            calls.append(conversation)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return summarize(backend, conversation)
+
+        with mock.patch.object(
+                backend_class, 'summarize', fail_on_third_call
+        ), self.assertRaises(KeyboardInterrupt):
+            self.import_conversations(workers=1)
+        # The first batch is committed, the second one is not.
+        self.assertEqual(SummarizeRequest.objects.count(), 2)
+
+        def count_calls(backend, conversation):
+            calls.append(conversation)
+            return 'Summary'
+
+        calls.clear()
+        with mock.patch.object(backend_class, 'summarize', count_calls):
+            output = self.import_conversations()
+
+        self.assertIn('Resuming after line 2', output)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(SummarizeRequest.objects.count(), 5)
+
+    def test_resume_after_failed_commit(self):
+        index_summaries = import_string(
+            'text_summarizer.management.commands.import_conversations.'
+            'index_summaries'
+        )
+        calls = []
+
+        def fail_on_second_batch(instances):
+            calls.append(instances)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            index_summaries(instances)
+
+        with mock.patch(
+                'text_summarizer.management.commands.import_conversations.'
+                'index_summaries', fail_on_second_batch
+        ), self.assertRaises(KeyboardInterrupt):
+            self.import_conversations()
+        # The error of line 4 was written, its batch rolled back.
+        self.assertEqual(SummarizeRequest.objects.count(), 2)
+
+        output = self.import_conversations()
+
+        self.assertIn('Resuming after line 2', output)
+        self.assertEqual(SummarizeRequest.objects.count(), 5)
+        with open(f'{self.path}.errors') as file:
+            self.assertEqual(
+                [json.loads(line)['line'] for line in file], [4, 6]
+            )
+        self.assertIn('Imported 5 conversation(s), 2 failed', output)
+
+
+class SummarizeSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = Patient.objects.bulk_create(
+            Patient(name=f'Patient {index}') for index in range(2)
+        )
+        cls.in_summary = SummarizeRequest.objects.create(
+            conversation=[{'doctor': 'How is the knee?'}],
+            summarize='<h3>Suggested Tests</h3><ul><li>MRI</li></ul>',
+            patient=cls.patients[0]
+        )
+        cls.in_conversation = SummarizeRequest.objects.create(
+            conversation=[
+                {'doctor': 'An MRI was suggested last time.'},
+                {'patient': 'I had an x-ray instead.'}
+            ],
+            summarize='<h3>Suggested Tests</h3><ul><li>X-ray</li></ul>',
+            patient=cls.patients[1]
+        )
+        cls.unrelated = SummarizeRequest.objects.create(
+            conversation=[{'doctor': 'Take a blood test.'}],
+            summarize='<h3>Suggested Tests</h3><ul><li>Blood test</li></ul>',
+            patient=cls.patients[0]
+        )
+
+    def search(self, **params):
+        response = self.client.get(
+            reverse('text_summarizer:search_summarize_view'), params
+        )
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()['data']
+
+    def get_ids(self, **params):
+        return [row['id'] for row in self.search(**params)['results']]
+
+    def test_ranking(self):
+        data = self.search(q='MRI')
+
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(
+            [row['id'] for row in data['results']],
+            [self.in_summary.id, self.in_conversation.id]
+        )
+        self.assertGreater(
+            data['results'][0]['rank'], data['results'][1]['rank']
+        )
+
+    def test_query_syntax(self):
+        # Stemmed, `suggested` matches `suggest`.
+        self.assertEqual(
+            self.get_ids(q='mri suggest'),
+            [self.in_summary.id, self.in_conversation.id]
+        )
+        self.assertEqual(
+            self.get_ids(q='"mri was suggested"'), [self.in_conversation.id]
+        )
+        self.assertEqual(
+            self.get_ids(q='mri -knee'), [self.in_conversation.id]
+        )
+        self.assertEqual(
+            set(self.get_ids(q='knee OR blood')),
+            {self.in_summary.id, self.unrelated.id}
+        )
+        self.assertEqual(self.get_ids(q='"unbalanced AND ('), [])
+        self.assertEqual(self.get_ids(q='***'), [])
+
+    def test_patient(self):
+        self.assertEqual(
+            self.get_ids(q='mri', patient=self.patients[1].id),
+            [self.in_conversation.id]
+        )
+
+    def test_missing_query(self):
+        response = self.client.get(
+            reverse('text_summarizer:search_summarize_view')
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_pagination(self):
+        for pagination in ('no_count', 'estimated', 'cursor'):
+            with self.subTest(pagination=pagination):
+                data = self.search(
+                    q='suggested', pagination=pagination, page_size=2
+                )
+                self.assertEqual(len(data['results']), 2)
+                self.assertIsNotNone(data['next'])
+
+    def test_sync_on_save_and_delete(self):
+        self.unrelated.summarize = 'An MRI of the knee.'
+        self.unrelated.save()
+        self.assertIn(self.unrelated.id, self.get_ids(q='mri'))
+
+        self.unrelated.delete()
+        self.assertNotIn(self.unrelated.id, self.get_ids(q='mri'))
+
+    def test_append(self):
+        with mock.patch(
+                'text_summarizer.serializers.update_summary',
+                return_value='Ultrasound booked.'
+        ):
+            response = self.client.post(
+                reverse(
+                    'text_summarizer:append_summarize_view',
+                    args=[self.unrelated.id]
+                ),
+                {'conversation': [{'doctor': 'Book an ultrasound.'}]},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get_ids(q='ultrasound'), [self.unrelated.id])
+        self.assertEqual(self.get_ids(q='blood'), [self.unrelated.id])
+
+    def test_rebuild_search_index(self):
+        summaries = SummarizeRequest.objects.bulk_create([
+            SummarizeRequest(
+                conversation=[{'doctor': f'Echocardiogram {index}'}]
+            )
+            for index in range(3)
+        ])
+        self.assertEqual(self.get_ids(q='echocardiogram'), [])
+
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            set(self.get_ids(q='echocardiogram')),
+            {summary.id for summary in summaries}
+        )
+
+
+class SummarizeListCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(name='Patient')
+        SummarizeRequest.objects.bulk_create(
+            SummarizeRequest(
+                conversation=[{'doctor': 'Hello'}],
+                summarize='<p>Summary</p>',
+                patient=cls.patient
+            )
+            for _ in range(3)
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.url = reverse('text_summarizer:list_create_summarize_view')
+
+    def rename_patient(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.name = name
+            self.patient.save()
+
+    def test_etag_follows_related_objects(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code,
+            304
+        )
+
+        self.rename_patient('Renamed')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['data']['results'][0]['patient']['name'],
+            'Renamed'
+        )
+
+    def test_etag_after_cache_cleared(self):
+        etag = self.client.get(self.url)['ETag']
+
+        # The versions of a local memory cache are lost on restart and not
+        # shared with the other workers, the ETag doesn't depend on them.
+        self.rename_patient('Renamed')
+        caches['default'].clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['data']['results'][0]['patient']['name'],
+            'Renamed'
+        )
+
+    def test_validators_query(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        # One aggregate over the summaries, the patients are not joined.
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('JOIN', context.captured_queries[0]['sql'])
+        # A renamed patient doesn't move it, so it isn't sent.
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    @override_settings(
+        RESPONSE_CACHE={**settings.RESPONSE_CACHE, 'ENABLED': True}
+    )
+    def test_response_cache(self):
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Saving a listed model invalidates the cached pages.
+        self.rename_patient('Renamed')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertGreater(len(context.captured_queries), 0)
+        self.assertEqual(
+            response.json()['data']['results'][0]['patient']['name'],
+            'Renamed'
+        )
+
+
+class ImmediateExecutor:
+    """
+    Runs the submitted calls right away, in the test's transaction.
+    """
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
+
+
+@override_settings(
+    SUMMARIZER_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    ),
+    SUMMARIZE_ASYNC=True,
+    SUMMARIZE_JOB_RUNNER='thread'
+)
+class SummarizeJobTestCase(TestCase):
+    conversation = [
+        {'doctor': 'Do you have a fever?'},
+        {'patient': 'Yes, a fever and a headache since Monday.'},
+        {'doctor': "Let's do a blood count."}
+    ]
+
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        summary_cache.memory.clear()
+        self.addCleanup(summary_cache.memory.clear)
+        self.addCleanup(jobs._submitted.clear)
+        self.patient = Patient.objects.create(name='Patient')
+        self.backend_class = import_string(settings.SUMMARIZER_BACKEND)
+
+    def create_job(self):
+        return SummarizeRequest.objects.create(
+            conversation=self.conversation, patient=self.patient,
+            status=SummarizeRequest.Status.PENDING
+        )
+
+    def test_enqueue_job_on_commit(self):
+        job = self.create_job()
+        with mock.patch('text_summarizer.jobs.get_executor') as get_executor:
+            with self.captureOnCommitCallbacks() as callbacks:
+                enqueue_job(job)
+            get_executor.return_value.submit.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        get_executor.return_value.submit.assert_called_once_with(
+            run_job_in_thread, job.id
+        )
+
+        with override_settings(SUMMARIZE_JOB_RUNNER='queue'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                enqueue_job(job)
+        self.assertEqual(callbacks, [])
+
+    def test_sweep_jobs(self):
+        pending = self.create_job()
+        stale = self.create_job()
+        SummarizeRequest.objects.filter(id=stale.id).update(
+            status=SummarizeRequest.Status.RUNNING,
+            updated_at=timezone.now() - timedelta(
+                seconds=settings.SUMMARIZE_JOB_STALE_AFTER + 1
+            )
+        )
+        running = self.create_job()
+        SummarizeRequest.objects.filter(id=running.id).update(
+            status=SummarizeRequest.Status.RUNNING
+        )
+
+        with mock.patch('text_summarizer.jobs.get_executor') as get_executor:
+            # Lost with a previous process, nothing else runs them.
+            self.assertEqual(jobs.sweep_jobs(), 2)
+            # Already waiting in the thread pool.
+            self.assertEqual(jobs.sweep_jobs(), 0)
+
+        self.assertEqual(get_executor.return_value.submit.call_args_list, [
+            mock.call(run_job_in_thread, pending.id),
+            mock.call(run_job_in_thread, stale.id)
+        ])
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, SummarizeRequest.Status.PENDING)
+
+        with mock.patch('text_summarizer.jobs.close_old_connections'):
+            run_job_in_thread(pending.id)
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, SummarizeRequest.Status.DONE)
+        self.assertNotIn(pending.id, jobs._submitted)
+
+    @override_settings(SUMMARIZE_JOB_RUNNER='queue')
+    def test_no_sweeper_with_queue_runner(self):
+        with mock.patch('text_summarizer.jobs.threading.Thread') as thread:
+            jobs.start_job_sweeper()
+        thread.assert_not_called()
+
+    def test_post_returns_pending_job(self):
+        with mock.patch(
+                'text_summarizer.jobs.get_executor',
+                return_value=mock.Mock(submit=mock.Mock())
+        ) as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('text_summarizer:list_create_summarize_view'),
+                    {'conversation': self.conversation,
+                     'patient': self.patient.id},
+                    content_type='application/json'
+                )
+
+        self.assertEqual(response.status_code, 202)
+        job = SummarizeRequest.objects.get(id=response.json()['id'])
+        self.assertEqual(job.status, SummarizeRequest.Status.PENDING)
+        self.assertEqual(response.json()['status'], 'pending')
+        get_executor.return_value.submit.assert_called_once_with(
+            run_job_in_thread, job.id
+        )
+
+    def test_run_job(self):
+        job = self.create_job()
+        statuses = []
+        summarize = self.backend_class.summarize
+
+        def record_status(backend, conversation):
+            statuses.append(
+                SummarizeRequest.objects.get(id=job.id).status
+            )
+            return summarize(backend, conversation)
+
+        with mock.patch.object(
+                self.backend_class, 'summarize', record_status
+        ):
+            process_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(statuses, [SummarizeRequest.Status.RUNNING])
+        self.assertEqual(job.status, SummarizeRequest.Status.DONE)
+        self.assertIn('blood count', job.summarize)
+        # Already claimed.
+        self.assertIsNone(process_job(job.id))
+
+    def test_run_job_failure(self):
+        job = self.create_job()
+        with mock.patch.object(
+                self.backend_class, 'summarize',
+                side_effect=ValueError('Upstream error.')
+        ):
+            process_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SummarizeRequest.Status.FAILED)
+        self.assertEqual(job.error, 'Upstream error.')
+
+    def test_run_job_uses_summary_cached_since_enqueued(self):
+        job = self.create_job()
+        # An identical job finished in the meantime.
+        summary_cache.set(get_cache_key(self.conversation), '<p>Cached</p>')
+        summary_cache.memory.clear()
+
+        with mock.patch.object(
+                self.backend_class, 'summarize',
+                side_effect=AssertionError('Called the upstream.')
+        ):
+            process_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SummarizeRequest.Status.DONE)
+        self.assertEqual(job.summarize, '<p>Cached</p>')
+
+    def test_run_summarize_jobs_command(self):
+        jobs = [self.create_job() for _ in range(3)]
+        output = StringIO()
+        with mock.patch(
+                'text_summarizer.management.commands.run_summarize_jobs.'
+                'ThreadPoolExecutor',
+                return_value=nullcontext(ImmediateExecutor())
+        ), mock.patch(
+                'text_summarizer.management.commands.run_summarize_jobs.'
+                'close_old_connections'
+        ):
+            call_command('run_summarize_jobs', once=True, stdout=output)
+
+        self.assertIn('Processed 3 job(s).', output.getvalue())
+        self.assertEqual(
+            set(SummarizeRequest.objects.filter(
+                id__in=[job.id for job in jobs]
+            ).values_list('status', flat=True)),
+            {SummarizeRequest.Status.DONE}
+        )
+
+    def test_job_status(self):
+        job = self.create_job()
+        url = reverse(
+            'text_summarizer:retrieve_summarize_job_view', args=[job.id]
+        )
+        self.assertEqual(self.client.get(url).json()['status'], 'pending')
+
+        process_job(job.id)
+        data = self.client.get(url).json()
+        self.assertEqual(data['status'], 'done')
+        self.assertIn('blood count', data['summarize'])
+        self.assertEqual(
+            self.client.get(reverse(
+                'text_summarizer:retrieve_summarize_job_view', args=[0]
+            )).status_code,
+            404
+        )
+
+
+@override_settings(
+    SUMMARIZER_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    ),
+    SUMMARIZE_ASYNC=False
+)
+class SummaryCacheTestCase(TestCase):
+    conversation = [
+        {'doctor': 'Where does it hurt?', 'patient': 'My knee is swollen.'}
+    ]
+
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        summary_cache.memory.clear()
+        self.addCleanup(summary_cache.memory.clear)
+        self.patient = Patient.objects.create(name='Patient')
+        self.backend_class = import_string(settings.SUMMARIZER_BACKEND)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_entries=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Reading `a` makes `b` the least recently used entry.
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_lru_timeout(self):
+        cache = LRUCache(max_entries=2, timeout=60)
+        with mock.patch('time.monotonic', return_value=1000):
+            cache.set('a', 1)
+        with mock.patch('time.monotonic', return_value=1060):
+            self.assertIsNone(cache.get('a'))
+
+    def test_canonical_key(self):
+        self.assertEqual(
+            make_cache_key(
+                {'patient': 'Hi', 'doctor': 'Hello'}, model='a', prompt='b'
+            ),
+            make_cache_key(
+                {'doctor': 'Hello', 'patient': 'Hi'}, prompt='b', model='a'
+            )
+        )
+        self.assertNotEqual(
+            make_cache_key({'doctor': 'Hello'}, model='a'),
+            make_cache_key({'doctor': 'Hello'}, model='b')
+        )
+        self.assertNotEqual(
+            make_cache_key([{'doctor': 'Hello'}, {'doctor': 'Bye'}]),
+            make_cache_key([{'doctor': 'Bye'}, {'doctor': 'Hello'}])
+        )
+
+    def test_database_tier(self):
+        key = get_cache_key(self.conversation)
+        summary_cache.set(key, '<p>Summary</p>')
+        # Another worker only shares the table.
+        summary_cache.memory.clear()
+
+        stats = summary_cache.stats()
+        self.assertEqual(summary_cache.get(key), '<p>Summary</p>')
+        with self.assertNumQueries(0):
+            self.assertEqual(summary_cache.get(key), '<p>Summary</p>')
+        self.assertEqual(
+            summary_cache.stats()['db_hits'], stats['db_hits'] + 1
+        )
+        self.assertEqual(
+            summary_cache.stats()['memory_hits'], stats['memory_hits'] + 1
+        )
+
+        SummaryCacheEntry.objects.update(expires_at=timezone.now())
+        summary_cache.memory.clear()
+        self.assertIsNone(summary_cache.get(key))
+
+    def test_no_cache_request_bypasses_lookup(self):
+        url = reverse('text_summarizer:list_create_summarize_view')
+        data = {'conversation': self.conversation, 'patient': self.patient.id}
+        summarize = self.backend_class.summarize
+        calls = []
+
+        def count_calls(backend, conversation):
+            calls.append(conversation)
+            return summarize(backend, conversation)
+
+        with mock.patch.object(self.backend_class, 'summarize', count_calls):
+            for headers in ({}, {}, {'Cache-Control': 'no-cache'}):
+                response = self.client.post(
+                    url, data, content_type='application/json',
+                    headers=headers
+                )
+                self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            len(set(SummarizeRequest.objects.values_list(
+                'summarize', flat=True
+            ))),
+            1
+        )
+
+    def test_stats(self):
+        summary_cache.get(get_cache_key(self.conversation))
+
+        response = self.client.get(
+            reverse('text_summarizer:summarizer_stats_view')
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertGreaterEqual(data['cache']['misses'], 1)
+        self.assertIn('hit_ratio', data['cache'])
+        self.assertIn('coalesced', data['single_flight'])
+        self.assertEqual(data['backend']['name'], 'local-extractive')
+
+
+@override_settings(
+    SUMMARIZER_BACKEND='text_summarizer.backends.openai.'
+                       'OpenAISummarizerBackend',
+    SUMMARIZER_CIRCUIT_BREAKER={
+        'FAILURE_THRESHOLD': 2, 'RESET_TIMEOUT': 30
+    },
+    SUMMARIZE_ASYNC=True
+)
+class OpenAIBackendTestCase(TestCase):
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        self.backend = backends.get_backend()
+        self.breaker = self.backend.retry_policy.breaker
+
+    def test_open_circuit_retry_after(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        response = self.client.post(
+            reverse('text_summarizer:list_create_summarize_view'),
+            {
+                'conversation': [{'doctor': 'Any pain?'}],
+                'patient': Patient.objects.create(name='Patient').id
+            },
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertFalse(SummarizeRequest.objects.exists())
+
+    def test_rate_limit_timeout(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.clock = lambda: self.breaker._opened_at + 30
+        self.backend.rate_limiter = mock.Mock(
+            acquire=mock.Mock(side_effect=RateLimitTimeout(2.5))
+        )
+
+        with self.assertRaises(ServiceUnavailable) as context:
+            self.backend.summarize([{'doctor': 'Any pain?'}])
+
+        self.assertEqual(context.exception.wait, 3)
+        # The call never reached the upstream, the breaker is still waiting
+        # for a probe.
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_call()
+
+    def test_pooled_session(self):
+        # Installed by the app config, every thread gets the shared session
+        # instead of a session of its own.
+        self.assertIs(openai.requestssession, get_transport().session)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sessions = list(executor.map(
+                lambda _: api_requestor._make_session(), range(2)
+            ))
+        self.assertEqual(sessions, [get_transport().session] * 2)
+
+
+@override_settings(
+    SUMMARIZER_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    ),
+    SUMMARY_CACHE={**settings.SUMMARY_CACHE, 'ENABLED': False}
+)
+class BatchSummarizeTestCase(TestCase):
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        self.url = reverse('text_summarizer:batch_create_summarize_view')
+        self.patients = Patient.objects.bulk_create(
+            Patient(name=f'Patient {index}') for index in range(2)
+        )
+        self.backend_class = import_string(settings.SUMMARIZER_BACKEND)
+
+    def post(self, data):
+        return self.client.post(
+            self.url, data, content_type='application/json'
+        )
+
+    def get_items(self, count):
+        return [
+            {
+                'conversation': [{'doctor': f'Is the cough better {index}?'}],
+                'patient': self.patients[index % 2].id
+            }
+            for index in range(count)
+        ]
+
+    def test_results_per_item(self):
+        items = self.get_items(5)
+        items[1]['patient'] = 0
+        del items[2]['conversation']
+        items[4]['conversation'] = [{'doctor': 'Upstream down.'}]
+        summarize = self.backend_class.summarize
+
+        def fail_one(backend, conversation):
+            if conversation == items[4]['conversation']:
+                raise ServiceUnavailable('The service is unavailable.')
+            return summarize(backend, conversation)
+
+        with mock.patch.object(self.backend_class, 'summarize', fail_one):
+            response = self.post(items)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()['data']
+        self.assertEqual((data['created'], data['failed']), (2, 3))
+        results = data['results']
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['success', 'error', 'error', 'success', 'error']
+        )
+        self.assertEqual(results[0]['index'], 0)
+        self.assertIn('cough better 0', results[0]['data']['summarize'])
+        self.assertEqual(
+            results[1]['errors'], {'patient': ['Invalid patient.']}
+        )
+        self.assertIn('conversation', results[2]['errors'])
+        self.assertEqual(
+            results[4]['errors'], {'detail': 'The service is unavailable.'}
+        )
+        self.assertEqual(
+            set(SummarizeRequest.objects.values_list('id', flat=True)),
+            {results[0]['data']['id'], results[3]['data']['id']}
+        )
+
+    def test_all_invalid(self):
+        items = self.get_items(2)
+        for item in items:
+            item['patient'] = 0
+
+        response = self.post(items)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data']['created'], 0)
+        self.assertFalse(SummarizeRequest.objects.exists())
+
+    def test_invalid_batch(self):
+        self.assertEqual(self.post({'items': []}).status_code, 400)
+        with override_settings(SUMMARIZE_BATCH_MAX_SIZE=2):
+            self.assertEqual(self.post(self.get_items(3)).status_code, 400)
+
+    def test_single_bulk_create(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.post(self.get_items(6))
+
+        self.assertEqual(response.status_code, 201)
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(
+            len([sql for sql in queries if sql.startswith(
+                'INSERT INTO "text_summarizer_summarizerequest"'
+            )]),
+            1
+        )
+        self.assertEqual(
+            len([sql for sql in queries if 'FROM "patient_patient"' in sql]),
+            1
+        )
+        self.assertEqual(SummarizeRequest.objects.count(), 6)
+
+    @override_settings(SUMMARIZE_BATCH_CONCURRENCY=2)
+    def test_concurrency_bound(self):
+        # The pool is sized from the setting on first use.
+        with mock.patch.object(batch, '_executor', None):
+            running, peak = set(), []
+            lock = threading.Lock()
+            summarize = self.backend_class.summarize
+
+            def slow_summarize(backend, conversation):
+                with lock:
+                    running.add(threading.get_ident())
+                    peak.append(len(running))
+                time.sleep(0.05)
+                with lock:
+                    running.discard(threading.get_ident())
+                return summarize(backend, conversation)
+
+            with mock.patch.object(
+                    self.backend_class, 'summarize', slow_summarize
+            ):
+                response = self.post(self.get_items(6))
+            batch._executor.shutdown()
+
+        self.assertEqual(response.json()['data']['created'], 6)
+        self.assertEqual(max(peak), 2)
+
+
+def parse_events(content):
+    """
+    Return the `(event, data)` of a Server-Sent Events stream.
+    """
+    events = []
+    for block in content.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+
+    return events
+
+
+@override_settings(
+    SUMMARIZER_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    ),
+    SUMMARY_CACHE={**settings.SUMMARY_CACHE, 'ENABLED': False}
+)
+class SummarizeStreamTestCase(TestCase):
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        self.url = reverse('text_summarizer:stream_summarize_view')
+        self.patient = Patient.objects.create(name='Patient')
+        self.data = {
+            'conversation': [
+                {'doctor': 'Any pain in the knee?'},
+                {'patient': 'Yes, since last week.'},
+                {'doctor': 'We will do an MRI of the knee.'}
+            ],
+            'patient': self.patient.id
+        }
+        self.backend_class = import_string(settings.SUMMARIZER_BACKEND)
+
+    async def get_events(self):
+        response = await self.async_client.post(
+            self.url, self.data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = [chunk async for chunk in response.streaming_content]
+
+        return parse_events(b''.join(content).decode())
+
+    async def test_events(self):
+        events = await self.get_events()
+
+        names = [event for event, _ in events]
+        self.assertGreater(len(names), 1)
+        self.assertEqual(names, ['token'] * (len(names) - 1) + ['done'])
+        done = events[-1][1]
+        self.assertEqual(
+            ''.join(data['content'] for _, data in events[:-1]),
+            done['summarize']
+        )
+        summaries = [
+            summary async for summary in SummarizeRequest.objects.all()
+        ]
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0].id, done['id'])
+        self.assertEqual(summaries[0].summarize, done['summarize'])
+
+    async def test_error_event(self):
+        def failing_stream(backend, conversation):
+            yield '<ul><li>MRI</li>'
+            raise ValueError('Upstream closed the stream.')
+
+        with mock.patch.object(self.backend_class, 'stream', failing_stream):
+            events = await self.get_events()
+
+        self.assertEqual(
+            events,
+            [
+                ('token', {'content': '<ul><li>MRI</li>'}),
+                ('error', {'detail': 'Error occurred during API request.'})
+            ]
+        )
+        self.assertFalse(await SummarizeRequest.objects.aexists())
+
+    async def test_disconnect_stores_nothing(self):
+        # Stands in for the ASGI server, the client disconnects once the
+        # first token is received while the upstream is still generating.
+        from healthmateai.asgi import application
+
+        release, first_token = threading.Event(), asyncio.Event()
+
+        def slow_stream(backend, conversation):
+            yield '<ul><li>MRI</li>'
+            release.wait(5)
+            yield '</ul>'
+
+        body = json.dumps(self.data).encode()
+        messages = [
+            {'type': 'http.request', 'body': body, 'more_body': False}
+        ]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await first_token.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if b'event: token' in message.get('body', b''):
+                first_token.set()
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+            'path': self.url, 'raw_path': self.url.encode(),
+            'query_string': b'', 'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode())
+            ],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80)
+        }
+        # Like the test client, keep the test transaction's connection open.
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+        with mock.patch.object(self.backend_class, 'stream', slow_stream):
+            try:
+                await asyncio.wait_for(application(scope, receive, send), 5)
+            finally:
+                release.set()
+
+        self.assertEqual(sent[0]['status'], 200)
+        # The response was cut short, without the final body message.
+        self.assertTrue(all(
+            message.get('more_body') for message in sent[1:]
+        ))
+        self.assertFalse(await SummarizeRequest.objects.aexists())
+
+
+class FakeSummarizerBackend(BaseSummarizerBackend):
+    """
+    Summarizes a list of turns as the `|` joined values, and records the
+    chunks and the reduced summaries it was given.
+    """
+    name = 'fake'
+
+    def __init__(self):
+        self.chunks = []
+        self.reduced = []
+        self.lock = threading.Lock()
+
+    def summarize(self, conversation):
+        with self.lock:
+            self.chunks.append(conversation)
+        return '|'.join(
+            value for turn in conversation for value in turn.values()
+        )
+
+    def reduce(self, summaries):
+        self.reduced.append(summaries)
+        return ' + '.join(summaries)
+
+
+@override_settings(
+    SUMMARIZER_LONG_CONVERSATION={
+        **settings.SUMMARIZER_LONG_CONVERSATION,
+        'THRESHOLD_TOKENS': 30, 'CHUNK_TOKENS': 20
+    }
+)
+class MapReduceSummarizeTestCase(SimpleTestCase):
+    def get_turns(self, count):
+        # Every turn is an estimated 8 tokens, two fit in a chunk.
+        return [{'doctor': f'Question {index:04}'} for index in range(count)]
+
+    def test_split_conversation(self):
+        turns = self.get_turns(5)
+
+        self.assertEqual(
+            split_conversation(turns, 20),
+            [turns[0:2], turns[2:4], turns[4:5]]
+        )
+
+    def test_split_large_turn(self):
+        turns = self.get_turns(2)
+        turns.insert(1, {'patient': 'A very long answer. ' * 10})
+
+        self.assertEqual(
+            split_conversation(turns, 20), [[turn] for turn in turns]
+        )
+
+    def test_split_keeps_container(self):
+        self.assertEqual(
+            split_conversation({'doctor': 'Q' * 60, 'patient': 'A' * 60}, 20),
+            [{'doctor': 'Q' * 60}, {'patient': 'A' * 60}]
+        )
+        self.assertEqual(
+            split_conversation('line one\nline two\n', 3),
+            ['line one\n', 'line two\n']
+        )
+
+    def test_map_reduce(self):
+        backend = FakeSummarizerBackend()
+        turns = self.get_turns(5)
+        self.assertTrue(is_long_conversation(turns))
+
+        summary = map_reduce_summarize(backend, turns)
+
+        self.assertEqual(
+            summary,
+            'Question 0000|Question 0001 + Question 0002|Question 0003'
+            ' + Question 0004'
+        )
+        # Chunks are summarized concurrently, but reduced in order.
+        self.assertCountEqual(
+            backend.chunks, [turns[0:2], turns[2:4], turns[4:5]]
+        )
+        self.assertEqual(len(backend.reduced), 1)
+
+    def test_single_chunk(self):
+        backend = FakeSummarizerBackend()
+        turns = self.get_turns(2)
+
+        self.assertEqual(
+            map_reduce_summarize(backend, turns),
+            'Question 0000|Question 0001'
+        )
+        self.assertEqual(backend.chunks, [turns])
+        self.assertEqual(backend.reduced, [])
+
+
+class ExtractiveSummarizerBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        self.backend = ExtractiveSummarizerBackend()
+
+    def test_extract(self):
+        conversation = [
+            {'doctor': 'Hello. What brings you here?'},
+            {'patient': 'I have a headache. And a fever since Monday!'},
+            {'doctor': 'Take 500 mg of paracetamol for the pain.'},
+            {'doctor': "Let's do a blood count. And an X-ray of the chest."},
+            {'patient': 'I have a headache.'},
+            {'speaker': 'patient', 'text': 'My back hurts\nsometimes'}
+        ]
+
+        problems, tests = self.backend.extract(conversation)
+
+        self.assertEqual(problems, [
+            'I have a headache.', 'And a fever since Monday!',
+            'My back hurts'
+        ])
+        self.assertEqual(tests, [
+            "Let's do a blood count.", 'And an X-ray of the chest.'
+        ])
+
+    def test_extract_max_items(self):
+        conversation = [
+            {'patient': f'Pain number {index}.'}
+            for index in range(ExtractiveSummarizerBackend.max_items + 2)
+        ]
+
+        problems, tests = self.backend.extract(conversation)
+
+        self.assertEqual(len(problems), ExtractiveSummarizerBackend.max_items)
+        self.assertEqual(tests, [])
+
+    def test_summarize(self):
+        summary = self.backend.summarize(
+            {'patient': 'Pain when x < 3 & "y".'}
+        )
+
+        self.assertEqual(
+            summary,
+            "<h3>Patient's Problems</h3>"
+            '<ul><li>Pain when x &lt; 3 &amp; &quot;y&quot;.</li></ul>'
+            '<h3>Suggested Tests</h3><ul><li>None mentioned.</li></ul>'
+        )
+
+    def test_reduce(self):
+        summaries = [
+            self.backend.summarize([
+                {'patient': 'A cough & a fever.'},
+                {'doctor': 'Do a CT scan.'}
+            ]),
+            self.backend.summarize([{'patient': 'A cough & a fever.'}]),
+            self.backend.summarize([{'patient': 'Some nausea.'}])
+        ]
+
+        self.assertEqual(
+            self.backend.reduce(summaries),
+            "<h3>Patient's Problems</h3><ul>"
+            '<li>A cough &amp; a fever.</li><li>Some nausea.</li></ul>'
+            '<h3>Suggested Tests</h3><ul><li>Do a CT scan.</li></ul>'
+        )
+
+    def test_stream(self):
+        conversation = [{'patient': 'A rash.'}, {'doctor': 'A biopsy.'}]
+
+        chunks = list(self.backend.stream(conversation))
+
+        self.assertEqual(
+            ''.join(chunks), self.backend.summarize(conversation)
+        )
+        self.assertTrue(all(chunk.endswith('</li>') for chunk in chunks[:-1]))
+
+
+class UnavailableSummarizerBackend(BaseSummarizerBackend):
+    name = 'unavailable'
+
+    def summarize(self, conversation):
+        raise ServiceUnavailable()
+
+    def stream(self, conversation):
+        raise ServiceUnavailable()
+
+
+@override_settings(
+    SUMMARIZER_BACKEND='text_summarizer.tests.UnavailableSummarizerBackend',
+    SUMMARIZER_FALLBACK_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    )
+)
+class FallbackBackendTestCase(TestCase):
+    conversation = [
+        {'patient': 'I have a sore throat.'},
+        {'doctor': 'We will take a throat culture.'}
+    ]
+
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        summary_cache.memory.clear()
+        self.addCleanup(summary_cache.memory.clear)
+        self.expected = ExtractiveSummarizerBackend().summarize(
+            self.conversation
+        )
+
+    def test_summarize_conversation(self):
+        self.assertEqual(
+            summarize_conversation(self.conversation), self.expected
+        )
+        # Cached as a summary of the fallback backend only.
+        fallback = backends.get_fallback_backend()
+        self.assertEqual(
+            summary_cache.get(get_cache_key(self.conversation, fallback)),
+            self.expected
+        )
+        self.assertIsNone(get_cached_summary(self.conversation))
+
+    def test_update_summary(self):
+        summary = ExtractiveSummarizerBackend().summarize(
+            [{'patient': 'My knee hurts.'}]
+        )
+
+        self.assertEqual(
+            update_summary(summary, self.conversation),
+            "<h3>Patient's Problems</h3><ul><li>My knee hurts.</li>"
+            '<li>I have a sore throat.</li></ul>'
+            '<h3>Suggested Tests</h3>'
+            '<ul><li>We will take a throat culture.</li></ul>'
+        )
+
+    def test_open_summary_stream(self):
+        backend, chunks = open_summary_stream(self.conversation)
+
+        self.assertIsInstance(backend, ExtractiveSummarizerBackend)
+        self.assertEqual(list(chunks), [self.expected])
+
+    @override_settings(SUMMARIZER_FALLBACK_BACKEND=None)
+    def test_no_fallback(self):
+        with self.assertRaises(ServiceUnavailable):
+            summarize_conversation(self.conversation)
+        with self.assertRaises(ServiceUnavailable):
+            update_summary('', self.conversation)
+        with self.assertRaises(ServiceUnavailable):
+            open_summary_stream(self.conversation)
+
+
+@override_settings(
+    SUMMARIZER_BACKEND='text_summarizer.tests.FakeSummarizerBackend',
+    SUMMARIZER_FALLBACK_BACKEND=None
+)
+class AppendSummarizeTestCase(TestCase):
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        self.summary = SummarizeRequest.objects.create(
+            conversation=[{'doctor': 'Any pain?'}],
+            summarize='Pain',
+            patient=Patient.objects.create(name='Patient')
+        )
+
+    def append(self, conversation):
+        return self.client.post(
+            reverse(
+                'text_summarizer:append_summarize_view',
+                args=[self.summary.id]
+            ),
+            {'conversation': conversation},
+            content_type='application/json'
+        )
+
+    def test_append(self):
+        response = self.append([{'doctor': 'Book an MRI.'}])
+
+        self.assertEqual(response.status_code, 200)
+        # Only the new turns are summarized, then merged into the summary.
+        backend = backends.get_backend()
+        self.assertEqual(backend.chunks, [[{'doctor': 'Book an MRI.'}]])
+        self.assertEqual(backend.reduced, [['Pain', 'Book an MRI.']])
+        self.summary.refresh_from_db()
+        self.assertEqual(
+            self.summary.conversation,
+            [{'doctor': 'Any pain?'}, {'doctor': 'Book an MRI.'}]
+        )
+        self.assertEqual(self.summary.summarize, 'Pain + Book an MRI.')
+
+    def test_unfinished_summary(self):
+        self.summary.status = SummarizeRequest.Status.PENDING
+        self.summary.save()
+
+        response = self.append([{'doctor': 'Book an MRI.'}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(backends.get_backend().chunks, [])
+
+    def test_concurrent_append(self):
+        def update_summary(summary, new_turns):
+            # Another request extends the conversation during the LLM call.
+            SummarizeRequest.objects.filter(id=self.summary.id).update(
+                summarize='Pain, X-ray', updated_at=timezone.now()
+            )
+            return 'Pain, MRI'
+
+        with mock.patch(
+                'text_summarizer.serializers.update_summary', update_summary
+        ):
+            response = self.append([{'doctor': 'Book an MRI.'}])
+
+        self.assertEqual(response.status_code, 409)
+        self.summary.refresh_from_db()
+        self.assertEqual(self.summary.summarize, 'Pain, X-ray')
+
+
+@override_settings(
+    SUMMARIZER_BACKEND=(
+        'text_summarizer.backends.local.ExtractiveSummarizerBackend'
+    ),
+    SUMMARY_CACHE={**settings.SUMMARY_CACHE, 'ENABLED': False},
+    SUMMARIZE_ASYNC=False
+)
+class AsyncSummarizeViewTestCase(TestCase):
+    def setUp(self):
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        self.url = reverse('text_summarizer:list_create_summarize_view')
+        self.patient = Patient.objects.create(name='Patient')
+        self.calls = []
+
+    async def asummarize(self, conversation):
+        self.calls.append(conversation)
+        # Lets the concurrent requests reach the backend meanwhile.
+        await asyncio.sleep(0.05)
+        return '<ul><li>MRI</li></ul>'
+
+    def post(self, conversation, patient=None):
+        return self.async_client.post(
+            self.url,
+            {
+                'conversation': conversation,
+                'patient': patient or self.patient.id
+            },
+            content_type='application/json'
+        )
+
+    async def test_create(self):
+        with mock.patch.object(
+                import_string(settings.SUMMARIZER_BACKEND), 'asummarize',
+                self.asummarize
+        ):
+            response = await self.post([{'doctor': 'Book an MRI.'}])
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['summarize'], '<ul><li>MRI</li></ul>')
+        summary = await SummarizeRequest.objects.aget(id=data['id'])
+        self.assertEqual(summary.patient_id, self.patient.id)
+        self.assertEqual(self.calls, [[{'doctor': 'Book an MRI.'}]])
+
+    async def test_concurrent_creates(self):
+        with mock.patch.object(
+                import_string(settings.SUMMARIZER_BACKEND), 'asummarize',
+                self.asummarize
+        ):
+            responses = await asyncio.gather(
+                *(self.post([{'doctor': 'Book an MRI.'}]) for _ in range(3))
+            )
+
+        self.assertEqual(
+            [response.status_code for response in responses], [201] * 3
+        )
+        # The requests waited on the event loop for a single backend call.
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(await SummarizeRequest.objects.acount(), 3)
+
+    async def test_invalid_patient(self):
+        response = await self.post([{'doctor': 'Book an MRI.'}], patient=-1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.calls, [])
+        self.assertFalse(await SummarizeRequest.objects.aexists())
+
+    async def test_retrieve_not_found(self):
+        response = await self.async_client.get(
+            reverse('text_summarizer:retrieve_summarize_job_view', args=[0])
+        )
+
+        self.assertEqual(response.status_code, 404)
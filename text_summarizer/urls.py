@@ -10,9 +10,44 @@ urlpatterns = [
         views.ListCreateSummarizeAPIView.as_view(),
         name='list_create_summarize_view'
     ),
+    path(
+        'summarizes/export/',
+        views.ExportSummarizeAPIView.as_view(),
+        name='export_summarize_view'
+    ),
+    path(
+        'summarizes/search/',
+        views.SearchSummarizeAPIView.as_view(),
+        name='search_summarize_view'
+    ),
     path(
         'summarizes/<int:patient_id>/',
         views.ListPatientSummarizeAPIView.as_view(),
         name='list_patient_summarize_view'
+    ),
+    path(
+        'summarizes/<int:summary_id>/append/',
+        views.AppendSummarizeAPIView.as_view(),
+        name='append_summarize_view'
+    ),
+    path(
+        'summarizes/batch/',
+        views.BatchCreateSummarizeAPIView.as_view(),
+        name='batch_create_summarize_view'
+    ),
+    path(
+        'summarizes/stream/',
+        views.StreamSummarizeAPIView.as_view(),
+        name='stream_summarize_view'
+    ),
+    path(
+        'summarizes/jobs/<int:job_id>/',
+        views.RetrieveSummarizeJobAPIView.as_view(),
+        name='retrieve_summarize_job_view'
+    ),
+    path(
+        'summarizes/stats/',
+        views.SummarizerStatsAPIView.as_view(),
+        name='summarizer_stats_view'
     )
 ]
@@ -1,34 +1,333 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from rest_framework import exceptions, status
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
 from healthmateai.util.generic_views import (
-    CreateAPIView, ListCreateAPIView, ListAPIView
+    AsyncBaseAPIView, AsyncListAPIView, AsyncListCreateAPIView,
+    AsyncRetrieveAPIView, BaseAPIView, CreateAPIView
+)
+from healthmateai.util.mixins import UpdateModelMixin
+from healthmateai.util.renderers import EventStreamRenderer
+from healthmateai.util.response_cache import bump_version
+from patient.models import Patient
+from text_summarizer.backends import get_backend, get_fallback_backend
+from text_summarizer.batch import summarize_many
+from text_summarizer.cache import request_bypasses_cache, summary_cache
+from text_summarizer.export import (
+    EXPORT_FORMATS, aiter_export, get_export_queryset, iter_export
 )
 from text_summarizer.models import SummarizeRequest
+from text_summarizer.search import index_summaries, search_summaries
 from text_summarizer.serializers import (
-    CreateTextSummarizerSerializer, TextSummarizerSerializer,
-    PatientTextSummarizeSerializer
+    AppendTextSummarizerSerializer, CreateTextSummarizerSerializer,
+    TextSummarizerSerializer,
+    PatientTextSummarizeSerializer, CreateSummarizeJobSerializer,
+    SummarizeJobSerializer, SummarizeBatchItemSerializer,
+    SummarizeExportSerializer, SummarizeSearchResultSerializer,
+    SummarizeSearchSerializer
+)
+from text_summarizer.streaming import summary_event_stream
+from text_summarizer.summarizer import (
+    check_upstream_available, summary_flight
 )
 
+# Both summary lists share one ordering, backed by the indexes of
+# `SummarizeRequest`. `id` breaks ties between equal `created_at`, as the
+# cursor pagination needs a unique ordering.
+SUMMARY_ORDERING = ('-created_at', '-id')
+
 
-class ListCreateSummarizeAPIView(ListCreateAPIView):
+class ListCreateSummarizeAPIView(AsyncListCreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = TextSummarizerSerializer
+    list_select_related = ('patient',)
+    ordering = SUMMARY_ORDERING
     serializer_classes = {
         'POST': {
                 "serializer_class": CreateTextSummarizerSerializer,
                 "return_serializer_class": TextSummarizerSerializer,
         }
     }
+    # Used for POST instead of `serializer_classes` when
+    # `settings.SUMMARIZE_ASYNC` is enabled.
+    job_serializer_classes = {
+        'POST': {
+                "serializer_class": CreateSummarizeJobSerializer,
+                "return_serializer_class": SummarizeJobSerializer,
+                "status_code": status.HTTP_202_ACCEPTED
+        }
+    }
+
+    def get_serializer_class(self):
+        if settings.SUMMARIZE_ASYNC and self.request.method == 'POST':
+            return self.job_serializer_classes['POST']
+
+        return super().get_serializer_class()
 
     def get_queryset(self):
-        return SummarizeRequest.objects.all().order_by('-created_at')
+        return SummarizeRequest.objects.order_by(*self.ordering)
 
 
-class ListPatientSummarizeAPIView(ListAPIView):
+class ListPatientSummarizeAPIView(AsyncListAPIView):
     permission_classes = (AllowAny,)
-    serializer_classes = PatientTextSummarizeSerializer
+    serializer_class = PatientTextSummarizeSerializer
+    ordering = SUMMARY_ORDERING
 
     def get_queryset(self):
         return SummarizeRequest.objects.filter(
             patient__id=self.kwargs.get('patient_id')
-        ).order_by('-id')
+        ).order_by(*self.ordering)
+
+
+class SearchSummarizeAPIView(AsyncListAPIView):
+    """
+    Full-text search over the summaries and conversations, eg.
+    `?q=mri suggested`, optionally of one `patient`. Results are ordered by
+    `rank`, except with `?pagination=cursor` which pages through them by
+    `SUMMARY_ORDERING`. See `text_summarizer.search` for the query syntax.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = SummarizeSearchResultSerializer
+    list_select_related = ('patient',)
+    ordering = SUMMARY_ORDERING
+
+    def get_queryset(self):
+        serializer = SummarizeSearchSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        queryset = SummarizeRequest.objects.all()
+        if 'patient' in params:
+            queryset = queryset.filter(patient_id=params['patient'])
+
+        return search_summaries(queryset, params['q']).order_by(
+            '-rank', *self.ordering
+        )
+
+
+class AppendSummarizeAPIView(UpdateModelMixin, BaseAPIView):
+    """
+    Append new turns to the conversation of a finished summary and update the
+    summary in place.
+    """
+    permission_classes = (AllowAny,)
+    serializer_classes = {
+        'POST': {
+                "serializer_class": AppendTextSummarizerSerializer,
+                "return_serializer_class": TextSummarizerSerializer,
+        }
+    }
+
+    def get_object(self):
+        try:
+            return SummarizeRequest.objects.select_related('patient').get(
+                id=self.kwargs.get('summary_id')
+            )
+        except SummarizeRequest.DoesNotExist:
+            raise exceptions.NotFound()
+
+    def post(self, request, *args, **kwargs):
+        return self.update(request, *args, **kwargs)
+
+
+class BatchCreateSummarizeAPIView(CreateAPIView):
+    """
+    Summarize a list of `{"conversation": ..., "patient": <id>}` items. Every
+    item is reported on its own, valid items are created even if others fail.
+    """
+    permission_classes = (AllowAny,)
+    serializer_classes = {
+        'POST': {
+                "serializer_class": SummarizeBatchItemSerializer,
+                "return_serializer_class": TextSummarizerSerializer,
+        }
+    }
+
+    def validate_items(self, data):
+        """
+        Return `(items, errors)` dicts keyed by the item index. The patients
+        of the whole batch are fetched with a single query.
+        """
+        if not isinstance(data, list):
+            raise exceptions.ValidationError('Expected a list of items.')
+        max_size = settings.SUMMARIZE_BATCH_MAX_SIZE
+        if len(data) > max_size:
+            raise exceptions.ValidationError(
+                f'A batch can hold at most {max_size} items.'
+            )
+
+        items, errors = {}, {}
+        for index, item in enumerate(data):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                items[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+
+        patients = Patient.objects.in_bulk(
+            {item['patient'] for item in items.values()}
+        )
+        for index, item in list(items.items()):
+            try:
+                item['patient'] = patients[item['patient']]
+            except KeyError:
+                errors[index] = {'patient': ['Invalid patient.']}
+                del items[index]
+
+        return items, errors
+
+    def create(self, request, *args, **kwargs):
+        items, errors = self.validate_items(request.data)
+
+        summaries = summarize_many(
+            [item['conversation'] for item in items.values()],
+            use_cache=not request_bypasses_cache(request)
+        )
+        instances = {}
+        for (index, item), summary in zip(items.items(), summaries):
+            if isinstance(summary, Exception):
+                errors[index] = {
+                    'detail': getattr(summary, 'detail', None) or str(summary)
+                }
+            else:
+                instances[index] = SummarizeRequest(summarize=summary, **item)
+
+        with transaction.atomic():
+            SummarizeRequest.objects.bulk_create(
+                instances.values(), batch_size=500
+            )
+            index_summaries(instances.values())
+            bump_version(SummarizeRequest)
+
+        return_serializer = self.get_return_serializer()
+        results = [
+            {
+                'index': index,
+                'status': 'success',
+                'data': return_serializer(
+                    instances[index], context=self.get_serializer_context()
+                ).data
+            } if index in instances else {
+                'index': index,
+                'status': 'error',
+                'errors': errors[index]
+            }
+            for index in range(len(request.data))
+        ]
+
+        return Response(
+            {
+                'status': 'success',
+                'data': {
+                    'created': len(instances),
+                    'failed': len(errors),
+                    'results': results
+                }
+            },
+            status=(
+                status.HTTP_201_CREATED if instances
+                else status.HTTP_400_BAD_REQUEST
+            )
+        )
+
+
+class StreamSummarizeAPIView(CreateAPIView):
+    """
+    Same input as POST /summarize/summarizes/, but the summary is streamed as
+    Server-Sent Events (`token` events, then a `done` event with the stored
+    summary). Tokens are only forwarded as they arrive when the app is served
+    through ASGI.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = CreateTextSummarizerSerializer
+    renderer_classes = (
+        *api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer
+    )
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        check_upstream_available()
+
+        response = StreamingHttpResponse(
+            summary_event_stream(
+                serializer.validated_data, use_cache=serializer.use_cache
+            ),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+
+class ExportSummarizeAPIView(AsyncBaseAPIView):
+    """
+    Stream all summaries, of a `patient` and/or created in the
+    `[created_after, created_before)` range, as NDJSON or CSV
+    (`export_format`). Unlike the list endpoints there is no pagination and
+    no count, rows are streamed as they are read. Served through WSGI (eg.
+    `runserver`) the rows are read by a sync iterator, Django would collect
+    an async one in memory before sending it.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = SummarizeExportSerializer
+
+    async def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        export_format = params.pop('export_format')
+
+        queryset = get_export_queryset(**params)
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_export(queryset, export_format)
+        else:
+            content = iter_export(queryset, export_format)
+
+        response = StreamingHttpResponse(
+            content, content_type=EXPORT_FORMATS[export_format].content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="summaries.'
+            f'{EXPORT_FORMATS[export_format].extension}"'
+        )
+
+        return response
+
+
+class RetrieveSummarizeJobAPIView(AsyncRetrieveAPIView):
+    permission_classes = (AllowAny,)
+    serializer_class = SummarizeJobSerializer
+
+    async def aget_object(self):
+        try:
+            return await SummarizeRequest.objects.select_related(
+                'patient'
+            ).aget(id=self.kwargs.get('job_id'))
+        except SummarizeRequest.DoesNotExist:
+            raise exceptions.NotFound()
+
+
+class SummarizerStatsAPIView(APIView):
+    """
+    Counters of the summarization pipeline for the current process.
+    """
+    permission_classes = (AllowAny,)
+
+    def get_stats(self):
+        return {
+            'cache': summary_cache.stats(),
+            'single_flight': summary_flight.stats(),
+            'backend': get_backend().stats(),
+            'fallback_backend': getattr(get_fallback_backend(), 'name', None)
+        }
+
+    def get(self, request, *args, **kwargs):
+        return Response({'status': 'success', 'data': self.get_stats()})